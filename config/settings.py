@@ -20,6 +20,23 @@ load_dotenv()
 
 ACCOUNTING_CURRENCY = os.environ.get("ACCOUNTING_CURRENCY")
 PRIMARY_FXRATE_CURRENCY = os.environ.get("PRIMARY_FXRATE_CURRENCY")
+# seconds a process keeps its memoized FX rate matrix. FX rate changes bump a version key in the default cache,
+# which is per process unless CACHES configures a shared one, so other processes may use old rates this long
+FX_RATE_MATRIX_MAX_AGE = int(os.environ.get("FX_RATE_MATRIX_MAX_AGE", 300))
+# same for the memoized chart of accounts, whose version key account changes bump
+CHART_OF_ACCOUNTS_MAX_AGE = int(os.environ.get("CHART_OF_ACCOUNTS_MAX_AGE", 300))
+# seconds a process reuses the version keys of memoized values before reading them from the cache again,
+# with a shared cache this is how long other processes lag behind a bump
+MEMO_VERSION_CHECK_INTERVAL = int(os.environ.get("MEMO_VERSION_CHECK_INTERVAL", 5))
+# seconds stock stays reserved for a submitted cart before other checkouts can take it
+STOCK_RESERVATION_TTL_SECONDS = int(os.environ.get("STOCK_RESERVATION_TTL_SECONDS", 900))
+# times a swap of an active price, FX rate, weight cost or profit rate is retried after a concurrent swap won
+ACTIVE_RECORD_SWAP_RETRIES = int(os.environ.get("ACTIVE_RECORD_SWAP_RETRIES", 3))
+# per request query count, SQL, serialization and render time as Server-Timing headers and in the
+# /admin/perf/ report, which each process keeps for itself
+PERF_INSTRUMENTATION = os.environ.get("PERF_INSTRUMENTATION", "0") == "1"
+# seconds a running import job may go without saving progress before it counts as crashed and is failed
+IMPORT_JOB_STALE_AFTER_SECONDS = int(os.environ.get("IMPORT_JOB_STALE_AFTER_SECONDS", 1800))
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -158,6 +175,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so that it times the other middleware too, only installed when PERF_INSTRUMENTATION is on
+    "ecommerce.perf.RequestPerfMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
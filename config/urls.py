@@ -28,6 +28,7 @@ from rest_framework_simplejwt.views import (
     TokenVerifyView,
 )
 
+from ecommerce.perf import perf_report_view
 from ecommerce.viewsets.user.viewsets import (
     CustomLoginView,
     CustomRegisterView,
@@ -38,6 +39,8 @@ from ecommerce.viewsets.user.viewsets import (
 
 urlpatterns = (
         [path("", TemplateView.as_view(template_name="index.html")),
+         # before the admin site, which would take any admin/ path
+         path("admin/perf/", perf_report_view, name="perf-report"),
          path("admin/", admin.site.urls),
          path("ecommerce/", include("ecommerce.urls")),
          path("api/", include("api.urls")),
@@ -25,6 +25,7 @@ from .models import (
     ProductWeight,
     Role,
     Staff,
+    StockReservation,
     Tag,
     Wishlist,
 )
@@ -81,6 +82,13 @@ class InventoryAdmin(admin.ModelAdmin):
     search_fields = ["product__name"]
 
 
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ["product", "customer", "quantity", "status", "expires_at", "order"]
+    list_filter = ["status"]
+    search_fields = ["product__name", "customer__user__username"]
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ["id", "customer", "status", "total_amount", "created_at"]
@@ -166,6 +174,10 @@ class JournalEntryAdmin(admin.ModelAdmin):
     search_fields = ("description", "reference")
     readonly_fields = ("is_balanced",)
 
+    def get_queryset(self, request):
+        # is_balanced sums the prefetched lines instead of querying them for every row
+        return super().get_queryset(request).prefetch_related("lines")
+
 
 @admin.register(JournalEntryLine)
 class JournalEntryLineAdmin(admin.ModelAdmin):
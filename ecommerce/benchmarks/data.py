@@ -0,0 +1,115 @@
+import io
+import itertools
+import logging
+from decimal import Decimal
+
+import pandas as pd
+from django.conf import settings
+from django.contrib.auth.models import User
+
+from ecommerce.models import Account, Currency, Customer, Product, ProductWeight
+from ecommerce.profit_rate import create_update_profit_rate
+from ecommerce.viewsets.accounting.chart import (
+    ACCOUNTS_PAYABLE_ACCOUNT_CODE,
+    CASH_ACCOUNT_CODE,
+    COGS_ACCOUNT_CODE,
+    INVENTORY_ACCOUNT_CODE,
+    SALES_ACCOUNT_CODE,
+)
+from ecommerce.viewsets.fx_rate_feed import swap_active_fx_rates
+from ecommerce.viewsets.product.bulk_import import bulk_import_products_from_dataframe
+from ecommerce.viewsets.purchase.bulk_import import PurchaseCSVIngestor
+from ecommerce.viewsets.purchase_order_viewsets import (
+    create_purchase_and_order_from_csv_row,
+)
+from ecommerce.viewsets.utils import get_fx_rate_matrix
+from ecommerce.weight_cost import create_update_weight_cost
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_FILES_DIR = settings.BASE_DIR / "experiments" / "sample_files"
+BENCHMARK_ADMIN_USERNAME = "benchmark-admin"
+# amount of each currency per JPY
+BENCHMARK_FX_RATES = {"JPY": Decimal("1"), "USD": Decimal("0.0067"), "UZS": Decimal("85")}
+BENCHMARK_ACCOUNTS = [
+    (CASH_ACCOUNT_CODE, "Cash", "asset"),
+    (INVENTORY_ACCOUNT_CODE, "Inventory", "asset"),
+    (ACCOUNTS_PAYABLE_ACCOUNT_CODE, "Accounts Payable", "liability"),
+    (SALES_ACCOUNT_CODE, "Sales", "income"),
+    (COGS_ACCOUNT_CODE, "Cost of Goods Sold", "expense"),
+]
+
+
+def _sample_csv(file_name: str) -> pd.DataFrame:
+    return pd.read_csv(SAMPLE_FILES_DIR / file_name, dtype=str)
+
+
+def _cycle_rows(df: pd.DataFrame, count: int) -> pd.DataFrame:
+    """
+    :return: count rows of df, repeated from the start as often as needed
+    """
+    return df.iloc[[i % len(df) for i in range(count)]].reset_index(drop=True)
+
+
+def generate_benchmark_data(products: int = 200, batches: int = 3, orders: int = 100) -> dict:
+    """
+    Fill an empty database through the import paths the application itself uses.
+    Products, purchases and orders repeat the rows of the sample CSVs in experiments/sample_files,
+    with a number appended to the product names to keep them apart.
+    :param products: number of products
+    :param batches: purchases per product on top of the stock of the product import
+    :param orders: orders, each with its own purchase, spread over the products
+    :return: admin user and counts of the generated records
+    """
+    if settings.ACCOUNTING_CURRENCY not in BENCHMARK_FX_RATES:
+        raise ValueError(f"ACCOUNTING_CURRENCY has to be one of {', '.join(BENCHMARK_FX_RATES)}")
+    for code in BENCHMARK_FX_RATES:
+        Currency.objects.get_or_create(code=code, defaults={"name": code})
+    swap_active_fx_rates("JPY", BENCHMARK_FX_RATES, source="BENCHMARK")
+    for code, name, account_type in BENCHMARK_ACCOUNTS:
+        Account.objects.get_or_create(code=code, defaults={"name": name, "account_type": account_type})
+    admin, _ = User.objects.get_or_create(
+        username=BENCHMARK_ADMIN_USERNAME, defaults={"is_staff": True, "is_superuser": True}
+    )
+    # the admin also places the benchmarked customer orders
+    Customer.objects.get_or_create(user=admin)
+    create_update_weight_cost(10.0, Currency.objects.get(code="USD").id)
+    create_update_profit_rate(0.3)
+
+    # --- Products ---
+    product_df = _cycle_rows(_sample_csv("products_00.csv"), products)
+    product_df["product_name"] = [f"{name} {i}" for i, name in enumerate(product_df["product_name"])]
+    product_df["sku"] = [f"BENCHMARK-{i}" for i in range(products)]
+    bulk_import_products_from_dataframe(product_df, user=admin)
+    product_ids = dict(
+        Product.objects.filter(name__in=list(product_df["product_name"])).values_list("name", "id")
+    )
+    # every other product has a weight, the others are priced with the default weight
+    ProductWeight.objects.bulk_create(
+        [ProductWeight(product_id=product_ids[name], weight=0.5) for name in product_df["product_name"][::2]]
+    )
+
+    # --- Purchases ---
+    purchase_df = _cycle_rows(_sample_csv("purchases_00.csv"), products * batches)
+    purchase_df["product_name"] = list(
+        itertools.islice(itertools.cycle(product_df["product_name"]), len(purchase_df))
+    )
+    PurchaseCSVIngestor().ingest(io.StringIO(purchase_df.to_csv(index=False)))
+
+    # --- Orders ---
+    order_df = _cycle_rows(_sample_csv("purchase_orders.csv"), orders)
+    for customer_name in order_df["customer_name"].unique():
+        last_name, first_name = customer_name.rsplit(" ", 1)
+        user, _ = User.objects.get_or_create(
+            username=customer_name.lower().replace(" ", "."),
+            defaults={"first_name": first_name, "last_name": last_name},
+        )
+        Customer.objects.get_or_create(user=user)
+    order_df["product_name"] = list(itertools.islice(itertools.cycle(product_df["product_name"]), orders))
+    fx_rates = get_fx_rate_matrix().as_dict()
+    for _, row in order_df.iterrows():
+        create_purchase_and_order_from_csv_row(row, order_df.columns, fx_rates)
+
+    counts = {"products": len(product_ids), "purchases": len(purchase_df) + orders, "orders": orders}
+    logger.info(f"Generated benchmark data : {counts}")
+    return {"admin": admin, **counts}
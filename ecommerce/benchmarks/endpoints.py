@@ -0,0 +1,235 @@
+import datetime
+import json
+import logging
+import statistics
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+
+from ecommerce.models import Inventory
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_URLCONF = "ecommerce.urls"
+QUERY_COUNT_BASELINE_PATH = Path(__file__).resolve().parent / "query_counts.json"
+
+
+def _create_order_payload() -> dict | None:
+    product_id = Inventory.objects.filter(stock__gt=0).values_list("product_id", flat=True).first()
+    if product_id is None:
+        return None
+    return {
+        "items": [{"product_id": product_id, "quantity": 1}],
+        "base_currency": settings.ACCOUNTING_CURRENCY,
+    }
+
+
+# routes without GET are only benchmarked when they have a payload here
+POST_PAYLOADS = {
+    "create_order": _create_order_payload,
+    "reprice-products": lambda: {"dry_run": True},
+}
+
+
+@dataclass
+class BenchmarkRoute:
+    name: str
+    method: str
+    url: str
+    data: dict | None = None
+
+    @property
+    def key(self) -> str:
+        return f"{self.method.upper()} {self.name}"
+
+
+@dataclass
+class RouteResult:
+    route: BenchmarkRoute
+    status_code: int
+    queries: int
+    latencies: list[float] = field(default_factory=list)
+    peak_memory: int = 0
+
+    def percentile(self, n: int) -> float:
+        if len(self.latencies) == 1:
+            return self.latencies[0]
+        return statistics.quantiles(self.latencies, n=100, method="inclusive")[n - 1]
+
+    def as_dict(self) -> dict:
+        return {
+            "route": self.route.key,
+            "url": self.route.url,
+            "status": self.status_code,
+            "queries": self.queries,
+            "p50_ms": round(self.percentile(50) * 1000, 2),
+            "p95_ms": round(self.percentile(95) * 1000, 2),
+            "peak_memory_kib": round(self.peak_memory / 1024, 1),
+        }
+
+
+def _iter_patterns(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _iter_patterns(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern):
+            yield pattern
+
+
+def _view_model(callback):
+    view_class = getattr(callback, "cls", None) or getattr(callback, "view_class", None)
+    queryset = getattr(view_class, "queryset", None)
+    if queryset is not None:
+        return queryset.model
+    serializer_class = getattr(view_class, "serializer_class", None)
+    return getattr(getattr(serializer_class, "Meta", None), "model", None)
+
+
+def _route_kwargs(pattern: URLPattern) -> dict | None:
+    """
+    :return: URL kwargs filled from the database, None when they can't be filled
+    """
+    kwargs = {}
+    for name in pattern.pattern.regex.groupindex:
+        if name == "pk":
+            model = _view_model(pattern.callback)
+            pk = model.objects.order_by("pk").values_list("pk", flat=True).first() if model else None
+            if pk is None:
+                return None
+            kwargs[name] = pk
+        elif name.endswith("date"):
+            kwargs[name] = datetime.date.today().isoformat()
+        else:
+            return None
+    return kwargs
+
+
+def _route_methods(callback) -> list[str]:
+    actions = getattr(callback, "actions", None)
+    if actions is not None:
+        return [method for method in ("get", "post") if method in actions]
+    view_class = getattr(callback, "view_class", None)
+    return [method for method in ("get", "post") if view_class is not None and hasattr(view_class, method)]
+
+
+def collect_routes(urlconf: str = BENCHMARK_URLCONF) -> tuple[list[BenchmarkRoute], list[str]]:
+    """
+    Every GET route of the urlconf and the POST routes of POST_PAYLOADS, with their URL kwargs
+    filled from the database
+    :return: routes and descriptions of the routes that are skipped
+    """
+    routes, skipped = [], []
+    for pattern in _iter_patterns(get_resolver(urlconf).url_patterns):
+        if "format" in pattern.pattern.regex.groupindex:
+            continue  # format suffix variants of router routes
+        if not pattern.name:
+            skipped.append(f"{pattern.pattern} has no name")
+            continue
+        methods = [
+            method for method in _route_methods(pattern.callback) if method == "get" or pattern.name in POST_PAYLOADS
+        ]
+        if not methods:
+            skipped.append(f"{pattern.name} has no GET and no benchmark payload")
+            continue
+        kwargs = _route_kwargs(pattern)
+        if kwargs is None:
+            skipped.append(f"{pattern.name} has URL arguments that can't be filled from the database")
+            continue
+        url = reverse(pattern.name, kwargs=kwargs)
+        for method in methods:
+            data = POST_PAYLOADS[pattern.name]() if method == "post" else None
+            if method == "post" and data is None:
+                skipped.append(f"{pattern.name} has no data for its payload")
+                continue
+            routes.append(BenchmarkRoute(pattern.name, method, url, data))
+    return routes, skipped
+
+
+def measure_route(client: Client, route: BenchmarkRoute, repeat: int = 10) -> RouteResult:
+    """
+    Query count of a cold request, with the cache cleared, latencies of repeat warm requests
+    and peak memory allocated by one more request
+    """
+
+    def request():
+        if route.method == "get":
+            return client.get(route.url)
+        return client.post(route.url, route.data, content_type="application/json")
+
+    request()  # imports, memoized FX rates and chart of accounts
+    cache.clear()
+    with CaptureQueriesContext(connection) as queries:
+        response = request()
+    result = RouteResult(route, response.status_code, len(queries))
+    for _ in range(repeat):
+        started = time.perf_counter()
+        request()
+        result.latencies.append(time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        request()
+        result.peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result
+
+
+def run_endpoint_benchmark(user, repeat: int = 10) -> tuple[list[RouteResult], list[str]]:
+    """
+    :param user: user the requests are made as, staff to reach the admin routes
+    :param repeat: warm requests per route
+    :return: results of each route and the skipped routes
+    """
+    client = Client()
+    client.force_login(user)
+    routes, skipped = collect_routes()
+    results = []
+    for route in routes:
+        results.append(measure_route(client, route, repeat))
+        logger.debug(f"Benchmarked {route.key}")
+    return results, skipped
+
+
+def load_query_count_baseline(path: Path = QUERY_COUNT_BASELINE_PATH) -> dict:
+    """
+    :return: mapping of database vendor to the data sizes the baseline was recorded with
+        and the query counts by route key
+    """
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_query_count_baseline(results: list[RouteResult], sizes: dict, path: Path = QUERY_COUNT_BASELINE_PATH):
+    """
+    :param sizes: products, batches and orders of the generated data
+    """
+    baseline = load_query_count_baseline(path)
+    baseline[connection.vendor] = {
+        **sizes,
+        "queries": {result.route.key: result.queries for result in results},
+    }
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def query_count_regressions(results: list[RouteResult], baseline_queries: dict) -> list[str]:
+    """
+    :param baseline_queries: query counts of the current database vendor by route key
+    :return: descriptions of routes making more queries than their baseline
+    """
+    return [
+        f"{result.route.key} makes {result.queries} queries, baseline {baseline_queries[result.route.key]}"
+        for result in results
+        if result.route.key in baseline_queries and result.queries > baseline_queries[result.route.key]
+    ]
@@ -1,17 +1,14 @@
-from decimal import Decimal
 from django.db import models
-from django.conf import settings
 from django.utils import timezone
 from django.utils.dateparse import parse_date
 from rest_framework import serializers
-from rest_framework.response import Response
-from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
-from ecommerce.models import FXRate
 from ecommerce.models.audit_mixin import AuditMixin
 from ecommerce.models.product.models import Currency
 from ecommerce.serializers.product.serializers import CurrencySerializer
 from ecommerce.permissions import IsStaff
+from ecommerce.viewsets.accounting.totals import TotalInAccountingCurrencyView
+from ecommerce.viewsets.pagination import AdateCursorPagination
 
 
 class SpendingName(AuditMixin):
@@ -38,6 +35,10 @@ class Spending(AuditMixin):
     amount = models.FloatField()
     currency = models.ForeignKey(Currency, on_delete=models.SET_NULL, null=True)
 
+    class Meta:
+        # keyset pagination of spendings
+        indexes = [models.Index(fields=["adate", "id"])]
+
     def __str__(self):
         return (
             f"{self.spending_name.name}: {self.amount} {self.currency} on {self.adate}"
@@ -79,6 +80,7 @@ class SpendingNameViewSet(ModelViewSet):
 class SpendingViewSet(ModelViewSet):
     permission_classes = [IsStaff]
     serializer_class = SpendingSerializer
+    pagination_class = AdateCursorPagination
 
     def get_queryset(self):
         queryset = Spending.objects.all().select_related("spending_name", "currency").order_by("-adate")
@@ -95,41 +97,13 @@ class SpendingViewSet(ModelViewSet):
                 queryset=queryset.filter(adate__lte=end_date)
         return queryset
 
-class SpendingTotalInAccountingCurrencyView(APIView):
-    permission_classes = [IsStaff]
-
-    def get(self, request, *args, **kwargs):
-        start_date = parse_date(request.query_params.get("start_date"))
-        end_date = parse_date(request.query_params.get("end_date"))
-
-        queryset = Spending.objects.select_related("currency")
+class SpendingTotalInAccountingCurrencyView(TotalInAccountingCurrencyView):
+    amount = "amount"
 
+    def get_queryset(self, start_date, end_date):
+        spendings = Spending.objects.all()
         if start_date:
-            queryset = queryset.filter(adate__gte=start_date)
+            spendings = spendings.filter(adate__gte=start_date)
         if end_date:
-            queryset = queryset.filter(adate__lte=end_date)
-
-        fx_rates = FXRate.objects.filter(
-            end_date__isnull=True,
-            currency_to__code=settings.ACCOUNTING_CURRENCY
-        ).select_related("currency_from", "currency_to")
-
-        fx_map = {
-            (fx.currency_from.code, fx.currency_to.code): Decimal(fx.rate)
-            for fx in fx_rates
-        }
-
-        total = Decimal("0.00")
-        for s in queryset:
-            from_code = s.currency.code if s.currency else None
-            to_code = settings.ACCOUNTING_CURRENCY
-            rate = fx_map.get((from_code, to_code), Decimal("1.0") if from_code == to_code else None)
-
-            if rate is None:
-                continue  # skip if FX rate not available
-            total += Decimal(s.amount) * rate
-
-        return Response({
-            "amount": round(total, 2),
-            "currency": settings.ACCOUNTING_CURRENCY,
-        })
\ No newline at end of file
+            spendings = spendings.filter(adate__lte=end_date)
+        return spendings
@@ -0,0 +1,97 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from ecommerce.benchmarks.data import generate_benchmark_data
+from ecommerce.benchmarks.endpoints import (
+    load_query_count_baseline,
+    query_count_regressions,
+    run_endpoint_benchmark,
+    save_query_count_baseline,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates data in a fresh test database and records query count, p50/p95 latency and peak memory "
+        "of every ecommerce route. Fails when a route makes more queries than in ecommerce/benchmarks/query_counts.json. "
+        "Runs against the configured database, e.g. DB_HOST_TYPE=POSTGRES with POSTGRES_HOSTNAME=localhost "
+        "and the postgres service of docker-compose.yml"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=200)
+        parser.add_argument("--batches", type=int, default=3, help="Purchases per product")
+        parser.add_argument("--orders", type=int, default=100)
+        parser.add_argument("--repeat", type=int, default=10, help="Timed requests per route")
+        parser.add_argument("--json", help="Write the results to this file")
+        parser.add_argument(
+            "--update-baseline", action="store_true", help="Record the query counts as the new baseline"
+        )
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            try:
+                generated = generate_benchmark_data(options["products"], options["batches"], options["orders"])
+            except ValueError as e:
+                raise CommandError(str(e))
+            results, skipped = run_endpoint_benchmark(generated["admin"], options["repeat"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(
+            f"{len(results)} routes on {connection.vendor} with {generated['products']} products, "
+            f"{generated['purchases']} purchases and {generated['orders']} orders"
+        )
+        self.stdout.write(f"{'route':<55} {'status':>6} {'queries':>7} {'p50 ms':>8} {'p95 ms':>8} {'peak KiB':>9}")
+        for result in sorted(results, key=lambda r: r.route.key):
+            row = result.as_dict()
+            self.stdout.write(
+                f"{row['route']:<55} {row['status']:>6} {row['queries']:>7} "
+                f"{row['p50_ms']:>8} {row['p95_ms']:>8} {row['peak_memory_kib']:>9}"
+            )
+        for description in skipped:
+            self.stdout.write(f"Skipped {description}")
+        if options["json"]:
+            with open(options["json"], "w") as f:
+                json.dump(
+                    {
+                        "vendor": connection.vendor,
+                        "products": generated["products"],
+                        "purchases": generated["purchases"],
+                        "orders": generated["orders"],
+                        "results": [result.as_dict() for result in results],
+                    },
+                    f,
+                    indent=2,
+                )
+
+        sizes = {key: options[key] for key in ("products", "batches", "orders")}
+        if options["update_baseline"]:
+            save_query_count_baseline(results, sizes)
+            self.stdout.write(self.style.SUCCESS(f"Recorded the query count baseline of {connection.vendor}"))
+            return
+        failures = [
+            f"{result.route.key} responded with {result.status_code}" for result in results if result.status_code >= 500
+        ]
+        baseline = load_query_count_baseline().get(connection.vendor)
+        if baseline is None:
+            self.stdout.write(self.style.WARNING(f"No query count baseline for {connection.vendor}"))
+        elif any(baseline[key] != size for key, size in sizes.items()):
+            # query counts only stay comparable while N+1 queries exist when the data has the same size
+            self.stdout.write(
+                self.style.WARNING(
+                    f"The {connection.vendor} baseline was recorded with "
+                    f"{', '.join(f'{key}={baseline[key]}' for key in sizes)}, query counts aren't compared"
+                )
+            )
+        else:
+            failures += query_count_regressions(results, baseline["queries"])
+        if failures:
+            raise CommandError("\n".join(failures))
+        self.stdout.write(self.style.SUCCESS("Benchmarked without failures"))
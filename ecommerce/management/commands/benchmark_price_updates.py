@@ -0,0 +1,121 @@
+import statistics
+import threading
+import time
+import uuid
+from collections import Counter
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+from django.db.models import Count, Q
+
+from ecommerce.models import Currency, Product, ProductPrice
+from ecommerce.viewsets.active_records import swap_active_record
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks concurrent price updates of the same products and checks every product "
+        "still has exactly one active price. Creates its own inactive products and deletes them afterwards"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=5, help="Products whose prices are updated")
+        parser.add_argument("--threads", type=int, default=8, help="Threads updating prices at the same time")
+        parser.add_argument("--updates", type=int, default=50, help="Price updates per thread")
+        parser.add_argument(
+            "--retries",
+            type=int,
+            default=None,
+            help="Retries after a concurrent swap, ACTIVE_RECORD_SWAP_RETRIES by default. "
+                 "0 shows how often updates collided before swaps were retried",
+        )
+        parser.add_argument("--keep", action="store_true", help="Keep the benchmark products")
+
+    def handle(self, *args, **options):
+        currency = Currency.objects.filter(code=settings.ACCOUNTING_CURRENCY).first()
+        if currency is None:
+            raise CommandError(f"No currency with code {settings.ACCOUNTING_CURRENCY}")
+        run_id = uuid.uuid4().hex[:8]
+        products = Product.objects.bulk_create(
+            [
+                Product(name=f"Price benchmark {i}", sku=f"PRICE-BENCHMARK-{run_id}-{i}", is_active=False)
+                for i in range(options["products"])
+            ]
+        )
+        for product in products:
+            swap_active_record(
+                ProductPrice, {"product_id": product.id}, {"price": Decimal("100"), "currency": currency},
+                start_field="begin_date",
+            )
+
+        latencies, errors, successes = [], Counter(), Counter()
+        lock = threading.Lock()
+        barrier = threading.Barrier(options["threads"])
+
+        def update_prices(thread_index):
+            try:
+                barrier.wait()
+                for i in range(options["updates"]):
+                    # every thread updates the same product at the same time to make swaps collide
+                    product = products[i % len(products)]
+                    started = time.perf_counter()
+                    try:
+                        swap_active_record(
+                            ProductPrice,
+                            {"product_id": product.id},
+                            {"price": Decimal(100 + thread_index + i), "currency": currency},
+                            start_field="begin_date",
+                            retries=options["retries"],
+                        )
+                    except DatabaseError as e:
+                        with lock:
+                            errors[type(e).__name__] += 1
+                    else:
+                        with lock:
+                            successes[product.id] += 1
+                            latencies.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=update_prices, args=(i,)) for i in range(options["threads"])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        price_counts = {
+            row["product_id"]: row
+            for row in ProductPrice.objects.filter(product__in=products)
+            .values("product_id")
+            .annotate(total=Count("id"), active=Count("id", filter=Q(end_date__isnull=True)))
+        }
+        broken = [
+            product.id
+            for product in products
+            if price_counts[product.id]["active"] != 1
+            or price_counts[product.id]["total"] != successes[product.id] + 1
+        ]
+        if not options["keep"]:
+            Product.objects.filter(pk__in=[product.id for product in products]).delete()
+
+        attempted = options["threads"] * options["updates"]
+        succeeded = sum(successes.values())
+        self.stdout.write(
+            f"{succeeded}/{attempted} price updates in {elapsed:.2f}s ({succeeded / elapsed:.0f} per second) "
+            f"on {connection.vendor} with {options['threads']} threads and {len(products)} products"
+        )
+        if latencies:
+            percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+            self.stdout.write(
+                f"latency p50 {percentiles[49] * 1000:.1f}ms, p95 {percentiles[94] * 1000:.1f}ms, "
+                f"max {max(latencies) * 1000:.1f}ms"
+            )
+        for error, count in errors.items():
+            self.stdout.write(self.style.WARNING(f"{count} updates failed with {error}"))
+        if broken:
+            raise CommandError(f"Products {broken} don't have exactly one active price per successful update")
+        self.stdout.write(self.style.SUCCESS("Every product has exactly one active price"))
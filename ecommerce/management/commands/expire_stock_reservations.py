@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ecommerce.viewsets.inventory.reservations import expire_reservations
+
+
+class Command(BaseCommand):
+    help = "Marks stock reservations past their expiry as expired, meant to run every few minutes"
+
+    def handle(self, *args, **options):
+        expired = expire_reservations()
+        self.stdout.write(self.style.SUCCESS(f"Expired {expired} stock reservations"))
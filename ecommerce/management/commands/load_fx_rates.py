@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ecommerce.viewsets.fx_rate_feed import read_fx_rate_feed, swap_active_fx_rates
+
+
+class Command(BaseCommand):
+    help = "Replaces the active FX rates with the cross rate matrix of a JSON or CSV rate feed"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            help='JSON file like {"base": "JPY", "rates": {"USD": 0.0067}} or CSV file with currency and rate columns',
+        )
+        parser.add_argument(
+            "--base",
+            help="Currency the rates are quoted against. Defaults to the feed base or PRIMARY_FXRATE_CURRENCY",
+        )
+        parser.add_argument("--source", default="FEED", help="Source stored on the created rates")
+        parser.add_argument("--dry-run", action="store_true", help="Only report the changes")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["path"], "rb") as file_obj:
+                feed_base, rates = read_fx_rate_feed(file_obj, options["path"])
+            base = options["base"] or feed_base or settings.PRIMARY_FXRATE_CURRENCY
+            report = swap_active_fx_rates(
+                base.upper(), rates, source=options["source"], dry_run=options["dry_run"]
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for change in report["changes"]:
+            self.stdout.write(f"{base}/{change['currency']} : {change['old_rate']} -> {change['new_rate']}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{'Would swap' if report['dry_run'] else 'Swapped'} FX rates of {report['currencies']} currencies : "
+                f"{report['created']} created, {report['updated']} updated, "
+                f"{report['unchanged']} unchanged, {report['ended']} ended"
+            )
+        )
@@ -0,0 +1,53 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ecommerce.viewsets.reporting.daily_facts import (
+    first_fact_date,
+    rebuild_daily_facts,
+)
+
+
+class Command(BaseCommand):
+    help = "Backfills or rebuilds DailyFact rows from orders, purchases, incomes, spendings and the ledger"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--start-date",
+            type=datetime.date.fromisoformat,
+            help="First day to rebuild, YYYY-MM-DD. Defaults to the earliest recorded day",
+        )
+        parser.add_argument(
+            "--end-date",
+            type=datetime.date.fromisoformat,
+            help="Last day to rebuild, YYYY-MM-DD. Defaults to today",
+        )
+        parser.add_argument(
+            "--days-per-batch",
+            type=int,
+            default=31,
+            help="Number of days rebuilt per transaction",
+        )
+
+    def handle(self, *args, **options):
+        start_date = options["start_date"] or first_fact_date()
+        end_date = options["end_date"] or timezone.localdate()
+        if start_date is None:
+            self.stdout.write("Nothing to rebuild")
+            return
+        if options["days_per_batch"] < 1:
+            raise CommandError("--days-per-batch must be at least 1")
+        if start_date > end_date:
+            raise CommandError(f"--start-date {start_date} is after --end-date {end_date}")
+
+        rebuilt = 0
+        batch_start = start_date
+        while batch_start <= end_date:
+            batch_end = min(batch_start + datetime.timedelta(days=options["days_per_batch"] - 1), end_date)
+            rebuilt += rebuild_daily_facts(batch_start, batch_end)
+            self.stdout.write(f"Rebuilt {batch_start} to {batch_end}")
+            batch_start = batch_end + datetime.timedelta(days=1)
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt {rebuilt} daily facts from {start_date} to {end_date}")
+        )
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from ecommerce.viewsets.inventory.viewsets import rebuild_product_inventories
+
+
+class Command(BaseCommand):
+    help = "Rebuilds ProductInventory totals from Inventory batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--product-id",
+            type=int,
+            action="append",
+            dest="product_ids",
+            help="Only reconcile this product, can be passed multiple times",
+        )
+
+    def handle(self, *args, **options):
+        reconciled = rebuild_product_inventories(options["product_ids"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Reconciled {reconciled} product total inventories")
+        )
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ecommerce.viewsets.product.repricing import reprice_products
+
+
+class Command(BaseCommand):
+    help = "Reprices all products from their last purchase price, the active weight cost and the active profit rate"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--currency", default=None, help="Currency of the new prices. Defaults to ACCOUNTING_CURRENCY"
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only report the changes")
+
+    def handle(self, *args, **options):
+        currency_code = options["currency"] or settings.ACCOUNTING_CURRENCY
+        try:
+            report = reprice_products(currency_code, dry_run=options["dry_run"])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for change in report["changes"]:
+            self.stdout.write(
+                f"Product {change['product_id']} : {change['old_price']} {change['old_currency']} "
+                f"-> {change['new_price']} {currency_code}"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{'Would reprice' if report['dry_run'] else 'Repriced'} {report['repriced']} products, "
+                f"{report['unchanged']} unchanged, {len(report['without_purchase'])} without purchases, "
+                f"{len(report['without_fx_rate'])} without FX rates"
+            )
+        )
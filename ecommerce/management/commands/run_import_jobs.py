@@ -0,0 +1,57 @@
+import os
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+
+from ecommerce.viewsets.jobs.runner import claim_import_jobs, run_import_job
+
+
+class Command(BaseCommand):
+    help = "Processes queued CSV import jobs with a pool of worker threads"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=2, help="Number of jobs processed at once"
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=5,
+            help="Seconds to wait before looking for new jobs when the queue is empty",
+        )
+        parser.add_argument(
+            "--stale-after",
+            type=int,
+            default=None,
+            help="Seconds without progress after which running jobs of crashed workers are failed, "
+                 "IMPORT_JOB_STALE_AFTER_SECONDS by default",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once there are no pending jobs left instead of polling forever",
+        )
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        worker_name = f"{socket.gethostname()}:{os.getpid()}"
+        processed = 0
+        running = set()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                jobs = claim_import_jobs(workers - len(running), worker_name, options["stale_after"])
+                for job in jobs:
+                    self.stdout.write(f"Starting {job}")
+                    running.add(executor.submit(run_import_job, job))
+                processed += len(jobs)
+                if not jobs and not running:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll_interval"])
+                    continue
+                done, running = wait(
+                    running, timeout=options["poll_interval"], return_when=FIRST_COMPLETED
+                )
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} import jobs"))
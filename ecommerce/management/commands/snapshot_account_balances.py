@@ -0,0 +1,23 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ecommerce.viewsets.accounting.balances import take_balance_snapshot
+
+
+class Command(BaseCommand):
+    help = "Stores account balance snapshots that trial balance queries start from, meant to run daily"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--as-of",
+            type=datetime.date.fromisoformat,
+            help="Day to snapshot, YYYY-MM-DD. Defaults to yesterday",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            snapshotted = take_balance_snapshot(options["as_of"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Snapshotted balances of {snapshotted} accounts"))
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.6 on 2026-10-17 03:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_current_prices(apps, schema_editor):
+    Product = apps.get_model("ecommerce", "Product")
+    ProductPrice = apps.get_model("ecommerce", "ProductPrice")
+    active_price = ProductPrice.objects.filter(
+        product=OuterRef("pk"), end_date__isnull=True
+    ).order_by("-begin_date", "-id")
+    Product.objects.update(
+        current_price=Subquery(active_price.values("price")[:1]),
+        current_currency=Subquery(active_price.values("currency")[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0021_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='current_currency',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='ecommerce.currency'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='current_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.RunPython(backfill_current_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.6 on 2026-10-17 03:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0022_product_current_price'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='income',
+            index=models.Index(fields=['adate', 'id'], name='ecommerce_i_adate_d24558_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at', 'id'], name='ecommerce_o_created_f81272_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['created_at', 'id'], name='ecommerce_p_created_e1b88d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['purchase_datetime', 'id'], name='ecommerce_p_purchas_2c652f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='spending',
+            index=models.Index(fields=['adate', 'id'], name='ecommerce_s_adate_be963c_idx'),
+        ),
+    ]
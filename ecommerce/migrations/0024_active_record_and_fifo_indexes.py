@@ -0,0 +1,49 @@
+# Generated by Django 5.1.6 on 2026-10-17 03:18
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_inventory_purchase_datetimes(apps, schema_editor):
+    Inventory = apps.get_model("ecommerce", "Inventory")
+    Purchase = apps.get_model("ecommerce", "Purchase")
+    Inventory.objects.update(
+        purchase_datetime=Subquery(
+            Purchase.objects.filter(pk=OuterRef("purchase_id")).values("purchase_datetime")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0023_keyset_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventory',
+            name='purchase_datetime',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_inventory_purchase_datetimes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='inventory',
+            name='purchase_datetime',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['product', 'purchase_datetime', 'id'], name='inventory_fifo_in_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profitrate',
+            index=models.Index(condition=models.Q(('end_date__isnull', True)), fields=['-start_date'], name='profit_rate_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='weightcost',
+            index=models.Index(condition=models.Q(('end_date__isnull', True)), fields=['-start_date'], name='weight_cost_active_idx'),
+        ),
+    ]
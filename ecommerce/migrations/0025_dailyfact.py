@@ -0,0 +1,34 @@
+# Generated by Django 5.1.6 on 2026-10-17 03:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0024_active_record_and_fifo_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyFact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('sales', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('cogs', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('purchases', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('incomes', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('spendings', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('purchase_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('currency', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='ecommerce.currency')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'constraints': [models.UniqueConstraint(fields=('date', 'currency'), name='unique_daily_fact_per_currency')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.6 on 2026-10-17 03:38
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def end_extra_active_records(apps, schema_editor):
+    # the old constraints allowed several active records with different values, the latest one is kept
+    today = timezone.now().date()
+    for model_name in ["ProfitRate", "WeightCost"]:
+        model = apps.get_model("ecommerce", model_name)
+        active_records = model.objects.filter(end_date__isnull=True).order_by("-start_date", "-id")
+        model.objects.filter(pk__in=list(active_records.values_list("pk", flat=True)[1:])).update(end_date=today)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce', '0027_stock_reservations'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='profitrate',
+            name='only_one_active_profit_rate',
+        ),
+        migrations.RemoveConstraint(
+            model_name='weightcost',
+            name='only_one_active_weight_cost_global',
+        ),
+        migrations.RunPython(end_extra_active_records, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='profitrate',
+            constraint=models.UniqueConstraint(models.Value(True), condition=models.Q(('end_date__isnull', True)), name='only_one_active_profit_rate'),
+        ),
+        migrations.AddConstraint(
+            model_name='weightcost',
+            constraint=models.UniqueConstraint(models.Value(True), condition=models.Q(('end_date__isnull', True)), name='only_one_active_weight_cost_global'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from .accounting.models import *
 from .inventory.models import *
+from .jobs.models import *
 from .order.models import *
 from .product.models import *
+from .reporting.models import *
 from .users.models import *
@@ -1,4 +1,7 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import Sum
 
 
 class Account(models.Model):
@@ -30,14 +33,23 @@ class JournalEntry(models.Model):
     description = models.TextField(blank=True)
     reference = models.CharField(max_length=100, blank=True)  # e.g., order number
 
+    class Meta:
+        # balances since the latest AccountBalanceSnapshot only read the entries after it
+        indexes = [models.Index(fields=["date"])]
+
     def __str__(self):
         return f"Journal Entry {self.pk} on {self.date}"
 
     @property
     def is_balanced(self):
-        total_debit = sum(line.debit for line in self.lines.all())
-        total_credit = sum(line.credit for line in self.lines.all())
-        return total_debit == total_credit
+        if "lines" in getattr(self, "_prefetched_objects_cache", {}):
+            total_debit = total_credit = Decimal("0")
+            for line in self.lines.all():
+                total_debit += line.debit
+                total_credit += line.credit
+            return total_debit == total_credit
+        totals = self.lines.aggregate(total_debit=Sum("debit"), total_credit=Sum("credit"))
+        return (totals["total_debit"] or 0) == (totals["total_credit"] or 0)
 
 
 class JournalEntryLine(models.Model):
@@ -55,3 +67,25 @@ class JournalEntryLine(models.Model):
     class Meta:
         verbose_name = "Journal Entry Line"
         verbose_name_plural = "Journal Entry Lines"
+
+
+class AccountBalanceSnapshot(models.Model):
+    """
+    Cumulative debits and credits of an account over all journal entries dated on or before as_of.
+    Balances as of a later date only need the lines entered after the latest snapshot.
+    """
+
+    account = models.ForeignKey(Account, related_name="balance_snapshots", on_delete=models.CASCADE)
+    as_of = models.DateField()
+    debit = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    credit = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-as_of"]
+        constraints = [
+            models.UniqueConstraint(fields=["as_of", "account"], name="unique_account_balance_snapshot")
+        ]
+
+    def __str__(self):
+        return f"{self.account} as of {self.as_of}: Debit {self.debit} / Credit {self.credit}"
@@ -17,9 +17,26 @@ class Inventory(models.Model):
     )
     stock = models.PositiveIntegerField()
     location = models.CharField(max_length=100)
+    # copy of purchase.purchase_datetime, so that FIFO scans order batches without joining purchases
+    purchase_datetime = models.DateTimeField(editable=False)
+
+    class Meta:
+        indexes = [
+            # FIFO scan of the non-empty batches of a product
+            models.Index(
+                fields=["product", "purchase_datetime", "id"],
+                condition=models.Q(stock__gt=0),
+                name="inventory_fifo_in_stock_idx",
+            )
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.purchase_datetime is None:
+            self.purchase_datetime = self.purchase.purchase_datetime
+        super().save(*args, **kwargs)
 
     def __str__(self):
-        return f"{self.product.name} - {self.stock} pcs from {self.purchase.purchase_datetime.strftime('%Y-%m-%d')}"
+        return f"{self.product.name} - {self.stock} pcs from {self.purchase_datetime.strftime('%Y-%m-%d')}"
 
 
 class ProductInventory(models.Model):
@@ -34,3 +51,56 @@ class ProductInventory(models.Model):
 
     def __str__(self):
         return f"{self.product.name} total inventory : {self.total_inventory}"
+
+
+class StockReservation(models.Model):
+    """
+    Stock held for a customer between cart submit and checkout.
+    Active reservations that haven't expired are subtracted from the stock other checkouts can take.
+    """
+
+    STATUS_ACTIVE = "active"
+    STATUS_CONSUMED = "consumed"
+    STATUS_RELEASED = "released"
+    STATUS_EXPIRED = "expired"
+    STATUS_CHOICES = [
+        (STATUS_ACTIVE, "Active"),
+        (STATUS_CONSUMED, "Consumed"),
+        (STATUS_RELEASED, "Released"),
+        (STATUS_EXPIRED, "Expired"),
+    ]
+
+    product = models.ForeignKey(
+        Product, related_name="stock_reservations", on_delete=models.CASCADE
+    )
+    customer = models.ForeignKey(
+        "Customer",
+        related_name="stock_reservations",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+    )
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_ACTIVE)
+    order = models.ForeignKey(
+        "Order",
+        related_name="stock_reservations",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # reserved quantities of the products of a checkout
+            models.Index(
+                fields=["product", "expires_at"],
+                condition=models.Q(status="active"),
+                name="stock_reservation_active_idx",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product.name} reserved until {self.expires_at} ({self.status})"
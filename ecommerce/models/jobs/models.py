@@ -0,0 +1,59 @@
+from django.db import models
+from django.utils import timezone
+
+from ecommerce.models.audit_mixin import AuditMixin
+
+
+class ImportJob(AuditMixin):
+    """
+    CSV import queued by an API request and processed by the run_import_jobs worker.
+    """
+
+    KIND_PRODUCTS = "products"
+    KIND_PURCHASES = "purchases"
+    KIND_PURCHASES_AND_ORDERS = "purchases_and_orders"
+    KIND_CHOICES = [
+        (KIND_PRODUCTS, "Products"),
+        (KIND_PURCHASES, "Purchases"),
+        (KIND_PURCHASES_AND_ORDERS, "Purchases and orders"),
+    ]
+
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_SUCCEEDED = "succeeded"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_SUCCEEDED, "Succeeded"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES)
+    file = models.FileField(upload_to="import_jobs/")
+    status = models.CharField(
+        max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING
+    )
+    total_rows = models.PositiveIntegerField(null=True, blank=True)
+    processed_rows = models.PositiveIntegerField(default=0)
+    failed_rows = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    message = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-id"]
+        indexes = [models.Index(fields=["status", "id"])]
+
+    def __str__(self):
+        return f"{self.kind} import #{self.pk} ({self.status})"
+
+    @property
+    def rows_per_second(self):
+        if not self.started_at:
+            return None
+        end = self.finished_at or timezone.now()
+        elapsed = (end - self.started_at).total_seconds()
+        return round(self.processed_rows / elapsed, 2) if elapsed > 0 else None
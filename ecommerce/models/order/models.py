@@ -25,6 +25,10 @@ class Order(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     currency = models.ForeignKey(Currency, on_delete=models.SET_NULL, null=True)
 
+    class Meta:
+        # keyset pagination of orders
+        indexes = [models.Index(fields=["created_at", "id"])]
+
     def __str__(self):
         # Assuming Customer model has a related 'user' with a username
         return f"Order {self.id} - {self.customer.user.username}"
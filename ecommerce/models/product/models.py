@@ -94,6 +94,22 @@ class Product(AuditMixin):
     brand = models.ForeignKey(Brand, on_delete=models.SET_NULL, null=True, blank=True)
     tags = models.ManyToManyField(Tag, blank=True)
     is_active = models.BooleanField(default=True)
+    # active ProductPrice, kept in sync by ProductPrice signals
+    current_price = models.DecimalField(
+        max_digits=10, decimal_places=2, blank=True, null=True, editable=False
+    )
+    current_currency = models.ForeignKey(
+        Currency,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name="+",
+    )
+
+    class Meta:
+        # keyset pagination of the catalog
+        indexes = [models.Index(fields=["created_at", "id"])]
 
     def __str__(self):
         return self.name
@@ -1,8 +1,46 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import OuterRef, Subquery
 
 from ecommerce.models.product.models import Currency, Product
 
 
+class PurchaseQuerySet(models.QuerySet):
+    """
+    Inventory batches keep a copy of their purchase_datetime, which the Purchase post_save receiver syncs.
+    update() and bulk_update() send no signals, so they sync the copies themselves.
+    Raw SQL updating purchase_datetime has to call sync_inventory_purchase_datetimes.
+    """
+
+    def sync_inventory_purchase_datetimes(self, purchase_ids: list[int]) -> int:
+        """
+        Copy purchase_datetime of the purchases to their inventory batches with one UPDATE
+        :return: number of batches updated
+        """
+        inventory_model = self.model._meta.get_field("inventory_records").related_model
+        return inventory_model.objects.using(self.db).filter(purchase_id__in=purchase_ids).update(
+            purchase_datetime=Subquery(
+                self.model.objects.using(self.db).filter(pk=OuterRef("purchase_id")).values("purchase_datetime")[:1]
+            )
+        )
+
+    def update(self, **kwargs):
+        if "purchase_datetime" not in kwargs:
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            purchase_ids = list(self.values_list("pk", flat=True))
+            rows = super().update(**kwargs)
+            self.sync_inventory_purchase_datetimes(purchase_ids)
+        return rows
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        if "purchase_datetime" not in fields:
+            return super().bulk_update(objs, fields, batch_size=batch_size)
+        with transaction.atomic(using=self.db):
+            rows = super().bulk_update(objs, fields, batch_size=batch_size)
+            self.sync_inventory_purchase_datetimes([obj.pk for obj in objs])
+        return rows
+
+
 class Purchase(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
@@ -14,5 +52,11 @@ class Purchase(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = PurchaseQuerySet.as_manager()
+
+    class Meta:
+        # keyset pagination of purchases
+        indexes = [models.Index(fields=["purchase_datetime", "id"])]
+
     def __str__(self):
         return f"{self.product.name} - {self.quantity} units at {self.price_per_unit}"
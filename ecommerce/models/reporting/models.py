@@ -0,0 +1,32 @@
+from django.db import models
+
+from ecommerce.models.product.models import Currency
+
+
+class DailyFact(models.Model):
+    """
+    Daily rollup of sales, COGS, purchases, incomes and spendings per currency.
+    Kept current by ecommerce.viewsets.reporting.daily_facts, so that period summaries
+    read a few rows per day instead of scanning orders, purchases and the ledger.
+    """
+
+    date = models.DateField()
+    currency = models.ForeignKey(Currency, on_delete=models.CASCADE, null=True, blank=True)
+    sales = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    # COGS is booked in the ledger, so it is rolled up under the accounting currency
+    cogs = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    purchases = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    incomes = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    spendings = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    order_count = models.PositiveIntegerField(default=0)
+    purchase_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-date"]
+        constraints = [
+            models.UniqueConstraint(fields=["date", "currency"], name="unique_daily_fact_per_currency")
+        ]
+
+    def __str__(self):
+        return f"Daily facts of {self.date} in {self.currency}"
@@ -0,0 +1,232 @@
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import JsonResponse
+from django.shortcuts import redirect, render
+
+# fingerprints kept per route, the least duplicated are dropped beyond this
+PERF_MAX_FINGERPRINTS = 50
+
+_IN_LIST_RE = re.compile(r"%s(, %s)+")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def query_fingerprint(sql: str) -> str:
+    """
+    SQL with its IN lists collapsed, so the same query with another number of parameters matches.
+    Parameters are passed separately, so the SQL is already free of values.
+    """
+    return _WHITESPACE_RE.sub(" ", _IN_LIST_RE.sub("%s, ...", sql)).strip()
+
+
+class RequestMetrics:
+    """
+    What one request spent, collected by RequestPerfMiddleware
+    """
+
+    def __init__(self):
+        self.queries = Counter()
+        self.sql_time = 0.0
+        self.serialize_time = 0.0
+        # when the view started and the SQL time up to then, set by RequestPerfMiddleware.process_view
+        self.view_started = None
+        self.view_sql_time = 0.0
+        self.render_time = 0.0
+        self.total_time = 0.0
+        self.response_size = None
+
+    def __call__(self, execute, sql, params, many, context):
+        # installed with connection.execute_wrapper, so every query of the request passes through here
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries[query_fingerprint(sql)] += 1
+
+    @property
+    def query_count(self) -> int:
+        return sum(self.queries.values())
+
+    @property
+    def duplicates(self) -> dict[str, int]:
+        """
+        :return: fingerprints of queries run more than once, the usual sign of N+1 queries
+        """
+        return {fingerprint: count for fingerprint, count in self.queries.items() if count > 1}
+
+    def server_timing(self) -> str:
+        duplicates = self.duplicates
+        metrics = [
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.query_count} queries"',
+            f'dup;desc="{len(duplicates)} duplicated, worst {max(duplicates.values(), default=0)}x"',
+            f"serialize;dur={self.serialize_time * 1000:.1f}",
+            f"render;dur={self.render_time * 1000:.1f}",
+            f"total;dur={self.total_time * 1000:.1f}",
+        ]
+        if self.response_size is not None:
+            metrics.append(f'size;desc="{self.response_size} bytes"')
+        return ", ".join(metrics)
+
+
+class RoutePerfStats:
+    def __init__(self, route: str):
+        self.route = route
+        self.requests = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.sql_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+        self.queries = 0
+        self.response_size = 0
+        self.duplicates = Counter()
+
+    def add(self, metrics: RequestMetrics):
+        self.requests += 1
+        self.total_time += metrics.total_time
+        self.max_time = max(self.max_time, metrics.total_time)
+        self.sql_time += metrics.sql_time
+        self.serialize_time += metrics.serialize_time
+        self.render_time += metrics.render_time
+        self.queries += metrics.query_count
+        self.response_size += metrics.response_size or 0
+        self.duplicates.update(metrics.duplicates)
+        if len(self.duplicates) > PERF_MAX_FINGERPRINTS:
+            self.duplicates = Counter(dict(self.duplicates.most_common(PERF_MAX_FINGERPRINTS)))
+
+    def as_dict(self) -> dict:
+        return {
+            "route": self.route,
+            "requests": self.requests,
+            "total_ms": round(self.total_time * 1000, 1),
+            "avg_ms": round(self.total_time * 1000 / self.requests, 1),
+            "max_ms": round(self.max_time * 1000, 1),
+            "avg_sql_ms": round(self.sql_time * 1000 / self.requests, 1),
+            "avg_serialize_ms": round(self.serialize_time * 1000 / self.requests, 1),
+            "avg_render_ms": round(self.render_time * 1000 / self.requests, 1),
+            "avg_queries": round(self.queries / self.requests, 1),
+            "avg_size_bytes": round(self.response_size / self.requests),
+            "duplicated_queries": [
+                {"fingerprint": fingerprint, "count": count} for fingerprint, count in self.duplicates.most_common(5)
+            ],
+        }
+
+
+class PerfStats:
+    """
+    Request metrics aggregated per route, kept in memory of each process.
+    Every gunicorn worker has its own, so a report only covers the requests of the worker serving it.
+    """
+
+    def __init__(self):
+        self.routes: dict[str, RoutePerfStats] = {}
+        self.lock = threading.Lock()
+
+    def add(self, route: str, metrics: RequestMetrics):
+        with self.lock:
+            stats = self.routes.get(route)
+            if stats is None:
+                stats = self.routes[route] = RoutePerfStats(route)
+            stats.add(metrics)
+
+    def report(self) -> list[dict]:
+        """
+        :return: routes ranked by the total time spent on them
+        """
+        with self.lock:
+            return [
+                stats.as_dict() for stats in sorted(self.routes.values(), key=lambda s: s.total_time, reverse=True)
+            ]
+
+    def reset(self):
+        with self.lock:
+            self.routes = {}
+
+
+perf_stats = PerfStats()
+
+
+class RequestPerfMiddleware:
+    """
+    Records query count, SQL time, duplicated queries, serialization and render time and response size
+    of every request. Serialization is the time the view spends outside SQL, for DRF views that is mostly
+    serializers turning rows into data, as their querysets are evaluated lazily and timed as SQL.
+    They are sent back as a Server-Timing header and aggregated per route for /admin/perf/.
+    Only installed when PERF_INSTRUMENTATION is on, put it first in MIDDLEWARE to time the other middleware too.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "PERF_INSTRUMENTATION", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = request._perf_metrics = RequestMetrics()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics))
+            response = self.get_response(request)
+        metrics.total_time = time.perf_counter() - started
+        if not response.streaming:
+            metrics.response_size = len(response.content)
+        response["Server-Timing"] = metrics.server_timing()
+
+        match = request.resolver_match
+        perf_stats.add(f"{request.method} {match.view_name if match else 'unresolved'}", metrics)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = request._perf_metrics
+        metrics.view_started = time.perf_counter()
+        metrics.view_sql_time = metrics.sql_time
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered right after the template response hooks of all middleware. Their data is
+        # serialized in the view already, so the view is over here and only the renderer turning it into bytes
+        # is left
+        render_started = time.perf_counter()
+        metrics = request._perf_metrics
+        if metrics.view_started is not None:
+            view_time = render_started - metrics.view_started
+            metrics.serialize_time = view_time - (metrics.sql_time - metrics.view_sql_time)
+
+        def rendered(response):
+            request._perf_metrics.render_time = time.perf_counter() - render_started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+@staff_member_required
+def perf_report_view(request):
+    """
+    Routes ranked by the total time spent on them since the process started or the report was reset.
+    Stats are per process, with several gunicorn workers each request of this page may show another worker.
+    Add ?format=json for JSON, POST to reset.
+    """
+    if request.method == "POST":
+        perf_stats.reset()
+        return redirect(request.path)
+    report = perf_stats.report()
+    if request.GET.get("format") == "json":
+        return JsonResponse({"enabled": settings.PERF_INSTRUMENTATION, "routes": report})
+    return render(
+        request,
+        "admin/perf_report.html",
+        {
+            **admin.site.each_context(request),
+            "title": "Request performance",
+            "enabled": settings.PERF_INSTRUMENTATION,
+            "routes": report,
+        },
+    )
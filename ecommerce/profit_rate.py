@@ -10,6 +10,7 @@ from rest_framework.viewsets import ModelViewSet
 
 from ecommerce.models.audit_mixin import AuditMixin
 from ecommerce.permissions import IsStaff, IsStaffOrReadOnly
+from ecommerce.viewsets.active_records import swap_active_record
 
 logger=logging.getLogger(__name__)
 
@@ -24,12 +25,20 @@ class ProfitRate(AuditMixin):
     class Meta:
         ordering = ["-start_date"]
         constraints = [
+            # a constant expression, so that at most one record is active at a time
             models.UniqueConstraint(
-                fields=["profit_rate"],
+                models.Value(True),
                 condition=models.Q(end_date__isnull=True),
                 name="only_one_active_profit_rate",
             )
         ]
+        indexes = [
+            models.Index(
+                fields=["-start_date"],
+                condition=models.Q(end_date__isnull=True),
+                name="profit_rate_active_idx",
+            )
+        ]
 
 
 class ProfitRateSerializer(serializers.ModelSerializer):
@@ -58,15 +67,7 @@ class ActiveProfitRateView(APIView):
 
 def create_update_profit_rate(profit_rate: float):
     """End-date the active profit rate (if any) and create a new one."""
-    active_record = ProfitRate.objects.filter(end_date__isnull=True).first()
-    if active_record:
-        active_record.end_date = timezone.now().date()
-        active_record.save()
-
-    new_record = ProfitRate.objects.create(
-        profit_rate=profit_rate,
-        start_date=timezone.now().date()
-    )
+    new_record, _ = swap_active_record(ProfitRate, {}, {"profit_rate": profit_rate})
     return new_record
 
 
@@ -1,5 +1,7 @@
 from .accounting.serializers import *
 from .inventory.serializers import *
+from .jobs.serializers import *
 from .order.serializers import *
 from .product.serializers import *
+from .reporting.serializers import *
 from .user.serializers import *
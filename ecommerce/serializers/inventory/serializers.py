@@ -1,6 +1,6 @@
 from rest_framework import serializers
 
-from ecommerce.models import Inventory, ProductInventory
+from ecommerce.models import Inventory, ProductInventory, StockReservation
 
 
 class InventorySerializer(serializers.ModelSerializer):
@@ -13,3 +13,9 @@ class ProductInventorySerializer(serializers.ModelSerializer):
     class Meta:
         model = ProductInventory
         fields = "__all__"
+
+
+class StockReservationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StockReservation
+        fields = "__all__"
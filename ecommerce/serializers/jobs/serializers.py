@@ -0,0 +1,11 @@
+from rest_framework import serializers
+
+from ecommerce.models import ImportJob
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    rows_per_second = serializers.ReadOnlyField()
+
+    class Meta:
+        model = ImportJob
+        fields = "__all__"
@@ -3,6 +3,8 @@ from rest_framework import serializers
 from ecommerce.models import Order, OrderItem, Payment
 from ecommerce.serializers.product.serializers import (
     CurrencySerializer,
+    get_icon_image_url,
+    prefetch_icon_images,
 )
 from ecommerce.serializers.user.serializers import (
     CustomerSerializer,
@@ -10,6 +12,20 @@ from ecommerce.serializers.user.serializers import (
 )
 
 
+def prefetch_order_items(queryset):
+    """
+    Load everything OrderSerializer and OrderWithItemsSerializer render with a constant number of queries
+    :param queryset: Order queryset
+    :return:
+    """
+    return queryset.select_related("customer__user", "currency").prefetch_related(
+        "items__product",
+        "items__currency",
+        prefetch_icon_images("items__product__images"),
+        "customer__addresses",
+    )
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source="product.name", read_only=True)
     product_image = serializers.SerializerMethodField()
@@ -29,13 +45,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
         ]
 
     def get_product_image(self, obj):
-        icon_image = obj.product.images.filter(tag="icon").first()
-        if icon_image and icon_image.image and hasattr(icon_image.image, "url"):
-            request = self.context.get("request")
-            if request:
-                return request.build_absolute_uri(icon_image.image.url)
-            return icon_image.image.url
-        return None
+        return get_icon_image_url(obj.product, self.context.get("request"))
 
 
 class OrderWithItemsSerializer(serializers.ModelSerializer):
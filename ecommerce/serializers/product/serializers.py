@@ -1,3 +1,4 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
 
 from ecommerce.models import (
@@ -15,6 +16,42 @@ from ecommerce.models.product.models import Currency, FXRate
 from ecommerce.serializers.inventory.serializers import InventorySerializer
 from ecommerce.serializers.user.serializers import CustomerSerializer
 
+ICON_IMAGES_ATTR = "icon_images"
+
+
+def prefetch_icon_images(lookup: str = "images") -> Prefetch:
+    """
+    Prefetch only the icon images of products, to be read with get_icon_images
+    :param lookup: path to product images from the queried model, e.g. "product__images" for purchases
+    :return:
+    """
+    return Prefetch(
+        lookup,
+        queryset=ProductImage.objects.filter(tag="icon").order_by("id"),
+        to_attr=ICON_IMAGES_ATTR,
+    )
+
+
+def get_icon_images(product: Product) -> list[ProductImage]:
+    """
+    Icon images of a product, taken from prefetch_icon_images when the queryset used it
+    :param product:
+    :return:
+    """
+    if hasattr(product, ICON_IMAGES_ATTR):
+        return getattr(product, ICON_IMAGES_ATTR)
+    return list(product.images.filter(tag="icon").order_by("id"))
+
+
+def get_icon_image_url(product: Product, request=None) -> str | None:
+    icon_images = get_icon_images(product)
+    if icon_images and icon_images[0].image:
+        image_url = icon_images[0].image.url
+        if request:
+            return request.build_absolute_uri(image_url)
+        return image_url
+    return None
+
 
 class CurrencySerializer(serializers.ModelSerializer):
     class Meta:
@@ -114,8 +151,7 @@ class ProductWithImageSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
     def get_icon_images(self, obj):
-        images = obj.images.filter(tag="icon")
-        return ProductImageSerializer(images, many=True).data
+        return ProductImageSerializer(get_icon_images(obj), many=True).data
 
 
 class ProductWithIconImageSerializer(serializers.ModelSerializer):
@@ -129,8 +165,8 @@ class ProductWithIconImageSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
     def get_icon_image(self, obj):
-        icon_image = obj.images.filter(tag="icon").first()
-        return ProductImageSerializer(icon_image).data
+        icon_images = get_icon_images(obj)
+        return ProductImageSerializer(icon_images[0] if icon_images else None).data
 
 
 class ProductWeightSerializer(serializers.ModelSerializer):
@@ -1,8 +1,23 @@
 from rest_framework import serializers
 
-from ecommerce.models.product.models import Product, ProductImage
+from ecommerce.models.product.models import Product
 from ecommerce.models.purchase.models import Purchase
-from ecommerce.serializers.product.serializers import CurrencySerializer
+from ecommerce.serializers.product.serializers import (
+    CurrencySerializer,
+    get_icon_image_url,
+    prefetch_icon_images,
+)
+
+
+def prefetch_purchase_products(queryset):
+    """
+    Load the products, currencies and product icons PurchaseSerializer renders
+    :param queryset: Purchase queryset
+    :return:
+    """
+    return queryset.select_related("product", "currency").prefetch_related(
+        prefetch_icon_images("product__images")
+    )
 
 
 class PurchaseSerializer(serializers.ModelSerializer):
@@ -26,16 +41,7 @@ class PurchaseSerializer(serializers.ModelSerializer):
         ]
 
     def get_product_image(self, obj):
-        icon_image = ProductImage.objects.filter(
-            product=obj.product, tag="icon"
-        ).first()
-        request = self.context.get("request")
-        if icon_image and icon_image.image:
-            image_url = icon_image.image.url
-            if request:
-                return request.build_absolute_uri(image_url)
-            return image_url
-        return None
+        return get_icon_image_url(obj.product, self.context.get("request"))
 
 
 class LastPurchasePriceSerializer(serializers.ModelSerializer):
@@ -49,9 +55,7 @@ class LastPurchasePriceSerializer(serializers.ModelSerializer):
         fields = ["id", "last_price", "last_currency"]
 
     def get_last_currency(self, obj):
-        from ecommerce.models import Currency
-
+        # code and name are annotated by LastPurchasePriceViewSet next to the id
         if obj.last_currency_id:
-            currency = Currency.objects.get(id=obj.last_currency_id)
-            return {"id":currency.id,"code": currency.code, "name": currency.name}
+            return {"id": obj.last_currency_id, "code": obj.last_currency_code, "name": obj.last_currency_name}
         return None
@@ -0,0 +1,11 @@
+from rest_framework import serializers
+
+from ecommerce.models import DailyFact
+
+
+class DailyFactSerializer(serializers.ModelSerializer):
+    currency_code = serializers.CharField(source="currency.code", read_only=True, default=None)
+
+    class Meta:
+        model = DailyFact
+        fields = "__all__"
@@ -1,39 +1,290 @@
 import logging
 
-from django.core.cache import cache
-from django.db.models import Sum
-from django.db.models.signals import post_delete, post_save
+from django.db import transaction
+from django.db.models import DEFERRED, Sum
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_init,
+    post_save,
+    pre_delete,
+    pre_save,
+)
 from django.dispatch import receiver
 
-from ecommerce.models import Inventory, Product, ProductInventory
+from ecommerce.income_and_spendings.incomes import Income
+from ecommerce.income_and_spendings.spendings import Spending
+from ecommerce.models import (
+    Account,
+    Brand,
+    Category,
+    FXRate,
+    Inventory,
+    JournalEntry,
+    JournalEntryLine,
+    Order,
+    Product,
+    ProductImage,
+    ProductPrice,
+    Purchase,
+    Tag,
+)
+from ecommerce.viewsets.accounting.balances import invalidate_balance_snapshots
+from ecommerce.viewsets.accounting.chart import (
+    COGS_ACCOUNT_CODE,
+    bump_chart_of_accounts_version,
+    get_chart_of_accounts,
+)
+from ecommerce.viewsets.inventory.viewsets import record_inventory_delta
+from ecommerce.viewsets.product.prices import sync_current_prices
+from ecommerce.viewsets.reporting.daily_facts import (
+    cogs_contribution,
+    contribution_from_values,
+    fact_values,
+    loaded_fact_values,
+    record_daily_fact_changes,
+    stored_fact_values,
+)
+from ecommerce.viewsets.tagged_cache import invalidate_catalog, invalidate_products
+from ecommerce.viewsets.utils import bump_fx_rate_matrix_version
 
 logger = logging.getLogger(__name__)
 
 
+@receiver(post_init, sender=Inventory)
+def remember_loaded_inventory_stock(sender, instance, **kwargs):
+    # __dict__ is used so that deferred fields aren't loaded just for the snapshot
+    instance._loaded_stock = (
+        instance.__dict__.get("product_id"),
+        instance.__dict__.get("stock") or 0,
+    )
+
+
 @receiver([post_save], sender=Inventory)
-def update_product_inventory(sender, instance, **kwargs):
-    # if product is being deleted then no need to update total inventory
-    product = instance.product
-    if not Product.objects.filter(pk=product.pk).exists():
+def update_product_inventory(sender, instance, created, **kwargs):
+    loaded_product_id, loaded_stock = (None, 0) if created else instance._loaded_stock
+    if loaded_product_id is not None and loaded_product_id != instance.product_id:
+        record_inventory_delta(loaded_product_id, -loaded_stock)
+        loaded_stock = 0
+    record_inventory_delta(instance.product_id, instance.stock - loaded_stock)
+    instance._loaded_stock = (instance.product_id, instance.stock)
+
+
+@receiver([post_delete], sender=Inventory)
+def reduce_product_inventory_on_delete(sender, instance, **kwargs):
+    # if product is being deleted its total inventory is deleted too, applying the delta is a no-op
+    loaded_product_id, loaded_stock = instance._loaded_stock
+    record_inventory_delta(loaded_product_id or instance.product_id, -loaded_stock)
+
+
+@receiver(post_save, sender=Purchase)
+def sync_inventory_purchase_datetime(sender, instance, created, **kwargs):
+    if not created:
+        Inventory.objects.filter(purchase=instance).exclude(
+            purchase_datetime=instance.purchase_datetime
+        ).update(purchase_datetime=instance.purchase_datetime)
+
+
+@receiver([post_save, post_delete], sender=FXRate)
+def invalidate_fx_rate_matrix(sender, **kwargs):
+    # bumped after commit so that other processes can't reload the matrix before the new rates are visible
+    transaction.on_commit(bump_fx_rate_matrix_version)
+
+
+@receiver([post_save, post_delete], sender=Account)
+def invalidate_chart_of_accounts(sender, **kwargs):
+    transaction.on_commit(bump_chart_of_accounts_version)
+
+
+@receiver([post_save, post_delete], sender=ProductPrice)
+def sync_product_current_price(sender, instance, **kwargs):
+    sync_current_prices([instance.product_id])
+
+
+@receiver(post_save, sender=Product)
+def invalidate_saved_product_cache(sender, instance, created, **kwargs):
+    invalidate_products([instance.pk], catalog=created)
+
+
+@receiver(post_delete, sender=Product)
+def invalidate_deleted_product_cache(sender, instance, **kwargs):
+    invalidate_products([instance.pk], catalog=True)
+
+
+@receiver([post_save, post_delete], sender=ProductPrice)
+@receiver([post_save, post_delete], sender=ProductImage)
+def invalidate_product_detail_cache(sender, instance, **kwargs):
+    invalidate_products([instance.product_id])
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def invalidate_product_tags_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
         return
-    total = (
-            Inventory.objects.filter(product=instance.product).aggregate(
-                total=Sum("stock")
-            )["total"]
-            or 0
-    )
+    if not reverse:
+        invalidate_products([instance.pk])
+    elif pk_set:
+        invalidate_products(pk_set)
+    else:
+        # a tag was cleared from all its products
+        invalidate_catalog()
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Brand)
+@receiver([post_save, post_delete], sender=Tag)
+def invalidate_catalog_cache(sender, **kwargs):
+    invalidate_catalog()
+
+
+@receiver(post_init, sender=Order)
+@receiver(post_init, sender=Purchase)
+@receiver(post_init, sender=Income)
+@receiver(post_init, sender=Spending)
+def remember_loaded_fact_values(sender, instance, **kwargs):
+    # only the fields the daily facts are computed from, the contributions are computed when they changed
+    instance._loaded_fact = loaded_fact_values(instance)
 
-    ProductInventory.objects.update_or_create(
-        product=instance.product, defaults={"total_inventory": total}
+
+@receiver([pre_save, pre_delete], sender=Order)
+@receiver([pre_save, pre_delete], sender=Purchase)
+@receiver([pre_save, pre_delete], sender=Income)
+@receiver([pre_save, pre_delete], sender=Spending)
+def load_deferred_fact_values(sender, instance, **kwargs):
+    if instance._loaded_fact is DEFERRED:
+        instance._loaded_fact = stored_fact_values(instance) if instance.pk is not None else None
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=Purchase)
+@receiver(post_save, sender=Income)
+@receiver(post_save, sender=Spending)
+def record_saved_fact_contribution(sender, instance, created, **kwargs):
+    values = fact_values(instance)
+    if created or instance._loaded_fact != values:
+        record_daily_fact_changes(
+            [None if created else contribution_from_values(sender, instance._loaded_fact)],
+            [contribution_from_values(sender, values)],
+        )
+    instance._loaded_fact = values
+
+
+@receiver(post_delete, sender=Order)
+@receiver(post_delete, sender=Purchase)
+@receiver(post_delete, sender=Income)
+@receiver(post_delete, sender=Spending)
+def record_deleted_fact_contribution(sender, instance, **kwargs):
+    record_daily_fact_changes(removed=[contribution_from_values(sender, instance._loaded_fact)])
+    instance._loaded_fact = None
+
+
+def _is_cogs_account(account_id, account=None) -> bool:
+    """
+    :param account: the account of the line when it is loaded, its code is checked without the chart of accounts
+    """
+    if account is not None and account.pk == account_id:
+        return account.code == COGS_ACCOUNT_CODE
+    chart = get_chart_of_accounts()
+    return COGS_ACCOUNT_CODE in chart and account_id == chart.get_id(COGS_ACCOUNT_CODE)
+
+
+@receiver(post_init, sender=JournalEntryLine)
+def remember_loaded_line_amounts(sender, instance, **kwargs):
+    # deferred fields are left out, the stored line is read again when it changes
+    values = instance.__dict__
+    try:
+        instance._loaded_line = (values["journal_entry_id"], values["account_id"], values["debit"], values["credit"])
+    except KeyError:
+        instance._loaded_line = None
+
+
+@receiver(pre_save, sender=JournalEntryLine)
+def load_deferred_line_amounts(sender, instance, **kwargs):
+    if instance._loaded_line is None and instance.pk is not None:
+        instance._loaded_line = (
+            JournalEntryLine.objects.filter(pk=instance.pk)
+            .values_list("journal_entry_id", "account_id", "debit", "credit")
+            .first()
+        )
+
+
+def _loaded_line_contribution(instance, is_cogs: bool = None):
+    """
+    :param is_cogs: whether the current account of the line is the COGS account, reused when the account didn't change
+    """
+    if instance._loaded_line is None:
+        return None
+    journal_entry_id, account_id, debit, credit = instance._loaded_line
+    if is_cogs is None or account_id != instance.account_id:
+        is_cogs = _is_cogs_account(account_id)
+    if not is_cogs:
+        return None
+    if journal_entry_id == instance.journal_entry_id and "journal_entry" in instance._state.fields_cache:
+        journal_entry_date = instance.journal_entry.date
+    else:
+        journal_entry_date = JournalEntry.objects.filter(pk=journal_entry_id).values_list("date", flat=True).first()
+    return cogs_contribution(journal_entry_date, debit, credit) if journal_entry_date else None
+
+
+@receiver(post_save, sender=JournalEntryLine)
+def record_cogs_line_contribution(sender, instance, created, **kwargs):
+    loaded_line = (instance.journal_entry_id, instance.account_id, instance.debit, instance.credit)
+    if not created and instance._loaded_line == loaded_line:
+        return
+    is_cogs = _is_cogs_account(instance.account_id, instance._state.fields_cache.get("account"))
+    contribution = cogs_contribution(instance.journal_entry.date, instance.debit, instance.credit) if is_cogs else None
+    previous = None if created else _loaded_line_contribution(instance, is_cogs)
+    if contribution != previous:
+        record_daily_fact_changes([previous], [contribution])
+    instance._loaded_line = loaded_line
+
+
+@receiver(pre_delete, sender=JournalEntryLine)
+def record_deleted_cogs_line_contribution(sender, instance, **kwargs):
+    # on pre_delete, so the journal entry is still there when the line is deleted along with it
+    load_deferred_line_amounts(sender, instance)
+    record_daily_fact_changes(removed=[_loaded_line_contribution(instance)])
+
+
+@receiver(post_init, sender=JournalEntry)
+def remember_loaded_entry_date(sender, instance, **kwargs):
+    # COGS daily facts and balance snapshots both follow the date of the entry
+    instance._loaded_date = instance.__dict__.get("date")
+
+
+def _move_entry_cogs_contribution(journal_entry, loaded_date):
+    # lines follow the date of their entry, so re-dating an entry moves its COGS to the new day
+    chart = get_chart_of_accounts()
+    if COGS_ACCOUNT_CODE not in chart:
+        return
+    totals = journal_entry.lines.filter(account_id=chart.get_id(COGS_ACCOUNT_CODE)).aggregate(
+        debit=Sum("debit"), credit=Sum("credit")
+    )
+    if totals["debit"] is None:
+        return
+    record_daily_fact_changes(
+        [cogs_contribution(loaded_date, totals["debit"], totals["credit"])],
+        [cogs_contribution(journal_entry.date, totals["debit"], totals["credit"])],
     )
 
 
-# Import the same key from your views or define it here
-CACHE_KEY_PRODUCTS = "products_with_icon_image"
+@receiver([post_save, post_delete], sender=JournalEntry)
+def record_entry_date_change(sender, instance, signal, created=False, **kwargs):
+    loaded_date = instance._loaded_date
+    if signal is post_save and not created and loaded_date not in (None, instance.date):
+        _move_entry_cogs_contribution(instance, loaded_date)
+    # an entry moved to a later day leaves the snapshots from its old day on stale too
+    dates = [date for date in (loaded_date, instance.date) if date is not None]
+    invalidate_balance_snapshots(min(dates, default=None))
+    instance._loaded_date = instance.date
 
 
-@receiver([post_save, post_delete], sender=Product)
-def clear_products_cache(sender, **kwargs):
-    cache.delete(CACHE_KEY_PRODUCTS)
-    cache.clear()
-    logger.debug("All cache is cleared due to Product changes")
+@receiver([post_save, post_delete], sender=JournalEntryLine)
+def invalidate_line_balance_snapshots(sender, instance, **kwargs):
+    if "journal_entry" in instance._state.fields_cache:
+        invalidate_balance_snapshots(instance.journal_entry.date)
+    else:
+        # lines deleted with their journal entry find nothing, the journal entry receiver covers them
+        invalidate_balance_snapshots(
+            JournalEntry.objects.filter(pk=instance.journal_entry_id).values_list("date", flat=True).first()
+        )
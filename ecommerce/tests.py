@@ -1 +1,1961 @@
-# Create your tests here.
+import datetime
+import io
+import logging
+import threading
+import time
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+import pandas as pd
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import F, Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.serializers import BaseSerializer
+
+from ecommerce.income_and_spendings.incomes import Income, IncomeName
+from ecommerce.income_and_spendings.spendings import Spending, SpendingName
+from ecommerce.models import (
+    Account,
+    AccountBalanceSnapshot,
+    Brand,
+    Category,
+    Currency,
+    Customer,
+    DailyFact,
+    FXRate,
+    ImportJob,
+    Inventory,
+    JournalEntry,
+    JournalEntryLine,
+    Order,
+    OrderItem,
+    Payment,
+    Product,
+    ProductImage,
+    ProductInventory,
+    ProductPrice,
+    ProductWeight,
+    Purchase,
+    StockReservation,
+    Tag,
+)
+from ecommerce.perf import perf_stats
+from ecommerce.profit_rate import ProfitRate
+from ecommerce.viewsets import active_records
+from ecommerce.viewsets.accounting.balances import (
+    get_account_balances,
+    take_balance_snapshot,
+)
+from ecommerce.viewsets.accounting.chart import (
+    ACCOUNTS_PAYABLE_ACCOUNT_CODE,
+    CASH_ACCOUNT_CODE,
+    COGS_ACCOUNT_CODE,
+    INVENTORY_ACCOUNT_CODE,
+    SALES_ACCOUNT_CODE,
+    bump_chart_of_accounts_version,
+    get_account,
+    get_accounts,
+    get_chart_of_accounts,
+)
+from ecommerce.viewsets.accounting.journal import JournalBatch
+from ecommerce.viewsets.accounting.totals import total_in_accounting_currency
+from ecommerce.viewsets.accounting.viewsets import (
+    allocate_fifo_batches,
+    journal_entries_for_direct_inventory_changes,
+)
+from ecommerce.viewsets.active_records import swap_active_record
+from ecommerce.viewsets.fx_rate_feed import swap_active_fx_rates
+from ecommerce.viewsets.fx_rates_viewsets import (
+    create_or_udpate_fx_rate_given_against_primary_ccy_rate,
+    recompute_cross_rates,
+)
+from ecommerce.viewsets.inventory.reservations import reserve_stock
+from ecommerce.viewsets.inventory.viewsets import rebuild_product_inventories
+from ecommerce.viewsets.jobs.runner import (
+    ImportJobHeartbeat,
+    ImportJobLost,
+    claim_import_jobs,
+    fail_stale_import_jobs,
+    run_import_job,
+    update_import_job,
+)
+from ecommerce.viewsets.product.bulk_import import bulk_import_products_from_dataframe
+from ecommerce.viewsets.product.prices import get_active_prices, sync_current_prices
+from ecommerce.viewsets.product.repricing import reprice_products
+from ecommerce.viewsets.purchase.bulk_import import PurchaseCSVIngestor
+from ecommerce.viewsets.reporting.daily_facts import (
+    DAILY_FACT_FIELDS,
+    rebuild_daily_facts,
+)
+from ecommerce.viewsets.utils import (
+    FX_RATE_MATRIX_VERSION_KEY,
+    bump_fx_rate_matrix_version,
+    convert_amount_from_one_currency_code_to_another,
+    convert_amount_from_one_currency_code_to_another_as_of,
+    get_fx_rate_history,
+    get_fx_rate_matrix,
+    get_fx_rates_with_currency_codes,
+    start_of_day,
+    start_of_next_day,
+)
+from ecommerce.weight_cost import WeightCost
+
+logger = logging.getLogger(__name__)
+
+
+@override_settings(STORAGES={"default": {"BACKEND": "django.core.files.storage.InMemoryStorage"}})
+class ListingQueryCountTests(TestCase):
+    """
+    Listings have to make the same number of queries however many rows they render,
+    so a serializer reading a relation that isn't prefetched fails here.
+    """
+
+    listing_urls = [
+        "/ecommerce/v1/products-with-images/",
+        "/ecommerce/v1/products-with-icon-image/",
+        "/ecommerce/v1/products-with-icon-image-paginated/",
+        "/ecommerce/v2/products-with-icon-image-paginated/",
+        "/ecommerce/v1/orders/",
+        "/ecommerce/v1/admin-orders/",
+        "/ecommerce/v1/order-items/",
+        "/ecommerce/v1/purchases/",
+        "/ecommerce/v1/products/",
+        "/ecommerce/v1/product-prices/",
+        "/ecommerce/v1/product-weights/",
+        "/ecommerce/v1/last-purchase-prices/",
+        "/ecommerce/v1/payments/",
+        "/ecommerce/v1/journal-entries/",
+        "/ecommerce/v1/journal-entry-lines/",
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.currency = Currency.objects.create(code="JPY", name="Yen")
+        cls.category = Category.objects.create(name="Listing")
+        cls.brand = Brand.objects.create(name="Listing")
+        cls.tags = [Tag.objects.create(name="new"), Tag.objects.create(name="sale")]
+        cls.admin = User.objects.create(username="listing-admin", is_staff=True, is_superuser=True)
+        cls.customer = Customer.objects.create(user=User.objects.create(username="listing-customer"))
+        cls.inventory_account = Account.objects.create(code="1200", name="Inventory", account_type="asset")
+        cls.payable_account = Account.objects.create(code="2000", name="Payable", account_type="liability")
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_products(self, count: int):
+        """
+        Products with a price, a weight, tags, an icon and a main image, a purchased batch with its journal entry
+        and a paid order each
+        """
+        for _ in range(count):
+            i = Product.objects.count()
+            product = Product.objects.create(
+                name=f"Listing product {i}", sku=f"LISTING-{i}", category=self.category, brand=self.brand
+            )
+            product.tags.set(self.tags)
+            ProductPrice.objects.create(product=product, price=Decimal("100"), currency=self.currency)
+            ProductImage.objects.create(product=product, tag="icon", image=f"product_images/{i}-icon.png")
+            ProductImage.objects.create(product=product, tag="main", image=f"product_images/{i}-main.png")
+            purchase = Purchase.objects.create(
+                product=product,
+                quantity=5,
+                price_per_unit=Decimal("10"),
+                currency=self.currency,
+                purchase_datetime=timezone.now(),
+            )
+            Inventory.objects.create(product=product, purchase=purchase, stock=5, location="listing")
+            ProductWeight.objects.create(product=product, weight=0.5)
+            journal_entry = JournalEntry.objects.create(description=f"Purchase of listing product {i}")
+            JournalEntryLine.objects.create(journal_entry=journal_entry, account=self.inventory_account, debit=50)
+            JournalEntryLine.objects.create(journal_entry=journal_entry, account=self.payable_account, credit=50)
+            order = Order.objects.create(customer=self.customer, total_amount=Decimal("100"), currency=self.currency)
+            OrderItem.objects.create(
+                order=order, product=product, quantity=1, price=Decimal("100"), currency=self.currency
+            )
+            Payment.objects.create(order=order, method="cash_on_delivery")
+
+    def get_listing(self, url: str):
+        cache.clear()  # a cached listing makes no queries at all
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return response
+
+    def test_listing_query_counts_dont_grow_with_rows(self):
+        self.add_products(2)
+        query_counts = {}
+        for url in self.listing_urls:
+            with CaptureQueriesContext(connection) as queries:
+                self.get_listing(url)
+            query_counts[url] = len(queries)
+
+        self.add_products(5)
+        for url in self.listing_urls:
+            with self.subTest(url=url), self.assertNumQueries(query_counts[url]):
+                self.get_listing(url)
+
+    def test_icon_images_come_from_the_prefetch(self):
+        self.add_products(1)
+        product = self.get_listing("/ecommerce/v1/products-with-icon-image/").json()[0]
+        self.assertEqual(product["icon_image"]["tag"], "icon")
+        purchase = self.get_listing("/ecommerce/v1/purchases/").json()[0]
+        self.assertIn("-icon.png", purchase["product_image"])
+
+
+@override_settings(STORAGES={"default": {"BACKEND": "django.core.files.storage.InMemoryStorage"}})
+class TaggedListingCacheTests(TestCase):
+    """
+    A product change only invalidates the cached pages showing it, and the whole catalog listing
+    """
+
+    listing_url = "/ecommerce/v1/products-with-icon-image/"
+    page_url = "/ecommerce/v1/products-with-icon-image-paginated/?product_id={}"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.currency = Currency.objects.create(code="JPY", name="Yen")
+        cls.category = Category.objects.create(name="Cached")
+        cls.tag = Tag.objects.create(name="sale")
+        cls.apple = Product.objects.create(name="Apple", sku="APPLE", category=cls.category)
+        cls.pear = Product.objects.create(name="Pear", sku="PEAR", category=cls.category)
+
+    def setUp(self):
+        cache.clear()
+
+    def is_cached(self, url: str) -> bool:
+        # served from the cache without any query, the client isn't logged in
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return len(queries) == 0
+
+    def cached_entries(self) -> dict[str, bool]:
+        return {
+            "listing": self.is_cached(self.listing_url),
+            "apple": self.is_cached(self.page_url.format(self.apple.id)),
+            "pear": self.is_cached(self.page_url.format(self.pear.id)),
+        }
+
+    def add_purchased_batch(self, product: Product):
+        purchase = Purchase.objects.create(
+            product=product,
+            quantity=5,
+            price_per_unit=Decimal("10"),
+            currency=self.currency,
+            purchase_datetime=timezone.now(),
+        )
+        Inventory.objects.create(product=product, purchase=purchase, stock=5, location="cached")
+
+    def test_product_changes_only_invalidate_the_entries_showing_it(self):
+        changes = {
+            "price": lambda: ProductPrice.objects.create(
+                product=self.apple, price=Decimal("100"), currency=self.currency
+            ),
+            "image": lambda: ProductImage.objects.create(
+                product=self.apple, tag="icon", image="product_images/apple.png"
+            ),
+            "inventory": lambda: self.add_purchased_batch(self.apple),
+            "tag": lambda: self.apple.tags.add(self.tag),
+        }
+        for name, change in changes.items():
+            with self.subTest(change=name):
+                self.cached_entries()
+                self.assertEqual(self.cached_entries(), {"listing": True, "apple": True, "pear": True})
+
+                with self.captureOnCommitCallbacks(execute=True):
+                    change()
+
+                self.assertEqual(self.cached_entries(), {"listing": False, "apple": False, "pear": True})
+
+    def test_catalog_changes_invalidate_every_entry(self):
+        changes = {
+            "category": lambda: Category.objects.filter(pk=self.category.pk).first().save(),
+            "new product": lambda: Product.objects.create(name="Plum", sku="PLUM", category=self.category),
+        }
+        for name, change in changes.items():
+            with self.subTest(change=name):
+                self.cached_entries()
+
+                with self.captureOnCommitCallbacks(execute=True):
+                    change()
+
+                self.assertEqual(self.cached_entries(), {"listing": False, "apple": False, "pear": False})
+
+    def test_entries_are_cached_per_user_and_language(self):
+        self.assertFalse(self.is_cached(self.listing_url))
+        self.assertTrue(self.is_cached(self.listing_url))
+
+        self.client.force_login(User.objects.create(username="cached-customer"))
+        with CaptureQueriesContext(connection) as anonymous_miss:
+            self.client.get(self.listing_url)
+        with CaptureQueriesContext(connection) as user_hit:
+            self.client.get(self.listing_url)
+        self.assertGreater(len(anonymous_miss), len(user_hit))
+
+        with CaptureQueriesContext(connection) as language_miss:
+            self.client.get(self.listing_url, headers={"Accept-Language": "ja"})
+        self.assertGreater(len(language_miss), len(user_hit))
+
+
+class KeysetCursorPaginationTests(TestCase):
+    """
+    Cursors page through rows sharing a timestamp without skipping or repeating any of them
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.currency = Currency.objects.create(code="JPY", name="Yen")
+        category = Category.objects.create(name="Paged")
+        cls.products = [
+            Product.objects.create(name=f"Paged {i}", sku=f"PAGED-{i}", category=category) for i in range(5)
+        ]
+        # every product ties on created_at, only the id orders them
+        Product.objects.update(created_at=timezone.now() - datetime.timedelta(days=1))
+        cls.admin = User.objects.create(username="paging-admin", is_staff=True, is_superuser=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_page(self, url: str) -> dict:
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return response.json()
+
+    def walk(self, url: str, link: str = "next") -> tuple[list[list[int]], dict]:
+        """
+        :return: ids of each page following the links, and the last page
+        """
+        pages = []
+        while url:
+            page = self.get_page(url)
+            pages.append([item["id"] for item in page["results"]])
+            url = page[link]
+        return pages, page
+
+    def test_pages_of_tied_products_follow_the_id(self):
+        ids = sorted((product.id for product in self.products), reverse=True)
+
+        pages, last_page = self.walk("/ecommerce/v2/products-with-icon-image-paginated/?page_size=2")
+
+        self.assertEqual(pages, [ids[0:2], ids[2:4], ids[4:]])
+        self.assertNotIn("count", last_page)
+        previous_pages, _ = self.walk(last_page["previous"], link="previous")
+        self.assertEqual(previous_pages, [ids[2:4], ids[0:2]])
+
+    def test_products_added_while_paging_dont_shift_the_pages(self):
+        ids = sorted((product.id for product in self.products), reverse=True)
+        first_page = self.get_page("/ecommerce/v2/products-with-icon-image-paginated/?page_size=2")
+        # newer and with a higher id, so it sorts before every page already served
+        Product.objects.create(name="Paged new", sku="PAGED-NEW", category=self.products[0].category)
+
+        pages, _ = self.walk(first_page["next"])
+
+        self.assertEqual(pages, [ids[2:4], ids[4:]])
+
+    def test_v1_listing_keeps_page_numbers(self):
+        page = self.get_page("/ecommerce/v1/products-with-icon-image-paginated/")
+        self.assertEqual(page["count"], 5)
+        self.assertEqual(
+            [item["id"] for item in page["results"]],
+            sorted((product.id for product in self.products), reverse=True),
+        )
+
+    def test_purchases_only_page_when_asked(self):
+        purchased_at = timezone.now()
+        purchases = [
+            Purchase.objects.create(
+                product=product,
+                quantity=1,
+                price_per_unit=Decimal("10"),
+                currency=self.currency,
+                purchase_datetime=purchased_at,
+            )
+            for product in self.products
+        ]
+        ids = sorted((purchase.id for purchase in purchases), reverse=True)
+        self.client.force_login(self.admin)
+
+        self.assertEqual([item["id"] for item in self.get_page("/ecommerce/v1/purchases/")], ids)
+        pages, _ = self.walk("/ecommerce/v1/purchases/?page_size=3")
+        self.assertEqual(pages, [ids[0:3], ids[3:]])
+
+
+class FXRateMatrixMemoTests(TestCase):
+    """
+    The active FX rates are loaded once per process and again after a version bump
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.jpy = Currency.objects.create(code="JPY", name="Yen")
+        cls.usd = Currency.objects.create(code="USD", name="Dollar")
+
+    def setUp(self):
+        # memoized matrices outlive the rolled back rows of other tests
+        bump_fx_rate_matrix_version()
+
+    def add_rate(self, rate: str) -> FXRate:
+        with self.captureOnCommitCallbacks(execute=True):
+            FXRate.objects.filter(currency_from=self.usd, currency_to=self.jpy, end_date__isnull=True).update(
+                end_date=timezone.now().date()
+            )
+            return FXRate.objects.create(
+                currency_from=self.usd, currency_to=self.jpy, rate=Decimal(rate), start_date=timezone.now().date()
+            )
+
+    def usd_jpy(self) -> Decimal:
+        return get_fx_rate_matrix().as_dict()[(self.usd.id, self.jpy.id)]
+
+    def test_matrix_is_loaded_once_until_rates_change(self):
+        self.add_rate("150")
+        self.assertEqual(self.usd_jpy(), Decimal("150"))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.usd_jpy(), Decimal("150"))
+
+        self.add_rate("155")
+        self.assertEqual(self.usd_jpy(), Decimal("155"))
+
+    def test_other_processes_bumps_are_seen_on_the_next_version_check(self):
+        self.add_rate("150")
+        self.usd_jpy()
+        # what a bump by another process sharing the cache looks like to this one
+        FXRate.objects.filter(currency_from=self.usd, currency_to=self.jpy).update(rate=Decimal("160"))
+        cache.incr(FX_RATE_MATRIX_VERSION_KEY)
+
+        self.assertEqual(self.usd_jpy(), Decimal("150"))
+        with override_settings(MEMO_VERSION_CHECK_INTERVAL=-1):
+            self.assertEqual(self.usd_jpy(), Decimal("160"))
+
+    def test_matrices_are_reloaded_after_max_age(self):
+        self.add_rate("150")
+        self.usd_jpy()
+        FXRate.objects.filter(currency_from=self.usd, currency_to=self.jpy).update(rate=Decimal("160"))
+
+        with override_settings(FX_RATE_MATRIX_MAX_AGE=-1):
+            self.assertEqual(self.usd_jpy(), Decimal("160"))
+
+
+class ChartOfAccountsMemoTests(TestCase):
+    """
+    The chart of accounts shares the versioned memo of the FX rates
+    """
+
+    def setUp(self):
+        bump_chart_of_accounts_version()
+
+    def tearDown(self):
+        # the memoized chart outlives the rolled back accounts
+        bump_chart_of_accounts_version()
+
+    def test_chart_is_loaded_once_until_accounts_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Account.objects.create(code=CASH_ACCOUNT_CODE, name="Cash", account_type="asset")
+        self.assertEqual(get_account(CASH_ACCOUNT_CODE).name, "Cash")
+        with self.assertNumQueries(0):
+            get_account(CASH_ACCOUNT_CODE)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Account.objects.filter(code=CASH_ACCOUNT_CODE).first().save()
+        with self.assertNumQueries(1):
+            get_account(CASH_ACCOUNT_CODE)
+
+    def test_missing_codes_reload_the_chart_once(self):
+        get_chart_of_accounts()
+        # created by another process, without a shared cache this process hasn't seen the bump
+        Account.objects.bulk_create([Account(code=SALES_ACCOUNT_CODE, name="Sales", account_type="income")])
+
+        with self.assertNumQueries(1):
+            self.assertEqual(get_account(SALES_ACCOUNT_CODE).name, "Sales")
+        with self.assertNumQueries(1), self.assertRaises(Account.DoesNotExist):
+            get_account("9999")
+
+    def test_charts_are_reloaded_after_max_age(self):
+        get_chart_of_accounts()
+        Account.objects.bulk_create([Account(code=SALES_ACCOUNT_CODE, name="Sales", account_type="income")])
+
+        with override_settings(CHART_OF_ACCOUNTS_MAX_AGE=-1):
+            self.assertIn(SALES_ACCOUNT_CODE, get_chart_of_accounts())
+
+
+class FXRateHistoryTests(TestCase):
+    """
+    Dated amounts are converted with the rate that was active on their date
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.jpy = Currency.objects.create(code="JPY", name="Yen")
+        cls.usd = Currency.objects.create(code="USD", name="Dollar")
+        cls.eur = Currency.objects.create(code="EUR", name="Euro")
+        for currency, rate, start_date, end_date in [
+            (cls.usd, "140", datetime.date(2025, 1, 1), datetime.date(2025, 2, 1)),
+            # replaced on the day it started, never active at the end of a day
+            (cls.usd, "999", datetime.date(2025, 2, 1), datetime.date(2025, 2, 1)),
+            (cls.usd, "150", datetime.date(2025, 2, 1), datetime.date(2025, 3, 1)),
+            (cls.usd, "145", datetime.date(2025, 3, 1), None),
+            (cls.eur, "160", datetime.date(2025, 2, 15), None),
+        ]:
+            FXRate.objects.create(
+                currency_from=currency, currency_to=cls.jpy, rate=Decimal(rate), start_date=start_date, end_date=end_date
+            )
+
+    def setUp(self):
+        bump_fx_rate_matrix_version()
+
+    def test_rates_as_of_a_date(self):
+        history = get_fx_rate_history("JPY")
+        for as_of, rate in [
+            (datetime.date(2024, 12, 1), "140"),  # before the first rate
+            (datetime.date(2025, 1, 31), "140"),
+            (datetime.date(2025, 2, 1), "150"),
+            (datetime.date(2025, 2, 28), "150"),
+            (datetime.date(2025, 3, 1), "145"),
+            (datetime.date(2026, 1, 1), "145"),
+        ]:
+            with self.subTest(as_of=as_of):
+                self.assertEqual(history.rate_as_of("USD", as_of), Decimal(rate))
+        self.assertEqual(history.rate_as_of("JPY", datetime.date(2025, 1, 1)), Decimal("1"))
+        self.assertIsNone(history.rate_as_of("GBP", datetime.date(2025, 1, 1)))
+
+    def test_vectorized_conversion_matches_row_by_row_lookups(self):
+        history = get_fx_rate_history("JPY")
+        rows = [
+            (10, "USD", datetime.date(2025, 1, 15)),
+            (20, "USD", datetime.date(2025, 2, 1)),
+            (30, "EUR", datetime.date(2025, 2, 15)),
+            (40, "JPY", datetime.date(2025, 2, 15)),
+            (50, "USD", datetime.date(2025, 3, 10)),
+            (60, "EUR", datetime.date(2025, 1, 1)),
+        ]
+        amounts, codes, dates = zip(*rows)
+        converted = history.convert(amounts, codes, dates)
+        expected = [float(amount * history.rate_as_of(code, as_of)) for amount, code, as_of in rows]
+        self.assertEqual(converted.tolist(), expected)
+        self.assertEqual(
+            convert_amount_from_one_currency_code_to_another_as_of(10, "USD", "JPY", datetime.date(2025, 2, 10)),
+            Decimal("1500"),
+        )
+        with self.assertRaises(ValueError):
+            history.convert([1], ["GBP"], [datetime.date(2025, 1, 1)])
+
+
+class CrossRateTests(TestCase):
+    """
+    Cross rates triangulated in bulk match the ones of the former per pair formula
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.jpy = Currency.objects.create(code="JPY", name="Yen")
+        cls.usd = Currency.objects.create(code="USD", name="Dollar")
+        cls.eur = Currency.objects.create(code="EUR", name="Euro")
+        cls.gbp = Currency.objects.create(code="GBP", name="Pound")
+        yesterday = timezone.now().date() - datetime.timedelta(days=1)
+        for ccy, rate in ((cls.usd, "150"), (cls.eur, "160.5"), (cls.gbp, "190.25")):
+            FXRate.objects.create(currency_from=cls.jpy, currency_to=ccy, rate=Decimal(rate), start_date=yesterday)
+            FXRate.objects.create(currency_from=ccy, currency_to=cls.jpy, rate=1 / Decimal(rate), start_date=yesterday)
+
+    def active_rate(self, currency_from: Currency, currency_to: Currency) -> Decimal:
+        return FXRate.objects.get(currency_from=currency_from, currency_to=currency_to, end_date__isnull=True).rate
+
+    def test_cross_rates_match_the_per_pair_formula(self):
+        create_or_udpate_fx_rate_given_against_primary_ccy_rate(
+            {"currency_from_id": self.jpy.id, "currency_to_id": self.usd.id, "rate": "155"}
+        )
+
+        jpy_usd = self.active_rate(self.jpy, self.usd)
+        self.assertEqual(jpy_usd, Decimal("155"))
+        for other_ccy in (self.eur, self.gbp):
+            jpy_other = self.active_rate(self.jpy, other_ccy)
+            # the former calculate_and_save_ccy_to_other_ccy_fx_rate: other rate against primary / ccy rate
+            expected = {
+                (self.usd, other_ccy): jpy_other / jpy_usd,
+                (other_ccy, self.usd): jpy_usd / jpy_other,
+            }
+            for (currency_from, currency_to), rate in expected.items():
+                self.assertEqual(self.active_rate(currency_from, currency_to), rate.quantize(Decimal("0.000001")))
+        self.assertFalse(FXRate.objects.filter(currency_from=self.eur, currency_to=self.gbp).exists())
+
+    def test_zero_and_negative_rates_are_rejected(self):
+        for rate in ("0", "-150"):
+            with self.subTest(rate=rate), self.assertRaises(ValueError):
+                create_or_udpate_fx_rate_given_against_primary_ccy_rate(
+                    {"currency_from_id": self.jpy.id, "currency_to_id": self.usd.id, "rate": rate}
+                )
+        self.assertEqual(self.active_rate(self.jpy, self.usd), Decimal("150"))
+
+        FXRate.objects.filter(currency_from=self.jpy, currency_to=self.eur).update(rate=Decimal("0"))
+        with self.assertRaises(ValueError):
+            recompute_cross_rates(self.jpy, [self.usd.id])
+        self.assertFalse(FXRate.objects.filter(currency_from=self.usd, currency_to=self.gbp).exists())
+
+
+class FXRateFeedSwapTests(TestCase):
+    """
+    A rate vector replaces the active FX rates all at once or not at all
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.jpy = Currency.objects.create(code="JPY", name="Yen")
+        cls.usd = Currency.objects.create(code="USD", name="Dollar")
+        cls.eur = Currency.objects.create(code="EUR", name="Euro")
+        swap_active_fx_rates("JPY", {"USD": Decimal("0.0064"), "EUR": Decimal("0.006")})
+
+    def active_rates(self) -> dict:
+        return {
+            (fx_rate.currency_from.code, fx_rate.currency_to.code): fx_rate.rate
+            for fx_rate in FXRate.objects.filter(end_date__isnull=True).select_related("currency_from", "currency_to")
+        }
+
+    def test_changed_rates_are_replaced(self):
+        report = swap_active_fx_rates("JPY", {"USD": Decimal("0.0064"), "EUR": Decimal("0.008")})
+
+        self.assertEqual((report["updated"], report["unchanged"], report["created"], report["ended"]), (4, 2, 0, 0))
+        active_rates = self.active_rates()
+        self.assertEqual(len(active_rates), 6)
+        self.assertEqual(active_rates[("JPY", "EUR")], Decimal("0.008"))
+        self.assertEqual(active_rates[("USD", "EUR")], Decimal("1.25"))
+        self.assertEqual(active_rates[("JPY", "USD")], Decimal("0.0064"))
+
+    def test_failed_swap_keeps_the_active_rates(self):
+        active_rates = self.active_rates()
+        with (
+            self.captureOnCommitCallbacks() as callbacks,
+            mock.patch.object(FXRate.objects, "bulk_create", side_effect=DatabaseError("disk full")),
+            self.assertRaises(DatabaseError),
+        ):
+            swap_active_fx_rates("JPY", {"USD": Decimal("0.007"), "EUR": Decimal("0.008")})
+
+        # the end dating that ran before the failed insert is rolled back with it
+        self.assertEqual(self.active_rates(), active_rates)
+        self.assertFalse(FXRate.objects.filter(end_date__isnull=False).exists())
+        # and no process is told to reload its FX rate matrix
+        self.assertEqual(callbacks, [])
+
+    def test_dry_run_writes_nothing(self):
+        active_rates = self.active_rates()
+        with CaptureQueriesContext(connection) as queries:
+            report = swap_active_fx_rates("JPY", {"USD": Decimal("0.007")}, dry_run=True)
+
+        self.assertEqual((report["updated"], report["ended"]), (2, 4))
+        self.assertFalse([query for query in queries if query["sql"].startswith(("INSERT", "UPDATE"))])
+        self.assertEqual(self.active_rates(), active_rates)
+
+
+@override_settings(ACCOUNTING_CURRENCY="JPY")
+class TotalInAccountingCurrencyTests(TestCase):
+    """
+    Totals summed per currency in SQL equal the totals of converting every row in Python
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.jpy = Currency.objects.create(code="JPY", name="Yen")
+        cls.usd = Currency.objects.create(code="USD", name="Dollar")
+        cls.uzs = Currency.objects.create(code="UZS", name="Sum")  # no rate, its rows are skipped
+        FXRate.objects.create(
+            currency_from=cls.usd, currency_to=cls.jpy, rate=Decimal("151.37"), start_date=datetime.date(2025, 1, 1)
+        )
+        cls.admin = User.objects.create(username="totals-admin", is_staff=True, is_superuser=True)
+        product = Product.objects.create(name="Totals", sku="TOTALS", category=Category.objects.create(name="Totals"))
+        customer = Customer.objects.create(user=User.objects.create(username="totals-customer"))
+        income_name = IncomeName.objects.create(name="Sales")
+        spending_name = SpendingName.objects.create(name="Shipping")
+        today = timezone.now()
+        rows = [
+            (cls.jpy, 3, "1200", 1500.5),
+            (cls.usd, 2, "10.15", 0.1),
+            (cls.usd, 7, "3.33", 19.99),
+            (cls.uzs, 1, "50000", 50000.0),
+            (None, 1, "10", 10.0),
+        ]
+        for days_ago, (currency, quantity, price, amount) in enumerate(rows):
+            at = today - datetime.timedelta(days=days_ago)
+            Purchase.objects.create(
+                product=product,
+                quantity=quantity,
+                price_per_unit=Decimal(price),
+                currency=currency,
+                purchase_datetime=at,
+            )
+            Order.objects.filter(
+                pk=Order.objects.create(customer=customer, total_amount=Decimal(price), currency=currency).pk
+            ).update(created_at=at)
+            Income.objects.create(income_name=income_name, adate=at.date(), amount=amount, currency=currency)
+            Spending.objects.create(spending_name=spending_name, adate=at.date(), amount=amount, currency=currency)
+
+    def setUp(self):
+        bump_fx_rate_matrix_version()
+        self.client.force_login(self.admin)
+
+    def python_total(self, rows, amount) -> Decimal:
+        # how the views totalled rows before the sums moved to SQL
+        rates = {"JPY": Decimal("1.0"), "USD": Decimal("151.37")}
+        total = Decimal("0.00")
+        for row in rows:
+            rate = rates.get(row.currency.code if row.currency else None)
+            if rate is not None:
+                total += amount(row) * rate
+        return round(total, 2)
+
+    def get_total(self, name: str, query: str = "") -> Decimal:
+        response = self.client.get(f"/ecommerce/v1/{name}-total-in-accounting-currency/{query}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["currency"], "JPY")
+        return Decimal(str(response.json()["amount"]))
+
+    def test_totals_equal_the_row_by_row_conversion(self):
+        start_date = (timezone.now() - datetime.timedelta(days=2)).date()
+        end_date = (timezone.now() - datetime.timedelta(days=1)).date()
+        ranges = {
+            "": lambda queryset, field: queryset,
+            f"?start_date={start_date}&end_date={end_date}": lambda queryset, field: queryset.filter(
+                **{f"{field}__date__gte": start_date, f"{field}__date__lte": end_date}
+            ),
+        }
+        for query, in_range in ranges.items():
+            with self.subTest(query=query):
+                self.assertEqual(
+                    self.get_total("purchase", query),
+                    self.python_total(
+                        in_range(Purchase.objects.all(), "purchase_datetime"),
+                        lambda p: Decimal(p.quantity) * p.price_per_unit,
+                    ),
+                )
+                self.assertEqual(
+                    self.get_total("order", query),
+                    self.python_total(in_range(Order.objects.all(), "created_at"), lambda o: o.total_amount),
+                )
+                for name, model in [("income", Income), ("spending", Spending)]:
+                    rows = model.objects.all()
+                    if query:
+                        rows = rows.filter(adate__gte=start_date, adate__lte=end_date)
+                    self.assertEqual(
+                        self.get_total(name, query), self.python_total(rows, lambda row: Decimal(row.amount))
+                    )
+
+    def test_totals_run_one_sum_query(self):
+        get_fx_rate_matrix()
+        queryset = Purchase.objects.all()
+        with self.assertNumQueries(1):
+            total_in_accounting_currency(queryset, F("quantity") * F("price_per_unit"))
+
+
+@override_settings(ACCOUNTING_CURRENCY="JPY")
+class PurchaseSummaryByDateTests(TestCase):
+    """
+    The summary grouped by date and currency in SQL equals summing every purchase in Python
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.jpy = Currency.objects.create(code="JPY", name="Yen")
+        cls.usd = Currency.objects.create(code="USD", name="Dollar")
+        for rate, start_date, end_date in [
+            ("140", datetime.date(2025, 1, 1), datetime.date(2025, 2, 1)),
+            ("150", datetime.date(2025, 2, 1), None),
+        ]:
+            FXRate.objects.create(
+                currency_from=cls.usd, currency_to=cls.jpy, rate=Decimal(rate), start_date=start_date, end_date=end_date
+            )
+        cls.admin = User.objects.create(username="summary-admin", is_staff=True, is_superuser=True)
+        product = Product.objects.create(name="Summary", sku="SUMMARY", category=Category.objects.create(name="Sum"))
+        for purchased_at, currency, quantity, price in [
+            (datetime.datetime(2025, 1, 31, 0, 5), cls.usd, 2, "10.15"),
+            (datetime.datetime(2025, 1, 31, 23, 55), cls.jpy, 3, "1200"),
+            (datetime.datetime(2025, 1, 31, 12), cls.usd, 1, "0.99"),
+            (datetime.datetime(2025, 2, 1, 8), cls.usd, 7, "3.33"),
+            (datetime.datetime(2025, 2, 1, 9), None, 1, "500"),
+            (datetime.datetime(2025, 3, 2, 10), cls.jpy, 4, "75.5"),
+        ]:
+            Purchase.objects.create(
+                product=product,
+                quantity=quantity,
+                price_per_unit=Decimal(price),
+                currency=currency,
+                purchase_datetime=timezone.make_aware(purchased_at, datetime.timezone.utc),
+            )
+
+    def setUp(self):
+        bump_fx_rate_matrix_version()
+        self.client.force_login(self.admin)
+
+    def python_summary(self) -> list[dict]:
+        # how the view summed purchases before grouping them in SQL
+        history = get_fx_rate_history("JPY")
+        totals = {}
+        for purchase in Purchase.objects.all():
+            purchase_date = purchase.purchase_datetime.date()
+            currency = purchase.currency.code if purchase.currency else "JPY"
+            amount = purchase.quantity * float(purchase.price_per_unit)
+            count, total = totals.get(purchase_date, (0, 0.0))
+            totals[purchase_date] = (count + 1, total + amount * float(history.rate_as_of(currency, purchase_date)))
+        return [
+            {"purchase_date": purchase_date.isoformat(), "num_purchases": count, "amount": total}
+            for purchase_date, (count, total) in sorted(totals.items(), reverse=True)
+        ]
+
+    def test_summary_equals_the_per_purchase_sum(self):
+        response = self.client.get("/ecommerce/v1/purchases-summary-by-date/")
+        self.assertEqual(response.status_code, 200)
+        summary = response.json()
+
+        expected = self.python_summary()
+        self.assertEqual(
+            [(row["purchase_date"], row["num_purchases"], row["currency_code"]) for row in summary],
+            [(row["purchase_date"], row["num_purchases"], "JPY") for row in expected],
+        )
+        for row, expected_row in zip(summary, expected):
+            self.assertAlmostEqual(row["amount"], expected_row["amount"], places=6)
+
+
+class TrialBalanceTests(TestCase):
+    """
+    Balances read from a snapshot plus the entries after it equal summing every line
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = timezone.localdate()
+        assets = Account.objects.create(code="1", name="Assets", account_type="asset")
+        cls.cash = Account.objects.create(code=CASH_ACCOUNT_CODE, name="Cash", account_type="asset", parent=assets)
+        Account.objects.create(code=INVENTORY_ACCOUNT_CODE, name="Inventory", account_type="asset", parent=assets)
+        Account.objects.create(code=ACCOUNTS_PAYABLE_ACCOUNT_CODE, name="AP", account_type="liability")
+        Account.objects.create(code=SALES_ACCOUNT_CODE, name="Sales", account_type="income")
+        Account.objects.create(code=COGS_ACCOUNT_CODE, name="COGS", account_type="expense")
+        cls.admin = User.objects.create(username="ledger-admin", is_staff=True, is_superuser=True)
+
+    def setUp(self):
+        # accounts of other tests with the same codes may still be memoized
+        bump_chart_of_accounts_version()
+
+    def post(self, days_ago: int, debit_account_code: str, credit_account_code: str, amount: str) -> JournalEntry:
+        journal_batch = JournalBatch()
+        journal_entry = journal_batch.add_entry(f"{days_ago} days ago")
+        journal_batch.add_transfer(journal_entry, debit_account_code, credit_account_code, Decimal(amount))
+        journal_batch.flush()
+        JournalEntry.objects.filter(pk=journal_entry.pk).update(date=self.today - datetime.timedelta(days=days_ago))
+        return journal_entry
+
+    def full_scan(self, as_of: datetime.date) -> dict[int, tuple[Decimal, Decimal]]:
+        # every line up to as_of, how balances were computed before snapshots
+        return {
+            account_id: (debit, credit)
+            for account_id, debit, credit in JournalEntryLine.objects.filter(journal_entry__date__lte=as_of)
+            .values("account_id")
+            .annotate(debit=Sum("debit"), credit=Sum("credit"))
+            .values_list("account_id", "debit", "credit")
+        }
+
+    def assert_balances_match_a_full_scan(self):
+        for days_ago in [12, 10, 7, 6, 4, 1, 0]:
+            as_of = self.today - datetime.timedelta(days=days_ago)
+            with self.subTest(as_of=as_of):
+                self.assertEqual(get_account_balances(as_of), self.full_scan(as_of))
+
+    def test_snapshot_plus_later_entries_equals_a_full_scan(self):
+        self.post(10, INVENTORY_ACCOUNT_CODE, ACCOUNTS_PAYABLE_ACCOUNT_CODE, "100")
+        self.post(8, CASH_ACCOUNT_CODE, SALES_ACCOUNT_CODE, "40.50")
+        self.post(8, COGS_ACCOUNT_CODE, INVENTORY_ACCOUNT_CODE, "25")
+        self.assertEqual(take_balance_snapshot(self.today - datetime.timedelta(days=7)), 5)
+        self.post(5, CASH_ACCOUNT_CODE, SALES_ACCOUNT_CODE, "12.25")
+        self.post(0, ACCOUNTS_PAYABLE_ACCOUNT_CODE, CASH_ACCOUNT_CODE, "30")
+
+        self.assert_balances_match_a_full_scan()
+
+        self.client.force_login(self.admin)
+        trial_balance = self.client.get("/ecommerce/v1/trial-balance/").json()
+        self.assertTrue(trial_balance["is_balanced"])
+        self.assertEqual(Decimal(str(trial_balance["total_debit"])), Decimal("207.75"))
+        rows = {row["code"]: row for row in trial_balance["accounts"]}
+        self.assertEqual(Decimal(str(rows[CASH_ACCOUNT_CODE]["balance"])), Decimal("22.75"))
+        self.assertEqual(Decimal(str(rows["1"]["total_balance"])), Decimal("97.75"))
+
+    def test_changes_before_a_snapshot_drop_it(self):
+        self.post(10, INVENTORY_ACCOUNT_CODE, ACCOUNTS_PAYABLE_ACCOUNT_CODE, "100")
+        moved = self.post(3, CASH_ACCOUNT_CODE, SALES_ACCOUNT_CODE, "40")
+        take_balance_snapshot(self.today - datetime.timedelta(days=7))
+        take_balance_snapshot(self.today - datetime.timedelta(days=2))
+
+        with self.assertLogs("ecommerce.viewsets.accounting.balances", "INFO"):
+            moved = JournalEntry.objects.get(pk=moved.pk)
+            moved.date = self.today - datetime.timedelta(days=9)
+            moved.save()
+        self.assertEqual(list(AccountBalanceSnapshot.objects.values_list("as_of", flat=True).distinct()), [])
+        self.assert_balances_match_a_full_scan()
+
+        take_balance_snapshot(self.today - datetime.timedelta(days=7))
+        line = JournalEntryLine.objects.get(account=self.cash)
+        line.debit = line.credit = Decimal("0")
+        line.save()
+        self.assertFalse(AccountBalanceSnapshot.objects.exists())
+        self.assert_balances_match_a_full_scan()
+
+
+class JournalBatchTests(TestCase):
+    """
+    Batches write balanced entries with two bulk inserts and skip entries without lines
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Account.objects.create(code=CASH_ACCOUNT_CODE, name="Cash", account_type="asset")
+        Account.objects.create(code=SALES_ACCOUNT_CODE, name="Sales", account_type="income")
+
+    def setUp(self):
+        # accounts of other tests with the same codes may still be memoized
+        bump_chart_of_accounts_version()
+
+    def test_entries_without_lines_are_dropped(self):
+        journal_batch = JournalBatch()
+        journal_batch.add_entry("adjustment by 0")
+        sale = journal_batch.add_entry("sale")
+        journal_batch.add_transfer(sale, CASH_ACCOUNT_CODE, SALES_ACCOUNT_CODE, 0.1 + 0.2)
+
+        self.assertEqual(journal_batch.flush(), [sale])
+
+        self.assertEqual(list(JournalEntry.objects.values_list("description", flat=True)), ["sale"])
+        self.assertEqual(
+            list(JournalEntryLine.objects.order_by("id").values_list("account__code", "debit", "credit")),
+            [(CASH_ACCOUNT_CODE, Decimal("0.30"), Decimal("0")), (SALES_ACCOUNT_CODE, Decimal("0"), Decimal("0.30"))],
+        )
+        self.assertEqual(len(journal_batch), 0)
+
+    def test_batch_of_empty_entries_writes_nothing(self):
+        journal_batch = JournalBatch()
+        journal_batch.add_entry("adjustment by 0")
+        with self.assertNumQueries(0):
+            self.assertEqual(journal_batch.flush(), [])
+        self.assertEqual(len(journal_batch), 0)
+
+    def test_unbalanced_batches_write_nothing(self):
+        journal_batch = JournalBatch()
+        balanced = journal_batch.add_entry("balanced")
+        journal_batch.add_transfer(balanced, CASH_ACCOUNT_CODE, SALES_ACCOUNT_CODE, Decimal("10"))
+        unbalanced = journal_batch.add_entry("unbalanced")
+        journal_batch.add_line(unbalanced, CASH_ACCOUNT_CODE, debit=Decimal("10"))
+        journal_batch.add_line(unbalanced, SALES_ACCOUNT_CODE, credit=Decimal("9.99"))
+
+        with self.assertRaisesMessage(ValueError, "unbalanced (debit 10.00, credit 9.99)"):
+            journal_batch.flush()
+        self.assertFalse(JournalEntry.objects.exists())
+
+        other_batch = JournalBatch()
+        other_batch.add_line(balanced, CASH_ACCOUNT_CODE, debit=Decimal("1"))
+        other_batch.add_entry("other")
+        with self.assertRaisesMessage(ValueError, "belongs to an entry of another batch"):
+            other_batch.flush()
+
+    def test_unknown_accounts_write_nothing(self):
+        journal_batch = JournalBatch()
+        journal_batch.add_transfer(journal_batch.add_entry("sale"), CASH_ACCOUNT_CODE, "9999", Decimal("10"))
+        with self.assertRaises(Account.DoesNotExist):
+            journal_batch.flush()
+        self.assertFalse(JournalEntry.objects.exists())
+
+    def test_flush_queries_dont_grow_with_entries(self):
+        query_counts = []
+        for entries in [1, 10]:
+            journal_batch = JournalBatch()
+            for i in range(entries):
+                journal_batch.add_transfer(
+                    journal_batch.add_entry(f"sale {i}"), CASH_ACCOUNT_CODE, SALES_ACCOUNT_CODE, Decimal("10")
+                )
+            get_accounts([CASH_ACCOUNT_CODE, SALES_ACCOUNT_CODE])
+            with CaptureQueriesContext(connection) as queries:
+                journal_batch.flush()
+            query_counts.append(len(queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+        self.assertEqual(JournalEntry.objects.count(), 11)
+
+
+class RepricingTests(TestCase):
+    """
+    Prices computed for the whole catalog with NumPy equal the ones of pricing every product on its own
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.jpy = Currency.objects.create(code="JPY", name="Yen")
+        cls.usd = Currency.objects.create(code="USD", name="Dollar")
+        cls.eur = Currency.objects.create(code="EUR", name="Euro")
+        uzs = Currency.objects.create(code="UZS", name="Sum")  # no rate, its products are skipped
+        for currency, rate in ((cls.usd, "151.37"), (cls.eur, "162.05")):
+            FXRate.objects.create(
+                currency_from=currency, currency_to=cls.jpy, rate=Decimal(rate), start_date=datetime.date(2025, 1, 1)
+            )
+        WeightCost.objects.create(cost_per_kg=8.5, currency=cls.usd)
+        ProfitRate.objects.create(profit_rate=0.3)
+        category = Category.objects.create(name="Repricing")
+        purchases = {
+            "usd": [(cls.eur, "5.00", 3), (cls.usd, "12.34", 1)],  # the last purchase sets the price
+            "jpy": [(cls.jpy, "980", 2)],
+            "eur": [(cls.eur, "7.77", 1)],
+            "uzs": [(uzs, "50000", 1)],
+            "none": [],
+        }
+        weights = {"usd": 0.75, "eur": 2.2}
+        cls.products = {}
+        for name, product_purchases in purchases.items():
+            product = Product.objects.create(name=f"Repriced {name}", sku=f"REPRICED-{name}", category=category)
+            for currency, price, days_ago in product_purchases:
+                Purchase.objects.create(
+                    product=product,
+                    quantity=1,
+                    price_per_unit=Decimal(price),
+                    currency=currency,
+                    purchase_datetime=timezone.now() - datetime.timedelta(days=days_ago),
+                )
+            if name in weights:
+                ProductWeight.objects.create(product=product, weight=weights[name])
+            cls.products[name] = product
+
+    def setUp(self):
+        bump_fx_rate_matrix_version()
+
+    def per_product_price(self, product: Product) -> Decimal | None:
+        # every product priced on its own, converting row by row
+        last_purchase = Purchase.objects.filter(product=product).order_by("-purchase_datetime", "-id").first()
+        if last_purchase is None:
+            return None
+        fx_rates = get_fx_rates_with_currency_codes()
+        weight_cost = WeightCost.objects.get(end_date__isnull=True)
+        product_weight = ProductWeight.objects.filter(product=product).first()
+        weight = product_weight.weight if product_weight else 0.1
+        try:
+            cost = convert_amount_from_one_currency_code_to_another(
+                float(last_purchase.price_per_unit), last_purchase.currency.code, "JPY", fx_rates
+            ) + convert_amount_from_one_currency_code_to_another(
+                weight * weight_cost.cost_per_kg, weight_cost.currency.code, "JPY", fx_rates
+            )
+        except ValueError:
+            return None
+        profit_rate = ProfitRate.objects.get(end_date__isnull=True).profit_rate
+        return Decimal(round(cost * (1 + profit_rate) * 100)).scaleb(-2)
+
+    def test_prices_equal_the_per_product_formula(self):
+        expected = {product.id: self.per_product_price(product) for product in self.products.values()}
+
+        report = reprice_products("JPY")
+
+        self.assertEqual(report["without_purchase"], [self.products["none"].id])
+        self.assertEqual(report["without_fx_rate"], [self.products["uzs"].id])
+        active_prices = dict(
+            ProductPrice.objects.filter(end_date__isnull=True, currency=self.jpy).values_list("product_id", "price")
+        )
+        self.assertEqual(active_prices, {product_id: price for product_id, price in expected.items() if price})
+        self.assertEqual(len(active_prices), 3)
+        for product in Product.objects.filter(id__in=active_prices):
+            self.assertEqual(product.current_price, active_prices[product.id])
+
+        report = reprice_products("JPY")
+        self.assertEqual((report["repriced"], report["unchanged"]), (0, 3))
+
+
+@override_settings(ACCOUNTING_CURRENCY="JPY")
+class ProductCSVImportTests(TestCase):
+    """
+    Each chunk of a product CSV is written in its own transaction, a failed chunk leaves nothing behind
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Currency.objects.create(code="JPY", name="Yen")
+        Account.objects.create(code=INVENTORY_ACCOUNT_CODE, name="Inventory", account_type="asset")
+        Account.objects.create(code=ACCOUNTS_PAYABLE_ACCOUNT_CODE, name="AP", account_type="liability")
+        cls.existing = Product.objects.create(
+            name="Existing", sku="EXISTING", description="Old", category=Category.objects.create(name="Old")
+        )
+
+    def import_rows(self, rows: list[tuple]) -> dict:
+        df = pd.DataFrame(rows, columns=["product_name", "category_name", "brand_name", "tag_names", "price", "stock"])
+        with self.captureOnCommitCallbacks(execute=True):
+            return bulk_import_products_from_dataframe(df, chunk_size=2)
+
+    def test_failed_chunk_is_rolled_back_with_its_lookups(self):
+        result = self.import_rows(
+            [
+                ("First", "Kept", "Kept brand", "kept", "10", 1),
+                ("Second", "Kept", None, None, "20", 2),
+                # the second chunk fails at its prices, after its products and lookups were written
+                ("Existing", "Dropped", "Dropped brand", "dropped", "30", 3),
+                ("Too expensive", "Dropped", None, "dropped", "1e20", 1),
+                ("Third", "Dropped", None, "dropped,kept", "40", 4),
+            ]
+        )
+
+        self.assertEqual((result["created"], result["updated"]), (3, 0))
+        self.assertEqual([error["row"] for error in result["errors"]], [2, 3])
+        self.assertFalse(Product.objects.filter(name="Too expensive").exists())
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.category.name, self.existing.brand), ("Old", None))
+        self.assertFalse(Brand.objects.filter(name="Dropped brand").exists())
+        # created again by the last chunk after the failed one was rolled back
+        third = Product.objects.get(name="Third")
+        self.assertEqual(third.category.name, "Dropped")
+        self.assertEqual(sorted(third.tags.values_list("name", flat=True)), ["dropped", "kept"])
+        self.assertEqual(ProductInventory.objects.get(product=third).total_inventory, 4)
+        self.assertEqual(Category.objects.filter(name="Dropped").count(), 1)
+
+
+class CurrentPriceTests(TestCase):
+    """
+    Product.current_price follows the active ProductPrice as prices are closed and opened
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.jpy = Currency.objects.create(code="JPY", name="Yen")
+        cls.usd = Currency.objects.create(code="USD", name="Dollar")
+        category = Category.objects.create(name="Prices")
+        cls.apple = Product.objects.create(name="Apple", sku="APPLE", category=category)
+        cls.pear = Product.objects.create(name="Pear", sku="PEAR", category=category)
+
+    def active_price(self, product: Product) -> ProductPrice | None:
+        # how the active price was read before it was denormalized
+        return ProductPrice.objects.filter(product=product, end_date__isnull=True).first()
+
+    def assert_current_price(self, product: Product, price, currency):
+        product.refresh_from_db()
+        self.assertEqual((product.current_price, product.current_currency), (price, currency))
+        active_price = self.active_price(product)
+        if active_price is None:
+            self.assertIsNone(product.current_price)
+        else:
+            self.assertEqual((active_price.price, active_price.currency), (price, currency))
+
+    def test_current_price_follows_closed_and_opened_prices(self):
+        self.assert_current_price(self.apple, None, None)
+
+        first = ProductPrice.objects.create(product=self.apple, price=Decimal("100"), currency=self.jpy)
+        self.assert_current_price(self.apple, Decimal("100"), self.jpy)
+
+        first.end_date = timezone.now().date()
+        first.save()
+        self.assert_current_price(self.apple, None, None)
+
+        ProductPrice.objects.create(product=self.apple, price=Decimal("2.50"), currency=self.usd)
+        self.assert_current_price(self.apple, Decimal("2.50"), self.usd)
+        self.assert_current_price(self.pear, None, None)
+
+    def test_deleting_the_active_price_clears_the_current_price(self):
+        price = ProductPrice.objects.create(product=self.apple, price=Decimal("100"), currency=self.jpy)
+        price.delete()
+        self.assert_current_price(self.apple, None, None)
+
+    def test_sync_repairs_prices_changed_without_signals(self):
+        ProductPrice.objects.create(product=self.apple, price=Decimal("100"), currency=self.jpy)
+        ProductPrice.objects.create(product=self.pear, price=Decimal("200"), currency=self.jpy)
+        ProductPrice.objects.update(price=Decimal("300"), currency=self.usd)
+
+        self.assertEqual(sync_current_prices([self.apple.id]), 1)
+        self.assert_current_price(self.apple, Decimal("300"), self.usd)
+        self.pear.refresh_from_db()
+        self.assertEqual(self.pear.current_price, Decimal("200"))
+
+        self.assertEqual(sync_current_prices(), 2)
+        self.assert_current_price(self.pear, Decimal("300"), self.usd)
+
+    def test_active_prices_are_loaded_in_one_query(self):
+        ProductPrice.objects.create(product=self.apple, price=Decimal("100"), currency=self.jpy)
+
+        with self.assertNumQueries(1):
+            products = get_active_prices([self.apple.id, self.pear.id])
+            prices = {
+                product_id: (product.current_price, product.current_currency and product.current_currency.code)
+                for product_id, product in products.items()
+            }
+
+        self.assertEqual(prices, {self.apple.id: (Decimal("100"), "JPY"), self.pear.id: (None, None)})
+
+
+@override_settings(ACCOUNTING_CURRENCY="JPY")
+class PurchaseCSVIngestorTests(TestCase):
+    """
+    Purchase CSVs are written chunk by chunk, each chunk in one transaction
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.jpy = Currency.objects.create(code="JPY", name="Yen")
+        cls.usd = Currency.objects.create(code="USD", name="Dollar")
+        Account.objects.create(code=INVENTORY_ACCOUNT_CODE, name="Inventory", account_type="asset")
+        Account.objects.create(code=ACCOUNTS_PAYABLE_ACCOUNT_CODE, name="AP", account_type="liability")
+        category = Category.objects.create(name="Purchases")
+        cls.apple = Product.objects.create(name="Apple", sku="APPLE", category=category)
+        cls.pear = Product.objects.create(name="Pear", sku="PEAR", category=category)
+
+    def ingest(self, csv: str) -> int:
+        with self.captureOnCommitCallbacks(execute=True):
+            return PurchaseCSVIngestor(chunk_size=2).ingest(io.StringIO(csv))
+
+    def test_chunks_are_ingested_with_their_batches_and_journal_entries(self):
+        processed = self.ingest(
+            "product_name,quantity,price_per_unit,currency,purchase_date\n"
+            "apple,2,10,USD,2025-01-05\n"
+            "Pear,3,20,,2025-01-06\n"
+            "Apple,4,30,JPY,\n"
+            # unknown codes are stored without a currency, like the row by row import did
+            "Pear,5,40,XXX,2025-01-07\n"
+            "Pear,6,50,JPY,2025-01-08\n"
+        )
+
+        self.assertEqual(processed, 5)
+        purchases = list(Purchase.objects.order_by("id"))
+        self.assertEqual(
+            [(p.product_id, p.quantity, p.currency_id) for p in purchases],
+            [
+                (self.apple.id, 2, self.usd.id),
+                (self.pear.id, 3, self.jpy.id),
+                (self.apple.id, 4, self.jpy.id),
+                (self.pear.id, 5, None),
+                (self.pear.id, 6, self.jpy.id),
+            ],
+        )
+        self.assertEqual(purchases[0].purchase_datetime.date(), datetime.date(2025, 1, 5))
+        self.assertEqual(
+            sorted(Inventory.objects.values_list("purchase_id", "stock", "purchase_datetime")),
+            [(p.id, p.quantity, p.purchase_datetime) for p in purchases],
+        )
+        self.assertEqual(
+            dict(ProductInventory.objects.values_list("product_id", "total_inventory")),
+            {self.apple.id: 6, self.pear.id: 14},
+        )
+        self.assertEqual(JournalEntry.objects.count(), 5)
+        self.assertTrue(all(entry.is_balanced for entry in JournalEntry.objects.all()))
+
+    def test_chunks_before_a_failed_one_stay_committed(self):
+        with self.assertRaisesMessage(ValueError, "Product not found: Plum (row 3)"):
+            self.ingest(
+                "product_name,quantity,price_per_unit\n"
+                "Apple,1,10\n"
+                "Pear,1,10\n"
+                "Apple,1,10\n"
+                "Plum,1,10\n"
+                "Pear,1,10\n"
+            )
+
+        self.assertEqual(Purchase.objects.count(), 2)
+        self.assertEqual(Inventory.objects.count(), 2)
+        self.assertEqual(JournalEntry.objects.count(), 2)
+
+    def test_missing_columns_are_rejected(self):
+        with self.assertRaisesMessage(ValueError, "Missing columns: ['price_per_unit']"):
+            self.ingest("product_name,quantity\nApple,1\n")
+        self.assertFalse(Purchase.objects.exists())
+
+
+@override_settings(
+    ACCOUNTING_CURRENCY="JPY",
+    STORAGES={"default": {"BACKEND": "django.core.files.storage.InMemoryStorage"}},
+)
+class ImportJobRunnerTests(TestCase):
+    """
+    Workers claim queued imports, fail the ones of crashed workers and give up jobs they don't own anymore
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Currency.objects.create(code="JPY", name="Yen")
+        Account.objects.create(code=INVENTORY_ACCOUNT_CODE, name="Inventory", account_type="asset")
+        Account.objects.create(code=ACCOUNTS_PAYABLE_ACCOUNT_CODE, name="AP", account_type="liability")
+        cls.apple = Product.objects.create(name="Apple", sku="APPLE", category=Category.objects.create(name="Jobs"))
+
+    def queue(self, kind: str, csv: str) -> ImportJob:
+        return ImportJob.objects.create(kind=kind, file=ContentFile(csv.encode(), name="import.csv"))
+
+    def claim(self, worker: str = "worker-1") -> ImportJob:
+        [job] = claim_import_jobs(1, worker)
+        return job
+
+    def test_jobs_are_claimed_once_oldest_first(self):
+        jobs = [self.queue(ImportJob.KIND_PURCHASES, "") for _ in range(3)]
+
+        self.assertEqual([job.id for job in claim_import_jobs(2, "worker-1")], [jobs[0].id, jobs[1].id])
+        self.assertEqual([job.id for job in claim_import_jobs(2, "worker-2")], [jobs[2].id])
+        self.assertEqual(claim_import_jobs(2, "worker-3"), [])
+        self.assertEqual(
+            list(ImportJob.objects.order_by("id").values_list("status", "worker")),
+            [(ImportJob.STATUS_RUNNING, "worker-1")] * 2 + [(ImportJob.STATUS_RUNNING, "worker-2")],
+        )
+
+    def test_stale_running_jobs_are_failed(self):
+        self.queue(ImportJob.KIND_PURCHASES, "")
+        stale = self.claim()
+        fresh = self.queue(ImportJob.KIND_PURCHASES, "")
+        ImportJob.objects.filter(pk=stale.pk).update(modified_at=timezone.now() - datetime.timedelta(hours=1))
+
+        claimed = claim_import_jobs(1, "worker-2", stale_after=60)
+
+        self.assertEqual([job.id for job in claimed], [fresh.id])
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, ImportJob.STATUS_FAILED)
+
+    def test_purchase_import_runs_to_the_end(self):
+        self.queue(ImportJob.KIND_PURCHASES, "product_name,quantity,price_per_unit\nApple,2,10\nApple,3,10\n")
+        job = self.claim()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            run_import_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed_rows), (ImportJob.STATUS_SUCCEEDED, 2))
+        self.assertEqual(ProductInventory.objects.get(product=self.apple).total_inventory, 5)
+
+    def test_purchase_and_order_import_stops_at_the_first_bad_row(self):
+        self.queue(
+            ImportJob.KIND_PURCHASES_AND_ORDERS,
+            "product_name,quantity,purchase_price,selling_price\nApple,2,10,\nPlum,1,10,\nApple,3,10,\n",
+        )
+        job = self.claim()
+
+        with self.assertLogs("ecommerce.viewsets.jobs.runner", "ERROR"):
+            run_import_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_FAILED)
+        self.assertIn("Product not found: Plum", job.message)
+        self.assertEqual((job.processed_rows, job.failed_rows), (1, 1))
+        self.assertEqual([error["row"] for error in job.errors], [1])
+        self.assertEqual(list(Purchase.objects.values_list("quantity", flat=True)), [2])
+
+    def test_job_failed_as_stale_is_given_up_by_its_worker(self):
+        self.queue(ImportJob.KIND_PURCHASES, "product_name,quantity,price_per_unit\nApple,2,10\n")
+        job = self.claim()
+        ImportJob.objects.filter(pk=job.pk).update(modified_at=timezone.now() - datetime.timedelta(hours=1))
+        fail_stale_import_jobs(stale_after=60)
+
+        with self.assertRaises(ImportJobLost):
+            update_import_job(job, processed_rows=1)
+        with self.assertLogs("ecommerce.viewsets.jobs.runner", "WARNING"):
+            run_import_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed_rows), (ImportJob.STATUS_FAILED, 0))
+        self.assertIn("stopped saving progress", job.message)
+
+
+class ImportJobHeartbeatTests(TransactionTestCase):
+    """
+    The heartbeat runs on its own connection, so it only sees committed jobs
+    """
+
+    def test_heartbeat_keeps_a_busy_job_fresh(self):
+        ImportJob.objects.create(kind=ImportJob.KIND_PURCHASES, file="import_jobs/import.csv")
+        [job] = claim_import_jobs(1, "worker-1")
+        ImportJob.objects.filter(pk=job.pk).update(modified_at=timezone.now() - datetime.timedelta(hours=1))
+
+        heartbeat = ImportJobHeartbeat(job, interval=0.01)
+        heartbeat.start()
+        time.sleep(0.2)
+        heartbeat.stop()
+
+        self.assertEqual(fail_stale_import_jobs(stale_after=60), 0)
+
+
+def create_batch(product: Product, currency: Currency, stock: int, days_ago: int, price=Decimal("10")) -> Inventory:
+    """
+    Inventory batch of a purchase made days_ago days ago
+    """
+    purchase = Purchase.objects.create(
+        product=product,
+        quantity=stock,
+        price_per_unit=price,
+        currency=currency,
+        purchase_datetime=timezone.now() - datetime.timedelta(days=days_ago),
+    )
+    return Inventory.objects.create(product=product, purchase=purchase, stock=stock, location="test")
+
+
+class ProductInventoryDeltaTests(TestCase):
+    """
+    Stock changes of a transaction are summed up and applied to the totals on commit,
+    the totals have to match a rebuild from the batches.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.currency = Currency.objects.create(code="JPY", name="Yen")
+        category = Category.objects.create(name="Totals")
+        cls.products = [
+            Product.objects.create(name=f"Totals product {i}", sku=f"TOTALS-{i}", category=category) for i in range(2)
+        ]
+
+    def totals(self) -> dict[int, int]:
+        return dict(ProductInventory.objects.values_list("product_id", "total_inventory"))
+
+    def assertTotalsMatchRebuild(self):
+        totals = self.totals()
+        rebuild_product_inventories()
+        self.assertEqual(totals, self.totals())
+
+    def test_deltas_match_a_rebuild(self):
+        first, second = self.products
+        with self.captureOnCommitCallbacks(execute=True):
+            batch = create_batch(first, self.currency, 5, days_ago=2)
+            create_batch(first, self.currency, 3, days_ago=1)
+            create_batch(second, self.currency, 4, days_ago=1)
+        self.assertEqual(self.totals(), {first.id: 8, second.id: 4})
+        self.assertTotalsMatchRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            batch.stock = 2
+            batch.save()
+        self.assertTotalsMatchRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            batch.product = second
+            batch.save()
+        self.assertEqual(self.totals(), {first.id: 3, second.id: 6})
+        self.assertTotalsMatchRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            batch.delete()
+        self.assertEqual(self.totals(), {first.id: 3, second.id: 4})
+        self.assertTotalsMatchRebuild()
+
+    def test_rebuilt_totals_count_later_savepoints_once(self):
+        product = self.products[0]
+        # the product has no total yet, so the first buffer run on commit rebuilds it from all batches
+        with self.captureOnCommitCallbacks(execute=True):
+            for stock in (2, 3, 4):
+                with transaction.atomic():
+                    create_batch(product, self.currency, stock, days_ago=1)
+        self.assertEqual(self.totals(), {product.id: 9})
+
+    def test_drifted_totals_are_rebuilt_instead_of_going_negative(self):
+        product = self.products[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            batch = create_batch(product, self.currency, 5, days_ago=1)
+        # bypasses the signals, so the total still counts 5
+        Inventory.objects.filter(id=batch.id).update(stock=9)
+        ProductInventory.objects.filter(product=product).update(total_inventory=1)
+
+        with self.assertLogs("ecommerce.viewsets.inventory.viewsets", "ERROR"):
+            with self.captureOnCommitCallbacks(execute=True):
+                batch.delete()
+        self.assertEqual(self.totals(), {product.id: 0})
+
+
+class InventoryPurchaseDatetimeTests(TestCase):
+    """
+    FIFO scans order batches on their own copy of the purchase datetime
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.currency = Currency.objects.create(code="JPY", name="Yen")
+        category = Category.objects.create(name="FIFO")
+        cls.product = Product.objects.create(name="FIFO product", sku="FIFO", category=category)
+
+    def test_batches_copy_the_purchase_datetime(self):
+        batch = create_batch(self.product, self.currency, 5, days_ago=3)
+        self.assertEqual(batch.purchase_datetime, batch.purchase.purchase_datetime)
+
+    def test_redating_a_purchase_moves_its_batch_in_fifo_order(self):
+        older = create_batch(self.product, self.currency, 5, days_ago=5)
+        newer = create_batch(self.product, self.currency, 5, days_ago=1)
+        newer.purchase.purchase_datetime = older.purchase_datetime - datetime.timedelta(days=1)
+        newer.purchase.save()
+
+        newer.refresh_from_db()
+        self.assertEqual(newer.purchase_datetime, newer.purchase.purchase_datetime)
+        allocations = allocate_fifo_batches({self.product.id: 7})
+        self.assertEqual(
+            [(inventory.id, quantity) for inventory, quantity in allocations[self.product.id]],
+            [(newer.id, 5), (older.id, 2)],
+        )
+
+    def test_bulk_updates_sync_the_batches(self):
+        first = create_batch(self.product, self.currency, 5, days_ago=5)
+        second = create_batch(self.product, self.currency, 5, days_ago=1)
+        redated = timezone.now() - datetime.timedelta(days=10)
+
+        Purchase.objects.filter(pk=second.purchase_id).update(purchase_datetime=redated)
+        second.refresh_from_db()
+        self.assertEqual(second.purchase_datetime, redated)
+
+        first.purchase.purchase_datetime = redated - datetime.timedelta(days=1)
+        Purchase.objects.bulk_update([first.purchase], ["purchase_datetime"])
+        first.refresh_from_db()
+        self.assertEqual(first.purchase_datetime, first.purchase.purchase_datetime)
+
+    def test_updates_of_other_fields_leave_the_batches_alone(self):
+        batch = create_batch(self.product, self.currency, 5, days_ago=5)
+        with self.assertNumQueries(1):
+            Purchase.objects.filter(pk=batch.purchase_id).update(quantity=6)
+
+
+@override_settings(ACCOUNTING_CURRENCY="JPY")
+class DailyFactTests(TestCase):
+    """
+    Writes add their difference to the DailyFact rows of their day when they commit,
+    the result has to match a rebuild from the source tables.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.jpy = Currency.objects.create(code="JPY", name="Yen")
+        cls.usd = Currency.objects.create(code="USD", name="Dollar")
+        category = Category.objects.create(name="Fact")
+        cls.product = Product.objects.create(name="Fact product", sku="FACT", category=category)
+        cls.customer = Customer.objects.create(user=User.objects.create(username="fact-customer"))
+        Account.objects.create(code=COGS_ACCOUNT_CODE, name="COGS", account_type="expense")
+        Account.objects.create(code=INVENTORY_ACCOUNT_CODE, name="Inventory", account_type="asset")
+
+    def facts(self) -> list[tuple]:
+        return sorted(
+            DailyFact.objects.values_list("date", "currency_id", *DAILY_FACT_FIELDS)
+        )
+
+    def test_incremental_facts_match_a_rebuild(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            # the checkout creates the order first and saves its total afterwards
+            order = Order.objects.create(customer=self.customer, total_amount=Decimal("0"), currency=self.jpy)
+            order.total_amount = Decimal("120")
+            order.save()
+            batch = create_batch(self.product, self.usd, 4, days_ago=2, price=Decimal("2.5"))
+            journal_batch = JournalBatch()
+            journal_entry = journal_batch.add_entry("COGS")
+            journal_batch.add_transfer(journal_entry, COGS_ACCOUNT_CODE, INVENTORY_ACCOUNT_CODE, Decimal("30"))
+            journal_batch.flush()
+        with self.captureOnCommitCallbacks(execute=True):
+            batch.purchase.purchase_datetime -= datetime.timedelta(days=3)
+            batch.purchase.save()
+            Income.objects.create(
+                income_name=IncomeName.objects.create(name="Fees"), amount=2.2, adate=datetime.date(2025, 3, 2)
+            )
+            Spending.objects.create(
+                spending_name=SpendingName.objects.create(name="Rent"),
+                amount=0.3,
+                currency=self.usd,
+                adate=datetime.date(2025, 3, 1),
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(customer=self.customer, total_amount=Decimal("5"), currency=self.usd).delete()
+            Purchase.objects.only("id").get(pk=batch.purchase_id).delete()
+
+        incremental = self.facts()
+        self.assertEqual(len(incremental), 3)
+        rebuild_daily_facts(datetime.date(2025, 1, 1), timezone.localdate())
+        self.assertEqual(incremental, self.facts())
+
+    def fact(self, date: datetime.date, currency: Currency) -> dict | None:
+        return DailyFact.objects.filter(date=date, currency=currency).values(*DAILY_FACT_FIELDS).first()
+
+    def test_created_and_deleted_records_update_their_day(self):
+        today = timezone.localdate()
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(customer=self.customer, total_amount=Decimal("120"), currency=self.jpy)
+            Order.objects.create(customer=self.customer, total_amount=Decimal("30"), currency=self.jpy)
+        self.assertEqual(
+            (self.fact(today, self.jpy)["sales"], self.fact(today, self.jpy)["order_count"]), (Decimal("150"), 2)
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.delete()
+        self.assertEqual(
+            (self.fact(today, self.jpy)["sales"], self.fact(today, self.jpy)["order_count"]), (Decimal("30"), 1)
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.get().delete()
+        self.assertIsNone(self.fact(today, self.jpy))
+
+    def test_redated_records_move_to_their_new_day(self):
+        old_day, new_day = datetime.date(2025, 3, 1), datetime.date(2025, 3, 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            spending = Spending.objects.create(
+                spending_name=SpendingName.objects.create(name="Rent"), amount=0.3, currency=self.usd, adate=old_day
+            )
+            journal_batch = JournalBatch()
+            journal_entry = journal_batch.add_entry("COGS")
+            journal_batch.add_transfer(journal_entry, COGS_ACCOUNT_CODE, INVENTORY_ACCOUNT_CODE, Decimal("30"))
+            journal_batch.flush()
+        JournalEntry.objects.filter(pk=journal_entry.pk).update(date=old_day)
+        rebuild_daily_facts(old_day, timezone.localdate())
+        self.assertEqual(self.fact(old_day, self.jpy)["cogs"], Decimal("30"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            spending.adate = new_day
+            spending.save()
+            journal_entry = JournalEntry.objects.get(pk=journal_entry.pk)
+            journal_entry.date = new_day
+            journal_entry.save()
+
+        self.assertIsNone(self.fact(old_day, self.usd))
+        self.assertIsNone(self.fact(old_day, self.jpy))
+        self.assertEqual(self.fact(new_day, self.usd)["spendings"], Decimal("0.30"))
+        self.assertEqual(self.fact(new_day, self.jpy)["cogs"], Decimal("30"))
+        facts = self.facts()
+        rebuild_daily_facts(old_day, timezone.localdate())
+        self.assertEqual(facts, self.facts())
+
+    def test_drifted_counts_are_rebuilt_instead_of_going_negative(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(customer=self.customer, total_amount=Decimal("120"), currency=self.jpy)
+            create_batch(self.product, self.jpy, 4, days_ago=0)
+        # e.g. a queryset.update() that bypassed the signals
+        DailyFact.objects.update(order_count=0)
+
+        with self.assertLogs("ecommerce.viewsets.reporting.daily_facts", "ERROR"):
+            with self.captureOnCommitCallbacks(execute=True):
+                order.delete()
+                Order.objects.create(customer=self.customer, total_amount=Decimal("5"), currency=self.jpy)
+
+        fact = self.fact(timezone.localdate(), self.jpy)
+        self.assertEqual((fact["order_count"], fact["sales"], fact["purchase_count"]), (1, Decimal("5"), 1))
+
+    def test_loading_records_reads_no_extra_fields(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(customer=self.customer, total_amount=Decimal("120"), currency=self.jpy)
+        order = Order.objects.get()
+        self.assertEqual(order._loaded_fact, (order.created_at, self.jpy.id, Decimal("120")))
+        with self.assertNumQueries(1):
+            list(Order.objects.only("id"))
+
+
+@override_settings(ACCOUNTING_CURRENCY="JPY")
+class StockReservationTests(TestCase):
+    """
+    FIFO allocation of a basket and the stock reservations it has to leave alone
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        currency = Currency.objects.create(code="JPY", name="Yen")
+        category = Category.objects.create(name="Reservations")
+        cls.product = Product.objects.create(name="Reserved product", sku="RESERVED", category=category)
+        cls.customer = Customer.objects.create(user=User.objects.create(username="buyer"))
+        cls.other_customer = Customer.objects.create(user=User.objects.create(username="other buyer"))
+        cls.oldest = create_batch(cls.product, currency, stock=3, days_ago=3)
+        cls.newest = create_batch(cls.product, currency, stock=5, days_ago=1)
+
+    def stock_of(self, inventory: Inventory) -> int:
+        inventory.refresh_from_db()
+        return inventory.stock
+
+    def test_basket_is_taken_from_oldest_batches_first(self):
+        allocations = allocate_fifo_batches({self.product.id: 4})
+
+        taken = [(inventory.id, quantity) for inventory, quantity in allocations[self.product.id]]
+        self.assertEqual(taken, [(self.oldest.id, 3), (self.newest.id, 1)])
+        self.assertEqual(self.stock_of(self.oldest), 0)
+        self.assertEqual(self.stock_of(self.newest), 4)
+
+    def test_other_customers_reservations_hold_stock(self):
+        reserve_stock({self.product.id: 6}, self.other_customer)
+
+        allocate_fifo_batches({self.product.id: 2})
+        with self.assertRaises(ValueError):
+            allocate_fifo_batches({self.product.id: 1})
+        with self.assertRaises(ValueError):
+            reserve_stock({self.product.id: 1}, self.customer)
+        self.assertEqual(self.stock_of(self.oldest) + self.stock_of(self.newest), 6)
+
+    def test_expired_reservations_release_stock(self):
+        [reservation] = reserve_stock({self.product.id: 8}, self.other_customer)
+        StockReservation.objects.filter(id=reservation.id).update(expires_at=timezone.now())
+
+        allocate_fifo_batches({self.product.id: 8})
+        self.assertEqual(self.stock_of(self.oldest) + self.stock_of(self.newest), 0)
+
+    def test_stock_corrections_can_take_reserved_stock(self):
+        reserve_stock({self.product.id: 8}, self.other_customer)
+
+        allocate_fifo_batches({self.product.id: 5}, honor_reservations=False)
+        self.assertEqual(self.stock_of(self.oldest) + self.stock_of(self.newest), 3)
+
+    def test_checkout_consumes_its_own_reservations(self):
+        reservations = reserve_stock({self.product.id: 8}, self.customer)
+        order = Order.objects.create(customer=self.customer, total_amount=Decimal("0"))
+
+        allocate_fifo_batches({self.product.id: 8}, [reservation.id for reservation in reservations], order)
+
+        [reservation] = StockReservation.objects.all()
+        self.assertEqual(reservation.status, StockReservation.STATUS_CONSUMED)
+        self.assertEqual(reservation.order, order)
+        self.assertEqual(self.stock_of(self.oldest) + self.stock_of(self.newest), 0)
+
+
+    def test_direct_inventory_decreases_take_reserved_stock_in_bulk(self):
+        reserve_stock({self.product.id: 8}, self.other_customer)
+
+        with CaptureQueriesContext(connection) as queries:
+            removed = journal_entries_for_direct_inventory_changes(self.product, 2, batch=JournalBatch())
+
+        self.assertEqual([inventory.id for inventory in removed], [self.oldest.id, self.newest.id])
+        self.assertEqual((self.stock_of(self.oldest), self.stock_of(self.newest)), (0, 2))
+        # both batches are written with one statement
+        self.assertEqual(sum(query["sql"].startswith('UPDATE "ecommerce_inventory"') for query in queries), 1)
+        with self.assertRaises(ValueError):
+            journal_entries_for_direct_inventory_changes(self.product, -1, batch=JournalBatch())
+
+class ActiveRecordSwapTests(TestCase):
+    """
+    Swapping the active record of a key, and the constraint that keeps a single record active
+    """
+
+    def swap(self, profit_rate: float, retries: int | None = None) -> tuple[ProfitRate, list[int]]:
+        return swap_active_record(ProfitRate, {}, {"profit_rate": profit_rate}, retries=retries)
+
+    def active_ids(self) -> list[int]:
+        return list(ProfitRate.objects.filter(end_date__isnull=True).values_list("id", flat=True))
+
+    def test_swap_ends_the_active_record(self):
+        first, ended_ids = self.swap(10)
+        self.assertEqual(ended_ids, [])
+
+        second, ended_ids = self.swap(12)
+        self.assertEqual(ended_ids, [first.id])
+        self.assertEqual(self.active_ids(), [second.id])
+        first.refresh_from_db()
+        self.assertEqual(first.end_date, timezone.now().date())
+
+    def test_swap_is_retried_after_a_concurrent_swap(self):
+        concurrent, _ = self.swap(10)
+        end_active_records = active_records._end_active_records
+        attempts = []
+
+        def end_after_a_concurrent_swap(*args):
+            attempts.append(args)
+            if len(attempts) == 1:
+                # the concurrent swap inserted its record right after this one locked the active records
+                return []
+            return end_active_records(*args)
+
+        with (
+            mock.patch.object(active_records, "_end_active_records", end_after_a_concurrent_swap),
+            self.assertLogs(active_records.logger, "DEBUG") as logs,
+        ):
+            new_record, ended_ids = self.swap(12)
+
+        self.assertEqual(len(attempts), 2)
+        self.assertIn("Retrying swap of active ProfitRate", logs.output[0])
+        self.assertEqual(ended_ids, [concurrent.id])
+        self.assertEqual(self.active_ids(), [new_record.id])
+
+    def test_swap_gives_up_after_its_retries(self):
+        active, _ = self.swap(10)
+
+        with (
+            mock.patch.object(active_records, "_end_active_records", return_value=[]) as end_active_records,
+            self.assertRaises(IntegrityError),
+        ):
+            self.swap(12, retries=2)
+
+        self.assertEqual(end_active_records.call_count, 3)
+        self.assertEqual(self.active_ids(), [active.id])
+
+    def test_only_one_record_is_active(self):
+        for model, values in ((ProfitRate, {"profit_rate": 10}), (WeightCost, {"cost_per_kg": 5})):
+            with self.subTest(model=model.__name__):
+                model.objects.create(**values, end_date=timezone.now().date())
+                model.objects.create(**values, end_date=timezone.now().date())
+                model.objects.create(**values)
+                with self.assertRaises(IntegrityError), transaction.atomic():
+                    model.objects.create(**values)
+                self.assertEqual(model.objects.filter(end_date__isnull=True).count(), 1)
+
+
+@override_settings(PERF_INSTRUMENTATION=True)
+class RequestPerfTests(TestCase):
+    """
+    Serialization is timed on its own, apart from the SQL it runs and the renderer
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(username="perf-admin", is_staff=True, is_superuser=True)
+        Category.objects.bulk_create([Category(name=f"Perf {i}") for i in range(20)])
+
+    def setUp(self):
+        cache.clear()
+        perf_stats.reset()
+        self.client.force_login(self.admin)
+
+    def test_serialization_is_reported(self):
+        data_property = BaseSerializer.data
+        response = self.client.get("/ecommerce/v1/categories/")
+
+        self.assertRegex(response["Server-Timing"], r"serialize;dur=[\d.]+")
+        [route] = [stats for stats in perf_stats.report() if stats["route"] == "GET category-list"]
+        self.assertGreater(route["avg_serialize_ms"], 0)
+        self.assertLess(route["avg_serialize_ms"], route["avg_ms"])
+        # timed by the middleware, serializers stay as they are
+        self.assertIs(BaseSerializer.data, data_property)
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "index usage is checked with PostgreSQL EXPLAIN")
+class IndexUsageTests(TestCase):
+    """
+    The tables are tiny in tests, so sequential scans are disabled to see whether the planner
+    can use an index for each hot filter at all.
+    """
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SET enable_seqscan = off")
+            for model in (Inventory, Order, Purchase, ProfitRate, WeightCost):
+                cursor.execute(f"ANALYZE {model._meta.db_table}")
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            cursor.execute("RESET enable_seqscan")
+
+    def assertUsesIndex(self, queryset, index_name):
+        self.assertIn(index_name, queryset.explain())
+
+    def test_fifo_scan_uses_in_stock_index(self):
+        self.assertUsesIndex(
+            Inventory.objects.filter(product_id=1, stock__gt=0).order_by("purchase_datetime", "id"),
+            "inventory_fifo_in_stock_idx",
+        )
+
+    def test_active_weight_cost_and_profit_rate_use_partial_index(self):
+        self.assertUsesIndex(WeightCost.objects.filter(end_date__isnull=True)[:1], "weight_cost_active_idx")
+        self.assertUsesIndex(ProfitRate.objects.filter(end_date__isnull=True)[:1], "profit_rate_active_idx")
+
+    def test_day_range_filters_use_temporal_indexes(self):
+        today = timezone.now().date()
+        start, end = start_of_day(today - datetime.timedelta(days=7)), start_of_next_day(today)
+        order_index = Order._meta.indexes[0].name
+        purchase_index = Purchase._meta.indexes[0].name
+        self.assertUsesIndex(Order.objects.filter(created_at__gte=start, created_at__lt=end), order_index)
+        self.assertUsesIndex(
+            Purchase.objects.filter(purchase_datetime__gte=start, purchase_datetime__lt=end), purchase_index
+        )
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "SQLite serializes writers, row locks need PostgreSQL")
+class StockReservationConcurrencyTests(TransactionTestCase):
+    """
+    Hammers one product from many threads, each with its own database connection,
+    and checks that stock never goes below zero or to checkouts beyond what reservations leave.
+    """
+
+    workers = 32
+
+    def setUp(self):
+        currency = Currency.objects.create(code="JPY", name="Yen")
+        category = Category.objects.create(name="Stress")
+        self.product = Product.objects.create(name="Stress product", sku="STRESS", category=category)
+        self.customers = [
+            Customer.objects.create(user=User.objects.create(username=f"stress{i}")) for i in range(10)
+        ]
+        for day in range(5):
+            purchase = Purchase.objects.create(
+                product=self.product,
+                quantity=10,
+                price_per_unit=Decimal("10"),
+                currency=currency,
+                purchase_datetime=timezone.now() - datetime.timedelta(days=day),
+            )
+            Inventory.objects.create(product=self.product, purchase=purchase, stock=10, location="stress")
+
+    def run_concurrently(self, tasks) -> list:
+        """
+        Runs the tasks on worker threads started together and returns their results in order,
+        a task result is True when it succeeded and False when it raised ValueError.
+        """
+        results = [None] * len(tasks)
+        next_task = iter(range(len(tasks)))
+        lock = threading.Lock()
+        barrier = threading.Barrier(self.workers)
+
+        def work():
+            barrier.wait()
+            try:
+                while True:
+                    with lock:
+                        index = next(next_task, None)
+                    if index is None:
+                        return
+                    try:
+                        with transaction.atomic():
+                            tasks[index]()
+                        results[index] = True
+                    except ValueError:
+                        results[index] = False
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=work) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def remaining_stock(self) -> int:
+        return Inventory.objects.filter(product=self.product).aggregate(total=Sum("stock"))["total"]
+
+    def test_concurrent_checkouts_never_oversell(self):
+        tasks = [lambda: allocate_fifo_batches({self.product.id: 1})] * 300
+        started = time.monotonic()
+        results = self.run_concurrently(tasks)
+        elapsed = time.monotonic() - started
+
+        self.assertEqual(results.count(True), 50)
+        self.assertEqual(results.count(False), 250)
+        self.assertEqual(self.remaining_stock(), 0)
+        self.assertEqual(ProductInventory.objects.get(product=self.product).total_inventory, 0)
+        logger.info(f"{len(tasks) / elapsed:.0f} checkouts per second")
+
+    def test_reservations_hold_stock_against_concurrent_checkouts(self):
+        tasks = [
+            lambda customer=customer: reserve_stock({self.product.id: 3}, customer)
+            for customer in self.customers
+        ] + [lambda: allocate_fifo_batches({self.product.id: 1})] * 40
+        results = self.run_concurrently(tasks)
+        reserved = results[: len(self.customers)].count(True) * 3
+        sold = results[len(self.customers):].count(True)
+
+        self.assertLessEqual(reserved + sold, 50)
+        self.assertEqual(self.remaining_stock(), 50 - sold)
+
+        # every reservation still gets its stock, however many checkouts ran meanwhile
+        reservations = list(StockReservation.objects.filter(status=StockReservation.STATUS_ACTIVE))
+        self.assertEqual(sum(reservation.quantity for reservation in reservations), reserved)
+        for reservation in reservations:
+            allocate_fifo_batches({self.product.id: reservation.quantity}, [reservation.id])
+        self.assertEqual(self.remaining_stock(), 50 - sold - reserved)
+        self.assertFalse(StockReservation.objects.filter(status=StockReservation.STATUS_ACTIVE).exists())
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "SQLite serializes writers, row locks need PostgreSQL")
+class ActiveRecordSwapConcurrencyTests(TransactionTestCase):
+    """
+    Concurrent swaps of the same key from many threads all succeed and leave a single active record
+    """
+
+    workers = 16
+
+    def test_concurrent_swaps_leave_one_active_record(self):
+        barrier = threading.Barrier(self.workers)
+        errors = []
+
+        def swap(profit_rate):
+            barrier.wait()
+            try:
+                swap_active_record(ProfitRate, {}, {"profit_rate": profit_rate}, retries=self.workers)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=swap, args=(i,)) for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(ProfitRate.objects.count(), self.workers)
+        self.assertEqual(ProfitRate.objects.filter(end_date__isnull=True).count(), 1)
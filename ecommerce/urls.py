@@ -1,5 +1,5 @@
 from django.urls import include, path
-from django.views.decorators.cache import cache_control, cache_page
+from django.views.decorators.cache import cache_control
 from rest_framework.routers import DefaultRouter
 
 from ecommerce.income_and_spendings.incomes import IncomeNameViewSet, IncomeViewSet, IncomeTotalInAccountingCurrencyView
@@ -17,6 +17,7 @@ from ecommerce.viewsets.fx_rates_viewsets import (
     ActiveFXRatesListView,
     FxRateAgainstPrimaryCcyListView,
     FXRateCreateUpdateAPIView,
+    FXRateFeedAPIView,
 )
 from ecommerce.viewsets.order.admin_viewsets import (
     AdminOrderCreateAPIView,
@@ -37,8 +38,14 @@ from .viewsets.accounting.viewsets import (
     AccountViewSet,
     JournalEntryLineViewSet,
     JournalEntryViewSet,
+    TrialBalanceView,
 )
-from .viewsets.inventory.viewsets import InventoryViewSet, ProductInventoryViewset
+from .viewsets.inventory.viewsets import (
+    InventoryViewSet,
+    ProductInventoryViewset,
+    StockReservationViewSet,
+)
+from .viewsets.jobs.viewsets import ImportJobViewSet
 from .viewsets.order.viewsets import OrderItemViewSet, OrderViewSet, PaymentViewSet
 from .viewsets.product.viewsets import (
     ActiveProductPriceListView,
@@ -49,10 +56,12 @@ from .viewsets.product.viewsets import (
     ProductImageViewset,
     ProductMinimalListView,
     ProductPriceViewSet,
+    ProductRepricingAPIView,
     ProductReviewViewSet,
     ProductUpdateAPIView,
     ProductViewSet,
     ProductWeightViewSet,
+    ProductWithIconImageCursorListView,
     ProductWithIconImageListView,
 ProductWithIconImagePaginatedListView,
     ProductWithImageListView,
@@ -69,6 +78,7 @@ from .viewsets.purchase.viewsets import (
     PurchaseViewSet,
     PurchaseTotalInAccountingCurrencyView
 )
+from .viewsets.reporting.viewsets import DailyFactViewSet, ProfitAndLossView
 from .viewsets.user.viewsets import (
     AddressViewSet,
     CustomerViewSet,
@@ -85,6 +95,7 @@ router.register(r"fxrates", FXRateViewSet, basename="fxrate")
 router.register(r"products", ProductViewSet, basename="product")
 router.register(r"product-prices", ProductPriceViewSet, basename="product-price")
 router.register(r"inventories", InventoryViewSet, basename="inventory")
+router.register(r"stock-reservations", StockReservationViewSet, basename="stock-reservation")
 router.register(r"product-images", ProductImageViewset, basename="product-image")
 router.register(r"product-weights", ProductWeightViewSet, basename="product-weight")
 router.register(
@@ -116,6 +127,8 @@ router.register(r"income-names", IncomeNameViewSet, basename="income-name")
 router.register(r"incomes", IncomeViewSet, basename="income")
 router.register(r"spending-names", SpendingNameViewSet, basename="spending-name")
 router.register(r"spendings", SpendingViewSet, basename="spending")
+router.register(r"jobs", ImportJobViewSet, basename="import-job")
+router.register(r"daily-facts", DailyFactViewSet, basename="daily-fact")
 
 urlpatterns = [
     path("v1/", include(router.urls)),
@@ -131,14 +144,17 @@ urlpatterns = [
     ),
     path(
         "v1/products-with-icon-image/",
-        cache_control(no_cache=True)(
-            cache_page(60 * 15)(ProductWithIconImageListView.as_view())
-        ),
+        cache_control(no_cache=True)(ProductWithIconImageListView.as_view()),
         name="products-with-icon-image",
     ),
     path("v1/products-with-icon-image-paginated/",
-         cache_control(no_cache=True)(cache_page(60*15)(ProductWithIconImagePaginatedListView.as_view())),
+         cache_control(no_cache=True)(ProductWithIconImagePaginatedListView.as_view()),
          name="products-with-icon-image-paginated"),
+    path(
+        "v2/products-with-icon-image-paginated/",
+        cache_control(no_cache=True)(ProductWithIconImageCursorListView.as_view()),
+        name="products-with-icon-image-paginated-v2",
+    ),
     path(
         "v1/minimal-products/",
         ProductMinimalListView.as_view(),
@@ -151,6 +167,7 @@ urlpatterns = [
         ProductUpdateAPIView.as_view(),
         name="update-product",
     ),
+    path("v1/reprice-products/", ProductRepricingAPIView.as_view(), name="reprice-products"),
     path(
         "v1/create-update-products-from-csv/",
         ProductCreateUpdateFromCSVAPIView.as_view(),
@@ -196,6 +213,7 @@ urlpatterns = [
         FXRateCreateUpdateAPIView.as_view(),
         name="create-or-update-fxrates",
     ),
+    path("v1/load-fxrate-feed/", FXRateFeedAPIView.as_view(), name="load-fxrate-feed"),
     path(
         "v1/active-weight-cost/",
         ActiveWeightCostView.as_view(),
@@ -219,5 +237,7 @@ urlpatterns = [
          name="spending-total-in-accounting-currency"),
     path("v1/income-total-in-accounting-currency/", IncomeTotalInAccountingCurrencyView.as_view(),
          name="income-total-in-accounting-currency"),
+    path("v1/profit-and-loss/", ProfitAndLossView.as_view(), name="profit-and-loss"),
+    path("v1/trial-balance/", TrialBalanceView.as_view(), name="trial-balance"),
 
 ]
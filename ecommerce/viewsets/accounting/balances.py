@@ -0,0 +1,120 @@
+import datetime
+import logging
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from ecommerce.models import Account, AccountBalanceSnapshot, JournalEntryLine
+
+logger = logging.getLogger(__name__)
+
+DEBIT_NORMAL_ACCOUNT_TYPES = {"asset", "expense"}
+
+
+def _line_totals(lines) -> dict[int, tuple[Decimal, Decimal]]:
+    return {
+        account_id: (debit or Decimal("0"), credit or Decimal("0"))
+        for account_id, debit, credit in lines.order_by()
+        .values("account_id")
+        .annotate(debit=Sum("debit"), credit=Sum("credit"))
+        .values_list("account_id", "debit", "credit")
+    }
+
+
+def get_account_balances(as_of: datetime.date | None = None) -> dict[int, tuple[Decimal, Decimal]]:
+    """
+    Cumulative debits and credits per account, read from the latest snapshot on or before as_of
+    plus the lines of the journal entries dated after it
+    :param as_of: defaults to today
+    :return: mapping of account id to (debit, credit)
+    """
+    as_of = as_of or timezone.localdate()
+    snapshot_date = AccountBalanceSnapshot.objects.filter(as_of__lte=as_of).aggregate(
+        latest=Max("as_of")
+    )["latest"]
+    lines = JournalEntryLine.objects.filter(journal_entry__date__lte=as_of)
+    balances = {}
+    if snapshot_date is not None:
+        balances = {
+            account_id: (debit, credit)
+            for account_id, debit, credit in AccountBalanceSnapshot.objects.filter(
+                as_of=snapshot_date
+            ).values_list("account_id", "debit", "credit")
+        }
+        lines = lines.filter(journal_entry__date__gt=snapshot_date)
+    for account_id, (debit, credit) in _line_totals(lines).items():
+        snapshot_debit, snapshot_credit = balances.get(account_id, (Decimal("0"), Decimal("0")))
+        balances[account_id] = (snapshot_debit + debit, snapshot_credit + credit)
+    return balances
+
+
+def take_balance_snapshot(as_of: datetime.date | None = None) -> int:
+    """
+    Store the balances of every account as of a past day, so that later balance queries start from it
+    :param as_of: defaults to yesterday, today can't be snapshotted while entries are still being added
+    :return: number of accounts snapshotted
+    """
+    today = timezone.localdate()
+    as_of = as_of or today - datetime.timedelta(days=1)
+    if as_of >= today:
+        raise ValueError(f"Can only snapshot balances of past days, not {as_of}")
+    balances = get_account_balances(as_of)
+    with transaction.atomic():
+        AccountBalanceSnapshot.objects.filter(as_of=as_of).exclude(account_id__in=balances.keys()).delete()
+        AccountBalanceSnapshot.objects.bulk_create(
+            [
+                AccountBalanceSnapshot(account_id=account_id, as_of=as_of, debit=debit, credit=credit)
+                for account_id, (debit, credit) in balances.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["as_of", "account"],
+            update_fields=["debit", "credit"],
+        )
+    logger.debug(f"Snapshotted balances of {len(balances)} accounts as of {as_of}")
+    return len(balances)
+
+
+def invalidate_balance_snapshots(entry_date: datetime.date | None):
+    """
+    Drop the snapshots that include a changed journal entry, later balance queries fall back to older ones
+    """
+    # snapshots are only taken of past days, so entries of today don't need the query
+    if entry_date is None or entry_date >= timezone.localdate():
+        return
+    deleted, _ = AccountBalanceSnapshot.objects.filter(as_of__gte=entry_date).delete()
+    if deleted:
+        logger.info(f"Dropped {deleted} account balance snapshots from {entry_date} on")
+
+
+def roll_up_balances(
+        accounts: list[Account], balances: dict[int, tuple[Decimal, Decimal]]
+) -> dict[int, tuple[Decimal, Decimal]]:
+    """
+    Add the balance of every account to all of its ancestors
+    :param accounts: all accounts, so that every parent is known
+    :param balances: mapping of account id to its own (debit, credit)
+    :return: mapping of account id to (debit, credit) including its descendants
+    """
+    parent_ids = {account.id: account.parent_id for account in accounts}
+    rolled_up = {account.id: (Decimal("0"), Decimal("0")) for account in accounts}
+    for account_id, (debit, credit) in balances.items():
+        visited = set()
+        current_id = account_id
+        # visited guards against parent cycles entered through the admin
+        while current_id is not None and current_id in rolled_up and current_id not in visited:
+            visited.add(current_id)
+            total_debit, total_credit = rolled_up[current_id]
+            rolled_up[current_id] = (total_debit + debit, total_credit + credit)
+            current_id = parent_ids.get(current_id)
+    return rolled_up
+
+
+def signed_balance(account_type: str, debit: Decimal, credit: Decimal) -> Decimal:
+    """
+    :return: balance in the normal direction of the account type, debit for assets and expenses
+    """
+    if account_type in DEBIT_NORMAL_ACCOUNT_TYPES:
+        return debit - credit
+    return credit - debit
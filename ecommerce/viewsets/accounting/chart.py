@@ -0,0 +1,95 @@
+import logging
+import time
+from typing import Iterable
+
+from ecommerce.models import Account
+from ecommerce.viewsets.versioned_memo import VersionedMemo, bump_version
+
+logger = logging.getLogger(__name__)
+
+CASH_ACCOUNT_CODE = "1000"
+INVENTORY_ACCOUNT_CODE = "1200"
+ACCOUNTS_PAYABLE_ACCOUNT_CODE = "2000"
+SALES_ACCOUNT_CODE = "4000"
+COGS_ACCOUNT_CODE = "5000"
+
+CHART_OF_ACCOUNTS_VERSION_KEY = "chart_of_accounts_version"
+
+
+class ChartOfAccounts:
+    """
+    All accounts keyed by code, loaded with one query so that write paths resolve account codes without queries.
+    """
+
+    def __init__(self, accounts: Iterable[Account], version=None):
+        """
+        :param accounts: all accounts
+        :param version: value of the version key this chart was loaded for
+        """
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.by_code = {account.code: account for account in accounts}
+
+    @classmethod
+    def load(cls, version=None) -> "ChartOfAccounts":
+        chart = cls(Account.objects.all(), version)
+        logger.debug(f"Loaded chart of {len(chart.by_code)} accounts")
+        return chart
+
+    def __contains__(self, code: str) -> bool:
+        return code in self.by_code
+
+    def get(self, code: str) -> Account:
+        """
+        :raises Account.DoesNotExist: when no account has the code
+        """
+        try:
+            return self.by_code[code]
+        except KeyError:
+            raise Account.DoesNotExist(f"No account with code {code}")
+
+    def get_id(self, code: str) -> int:
+        return self.get(code).id
+
+
+_chart_of_accounts_memo = VersionedMemo(
+    CHART_OF_ACCOUNTS_VERSION_KEY, ChartOfAccounts.load, "CHART_OF_ACCOUNTS_MAX_AGE"
+)
+
+
+def bump_chart_of_accounts_version():
+    """
+    Invalidate memoized charts of accounts of this process at once, and of other processes
+    sharing the cache on their next version check
+    """
+    bump_version(CHART_OF_ACCOUNTS_VERSION_KEY)
+
+
+def get_chart_of_accounts(reload: bool = False) -> ChartOfAccounts:
+    """
+    Chart of accounts memoized per process, reloaded when the version key changes or after
+    CHART_OF_ACCOUNTS_MAX_AGE seconds.
+    :param reload: load the chart even if the memoized one is current
+    """
+    return _chart_of_accounts_memo.get(reload=reload)
+
+
+def get_accounts(codes: Iterable[str]) -> dict[str, Account]:
+    """
+    Resolve account codes from the chart of accounts.
+    The chart is reloaded once when a code is missing, in case the account was just created by another process.
+    :param codes: account codes
+    :return: mapping of code to Account
+    """
+    codes = set(codes)
+    chart = get_chart_of_accounts()
+    if any(code not in chart for code in codes):
+        chart = get_chart_of_accounts(reload=True)
+    missing = sorted(code for code in codes if code not in chart)
+    if missing:
+        raise Account.DoesNotExist(f"No accounts with codes {', '.join(missing)}")
+    return {code: chart.get(code) for code in codes}
+
+
+def get_account(code: str) -> Account:
+    return get_accounts([code])[code]
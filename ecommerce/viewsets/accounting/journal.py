@@ -0,0 +1,137 @@
+import logging
+from decimal import Decimal
+
+from django.db import transaction
+
+from ecommerce.models import JournalEntry, JournalEntryLine
+from ecommerce.viewsets.accounting.chart import COGS_ACCOUNT_CODE, get_accounts
+from ecommerce.viewsets.reporting.daily_facts import (
+    cogs_contribution,
+    record_daily_fact_changes,
+)
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal("0.01")
+
+
+def _to_amount(value) -> Decimal:
+    # rounded like the database stores it, so the balance check sees the stored amounts
+    return Decimal(str(value)).quantize(CENT)
+
+
+class JournalBatch:
+    """
+    Collects journal entries and their lines in memory and writes them with two bulk_create calls.
+    Account codes are resolved from the chart of accounts when flushing, every entry must balance or nothing is written.
+    """
+
+    def __init__(self):
+        self.entries: list[JournalEntry] = []
+        self.lines: list[tuple[str, JournalEntryLine]] = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add_entry(self, description: str, reference: str = "") -> JournalEntry:
+        """
+        :param description:
+        :param reference: e.g. order number
+        :return: unsaved JournalEntry, saved by flush
+        """
+        journal_entry = JournalEntry(description=description, reference=reference)
+        self.entries.append(journal_entry)
+        return journal_entry
+
+    def add_line(
+            self,
+            journal_entry: JournalEntry,
+            account_code: str,
+            debit: Decimal | float = 0,
+            credit: Decimal | float = 0,
+            description: str = "",
+    ) -> JournalEntryLine:
+        """
+        :param journal_entry: entry returned by add_entry
+        :param account_code: code of the account, e.g. 1200 for inventory
+        :param debit:
+        :param credit:
+        :param description:
+        :return: unsaved JournalEntryLine, saved by flush
+        """
+        line = JournalEntryLine(
+            journal_entry=journal_entry,
+            debit=_to_amount(debit),
+            credit=_to_amount(credit),
+            description=description,
+        )
+        self.lines.append((account_code, line))
+        return line
+
+    def add_transfer(
+            self,
+            journal_entry: JournalEntry,
+            debit_account_code: str,
+            credit_account_code: str,
+            amount: Decimal | float,
+            debit_description: str = "",
+            credit_description: str = "",
+    ):
+        """
+        Debit one account and credit another by the same amount
+        """
+        self.add_line(journal_entry, debit_account_code, debit=amount, description=debit_description)
+        self.add_line(journal_entry, credit_account_code, credit=amount, description=credit_description)
+
+    def check_balanced(self):
+        """
+        :raises ValueError: when debits and credits of an entry differ
+        """
+        totals = {id(journal_entry): [Decimal("0"), Decimal("0")] for journal_entry in self.entries}
+        for _, line in self.lines:
+            entry_totals = totals.get(id(line.journal_entry))
+            if entry_totals is None:
+                raise ValueError(f"Journal line '{line.description}' belongs to an entry of another batch")
+            entry_totals[0] += line.debit
+            entry_totals[1] += line.credit
+        unbalanced = [
+            f"{journal_entry.description} (debit {totals[id(journal_entry)][0]}, credit {totals[id(journal_entry)][1]})"
+            for journal_entry in self.entries
+            if totals[id(journal_entry)][0] != totals[id(journal_entry)][1]
+        ]
+        if unbalanced:
+            raise ValueError(f"Unbalanced journal entries: {'; '.join(unbalanced)}")
+
+    def flush(self) -> list[JournalEntry]:
+        """
+        Check the collected entries balance and write them, the batch is empty afterwards.
+        Entries without lines, e.g. of an adjustment by 0, aren't written.
+        :return: saved journal entries
+        """
+        if not self.entries:
+            return []
+        self.check_balanced()
+        entries_with_lines = {id(line.journal_entry) for _, line in self.lines}
+        journal_entries = [journal_entry for journal_entry in self.entries if id(journal_entry) in entries_with_lines]
+        if not journal_entries:
+            self.entries = []
+            return []
+        accounts = get_accounts(account_code for account_code, _ in self.lines)
+        for account_code, line in self.lines:
+            line.account = accounts[account_code]
+
+        lines = [line for _, line in self.lines]
+        with transaction.atomic():
+            JournalEntry.objects.bulk_create(journal_entries)
+            JournalEntryLine.objects.bulk_create(lines)
+            # bulk_create doesn't send post_save, so the COGS lines are added to the daily facts explicitly
+            record_daily_fact_changes(
+                added=[
+                    cogs_contribution(line.journal_entry.date, line.debit, line.credit)
+                    for line in lines
+                    if line.account.code == COGS_ACCOUNT_CODE
+                ]
+            )
+        self.entries, self.lines = [], []
+        logger.debug(f"Posted {len(journal_entries)} journal entries with {len(lines)} lines")
+        return journal_entries
@@ -0,0 +1,92 @@
+import logging
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import F, Sum
+from django.utils.dateparse import parse_date
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from ecommerce.permissions import IsStaff
+from ecommerce.viewsets.utils import get_fx_rate_matrix
+
+logger = logging.getLogger(__name__)
+
+
+def get_date_query_param(request, name: str):
+    """
+    :param request:
+    :param name: query parameter holding a YYYY-MM-DD date
+    :return: the date, None when the parameter is missing or invalid
+    """
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        return parse_date(value)
+    except ValueError:
+        return None
+
+
+def totals_in_accounting_currency(queryset, amounts: dict, currency_field: str = "currency") -> dict[str, Decimal]:
+    """
+    Sum several amounts of a queryset in the accounting currency.
+    Amounts are summed per currency by the database, so only one row per currency is converted here
+    and memory use doesn't depend on the number of rows.
+    :param queryset: rows to total
+    :param amounts: mapping of total name to field name or expression of the amount of a row, in the row currency
+    :param currency_field: foreign key to the row currency
+    :return: mapping of total name to total in the accounting currency, rows in currencies without an FX rate are skipped
+    """
+    to_code = settings.ACCOUNTING_CURRENCY
+    fx_map = get_fx_rate_matrix().as_dict(by_code=True)
+    totals_by_currency = (
+        queryset.order_by()
+        .values(currency_code=F(f"{currency_field}__code"))
+        .annotate(**{f"{name}_sum": Sum(amount) for name, amount in amounts.items()})
+    )
+    totals = {name: Decimal("0.00") for name in amounts}
+    for row in totals_by_currency:
+        from_code = row["currency_code"]
+        rate = fx_map.get((from_code, to_code), Decimal("1.0") if from_code == to_code else None)
+        if rate is None:
+            logger.debug(f"Skipped totals in {from_code} without an FX rate to {to_code}")
+            continue
+        for name in amounts:
+            currency_total = row[f"{name}_sum"]
+            if currency_total is not None:
+                # float fields are summed as floats, str keeps their repr instead of the binary expansion
+                totals[name] += Decimal(str(currency_total)) * rate
+    return totals
+
+
+def total_in_accounting_currency(queryset, amount, currency_field: str = "currency") -> Decimal:
+    """
+    Sum one amount of a queryset in the accounting currency, see totals_in_accounting_currency
+    """
+    return totals_in_accounting_currency(queryset, {"total": amount}, currency_field)["total"]
+
+
+class TotalInAccountingCurrencyView(APIView):
+    """
+    Base view for totals between optional start_date and end_date query parameters.
+    Subclasses set amount and implement get_queryset.
+    """
+
+    permission_classes = [IsStaff]
+    amount = None
+    currency_field = "currency"
+
+    def get_queryset(self, start_date, end_date):
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        start_date = get_date_query_param(request, "start_date")
+        end_date = get_date_query_param(request, "end_date")
+        total = total_in_accounting_currency(
+            self.get_queryset(start_date, end_date), self.amount, self.currency_field
+        )
+        return Response({
+            "amount": round(total, 2),
+            "currency": settings.ACCOUNTING_CURRENCY,
+        })
@@ -1,9 +1,12 @@
 import logging
 from decimal import Decimal
+from typing import Iterable
 
-from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from rest_framework import permissions, viewsets
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from ecommerce.models import (
     Account,
@@ -13,14 +16,35 @@ from ecommerce.models import (
     JournalEntryLine,
     Order,
     Product,
-    ProductPrice,
     Purchase,
+    StockReservation,
 )
 from ecommerce.serializers.accounting.serializers import (
     AccountSerializer,
     JournalEntryLineSerializer,
     JournalEntrySerializer,
 )
+from ecommerce.viewsets.accounting.balances import (
+    get_account_balances,
+    roll_up_balances,
+    signed_balance,
+)
+from ecommerce.viewsets.accounting.chart import (
+    ACCOUNTS_PAYABLE_ACCOUNT_CODE,
+    CASH_ACCOUNT_CODE,
+    COGS_ACCOUNT_CODE,
+    INVENTORY_ACCOUNT_CODE,
+    SALES_ACCOUNT_CODE,
+)
+from ecommerce.viewsets.accounting.journal import JournalBatch
+from ecommerce.viewsets.accounting.totals import get_date_query_param
+from ecommerce.viewsets.inventory.reservations import (
+    lock_in_stock_batches,
+    raise_if_short,
+    reserved_quantities,
+)
+from ecommerce.viewsets.inventory.viewsets import record_inventory_delta
+from ecommerce.viewsets.product.prices import get_active_prices
 
 logger = logging.getLogger(__name__)
 
@@ -32,22 +56,72 @@ class AccountViewSet(viewsets.ModelViewSet):
 
 
 class JournalEntryViewSet(viewsets.ModelViewSet):
-    queryset = JournalEntry.objects.all()
+    queryset = JournalEntry.objects.prefetch_related("lines__account")
     serializer_class = JournalEntrySerializer
     permission_classes = [permissions.IsAdminUser]
 
 
 class JournalEntryLineViewSet(viewsets.ModelViewSet):
-    queryset = JournalEntryLine.objects.all()
+    queryset = JournalEntryLine.objects.select_related("account")
     serializer_class = JournalEntryLineSerializer
     permission_classes = [permissions.IsAdminUser]
 
 
+class TrialBalanceView(APIView):
+    """
+    Debits, credits and balances of every account as of an optional as_of date.
+    total_* values include the child accounts, totals_by_account_type gives the balance sheet and P&L sides.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        as_of = get_date_query_param(request, "as_of") or timezone.localdate()
+        accounts = sorted(Account.objects.all(), key=lambda account: account.code)
+        balances = get_account_balances(as_of)
+        rolled_up = roll_up_balances(accounts, balances)
+
+        rows = []
+        totals_by_account_type = {}
+        for account in accounts:
+            debit, credit = balances.get(account.id, (Decimal("0"), Decimal("0")))
+            total_debit, total_credit = rolled_up[account.id]
+            balance = signed_balance(account.account_type, debit, credit)
+            totals_by_account_type[account.account_type] = (
+                totals_by_account_type.get(account.account_type, Decimal("0")) + balance
+            )
+            rows.append({
+                "id": account.id,
+                "code": account.code,
+                "name": account.name,
+                "account_type": account.account_type,
+                "parent": account.parent_id,
+                "debit": debit,
+                "credit": credit,
+                "balance": balance,
+                "total_debit": total_debit,
+                "total_credit": total_credit,
+                "total_balance": signed_balance(account.account_type, total_debit, total_credit),
+            })
+
+        total_debit = sum((debit for debit, _ in balances.values()), Decimal("0"))
+        total_credit = sum((credit for _, credit in balances.values()), Decimal("0"))
+        return Response({
+            "as_of": as_of,
+            "accounts": rows,
+            "totals_by_account_type": totals_by_account_type,
+            "total_debit": total_debit,
+            "total_credit": total_credit,
+            "is_balanced": total_debit == total_credit,
+        })
+
+
 def journal_entries_for_direct_inventory_changes(
         product: Product,
         new_quantity: int,
-        inventory_account_code: str = "1200",
-        accounts_payable_account_code: str = "2000",
+        inventory_account_code: str = INVENTORY_ACCOUNT_CODE,
+        accounts_payable_account_code: str = ACCOUNTS_PAYABLE_ACCOUNT_CODE,
+        batch: JournalBatch | None = None,
 ) -> list[Inventory]:
     """
     Adjusts inventory using new model and creates journal entries for direct inventory change.
@@ -56,6 +130,7 @@ def journal_entries_for_direct_inventory_changes(
     :param new_quantity:
     :param inventory_account_code:
     :param accounts_payable_account_code:
+    :param batch: journal batch the entry is added to, the caller flushes it. Posted right away when not given
     :return: list of Inventory objects created or adjusted
     """
     previous_quantity = sum(
@@ -69,19 +144,17 @@ def journal_entries_for_direct_inventory_changes(
     if quantity_diff == 0:
         return []  # No change, nothing to do
 
-    # Get active price
-    price_obj = ProductPrice.objects.filter(
-        product=product, end_date__isnull=True
-    ).first()
-    unit_price = price_obj.price if price_obj else Decimal("0")
+    # Get active price, the product passed in may have been repriced after it was loaded
+    priced_product = get_active_prices([product.id])[product.id]
+    unit_price = (
+        priced_product.current_price
+        if priced_product.current_price is not None
+        else Decimal("0")
+    )
     delta_value = unit_price * abs(quantity_diff)
 
-    inventory_account = Account.objects.get(code=inventory_account_code)
-    accounts_payable = Account.objects.get(code=accounts_payable_account_code)
-
-    journal_entry = JournalEntry.objects.create(
-        description=f"Direct inventory adjustment for {product.name}"
-    )
+    journal_batch = batch if batch is not None else JournalBatch()
+    journal_entry = journal_batch.add_entry(f"Direct inventory adjustment for {product.name}")
 
     if quantity_diff > 0:
         # Create a virtual purchase
@@ -89,7 +162,7 @@ def journal_entries_for_direct_inventory_changes(
             product=product,
             quantity=quantity_diff,
             price_per_unit=unit_price,
-            currency=price_obj.currency if price_obj else settings.ACCOUNTING_CURRENCY,
+            currency=priced_product.current_currency,
             purchase_datetime=timezone.now(),
         )
         inventory_record = Inventory.objects.create(
@@ -100,176 +173,213 @@ def journal_entries_for_direct_inventory_changes(
         )
 
         # Debit inventory, credit A/P
-        JournalEntryLine.objects.create(
-            journal_entry=journal_entry,
-            account=inventory_account,
-            debit=delta_value,
-            credit=0,
-            description=f"Inventory added for {product.name} at a price of {product.price}",
-        )
-        JournalEntryLine.objects.create(
-            journal_entry=journal_entry,
-            account=accounts_payable,
-            debit=0,
-            credit=delta_value,
-            description=f"Accounts Payable for inventory increase {product.name} at a price of {product.price}",
+        journal_batch.add_transfer(
+            journal_entry,
+            inventory_account_code,
+            accounts_payable_account_code,
+            delta_value,
+            debit_description=f"Inventory added for {product.name} at a price of {product.price}",
+            credit_description=f"Accounts Payable for inventory increase {product.name} at a price of {product.price}",
         )
+        if batch is None:
+            journal_batch.flush()
         logger.debug(f"Increased inventory of {product} by {quantity_diff}")
         return [inventory_record]
 
     else:
-        # FIFO removal for stock decrease
-        inventory_records = Inventory.objects.filter(
-            product=product, stock__gt=0
-        ).order_by("purchase__purchase_datetime")
-        remaining_qty = abs(quantity_diff)
-        removed_batches = []
-
-        for inv_idx, inv in enumerate(inventory_records):
-            if remaining_qty == 0:
-                break
-            logger.debug(
-                f"Reducing inventory of {product} by remaining_qty {remaining_qty} by procesing inventory record {inv_idx}"
-            )
-            reduce_qty = min(inv.stock, remaining_qty)
-            logger.debug(
-                f"Actual reduce_qty for this inventory {inv_idx} will be {reduce_qty}"
-            )
-            cost = inv.purchase.price_per_unit * reduce_qty
-            delta_value += cost
-
-            inv.stock -= reduce_qty
-            inv.save()
-            remaining_qty -= reduce_qty
-            removed_batches.append(inv)
-
-            # Record journal lines per batch if needed
-            JournalEntryLine.objects.create(
-                journal_entry=journal_entry,
-                account=inventory_account,
-                debit=0,
-                credit=cost,
-                description=f"Inventory decrease from batch ({inv.purchase})",
+        # FIFO removal for stock decrease, locked and written in bulk like the checkout's, reservations don't apply
+        with transaction.atomic():
+            consumptions = allocate_fifo_batches(
+                {product.id: abs(quantity_diff)},
+                honor_reservations=False,
+                shortage_message=f"Not enough inventory to reduce {abs(quantity_diff)} units of",
             )
-            JournalEntryLine.objects.create(
-                journal_entry=journal_entry,
-                account=accounts_payable,
-                debit=cost,
-                credit=0,
-                description=f"Reversal from Accounts Payable as part of inventory descrease from batch {inv.purchase}",
-            )
-
-        if remaining_qty > 0:
-            raise ValueError(
-                f"Not enough inventory to reduce {abs(quantity_diff)} units of {product.name}"
-            )
-
+            removed_batches = []
+            for inventory, reduce_qty in consumptions[product.id]:
+                cost = inventory.purchase.price_per_unit * reduce_qty
+                removed_batches.append(inventory)
+
+                # Record journal lines per batch if needed
+                journal_batch.add_transfer(
+                    journal_entry,
+                    accounts_payable_account_code,
+                    inventory_account_code,
+                    cost,
+                    debit_description=f"Reversal from Accounts Payable as part of inventory descrease from batch {inventory.purchase}",
+                    credit_description=f"Inventory decrease from batch ({inventory.purchase})",
+                )
+
+        if batch is None:
+            journal_batch.flush()
         return removed_batches
 
 
-def journal_entry_when_product_is_sold_fifo(product: Product, quantity_sold: int):
+def allocate_fifo_batches(
+        basket: dict[int, int],
+        reservation_ids: Iterable[int] = (),
+        order: Order | None = None,
+        honor_reservations: bool = True,
+        shortage_message: str = "Not enough inventory to fulfill order for",
+) -> dict[int, list[tuple[Inventory, int]]]:
     """
-    Reduces inventory using FIFO logic and creates COGS journal entries.
+    Consumes stock of a whole basket using FIFO logic.
+    All non-empty batches of the basket products are locked with a single select_for_update,
+    consumptions are computed in memory and new stock levels are written with one bulk_update.
+    Stock held by other customers' active reservations can't be consumed.
+    :param basket: mapping of product id to quantity to consume
+    :param reservation_ids: reservations of this checkout, marked consumed
+    :param order: order the consumed reservations are linked to
+    :param honor_reservations: False lets admin stock corrections take reserved stock
+    :param shortage_message: start of the ValueError message naming the products short of stock
+    :return: mapping of product id to list of (inventory batch, consumed quantity) in FIFO order
     """
-
-    inventory_batches = (
-        Inventory.objects.filter(product=product, stock__gt=0)
-        .select_related("purchase")
-        .order_by("purchase__purchase_datetime")
-    )
-
-    inventory_account = Account.objects.get(code="1200")  # Inventory
-    cogs_account = Account.objects.get(code="5000")  # Cost of Goods Sold
-
-    remaining_qty = quantity_sold
-    total_cost = Decimal("0")
-
-    journal_entry = JournalEntry.objects.create(
-        description=f"FIFO COGS for sale of {quantity_sold} x {product.name} at {product.price}"
-    )
-
-    for inventory in inventory_batches:
-        if remaining_qty == 0:
-            break
-
-        take_qty = min(remaining_qty, inventory.stock)
-        cost = inventory.purchase.price_per_unit * take_qty
-        total_cost += cost
-
-        # Reduce stock
-        inventory.stock -= take_qty
-        inventory.save()
-
-        # Create journal lines per batch if needed
-        JournalEntryLine.objects.create(
-            journal_entry=journal_entry,
-            account=cogs_account,
-            debit=cost,
-            credit=0,
-            description=f"COGS ({take_qty} units from purchase {inventory.purchase} at {inventory.purchase.price_per_unit})",
-        )
-        JournalEntryLine.objects.create(
-            journal_entry=journal_entry,
-            account=inventory_account,
-            debit=0,
-            credit=cost,
-            description=f"Inventory reduction (FIFO) as part of selling {take_qty} units of {inventory.purchase}",
+    basket = {product_id: quantity for product_id, quantity in basket.items() if quantity > 0}
+    if not basket:
+        return {}
+
+    with transaction.atomic():
+        inventory_batches = list(lock_in_stock_batches(basket.keys()).select_related("product", "purchase"))
+
+        available = {}
+        for inventory in inventory_batches:
+            available[inventory.product_id] = available.get(inventory.product_id, 0) + inventory.stock
+        own_reservations = StockReservation.objects.filter(
+            id__in=list(reservation_ids), status=StockReservation.STATUS_ACTIVE
         )
-
-        remaining_qty -= take_qty
-
-    if remaining_qty > 0:
-        raise ValueError(f"Not enough inventory to fulfill order for {product.name}")
-
-    return total_cost  # useful if you want to save this to the Order record
+        if honor_reservations:
+            # read after locking the batches, so no reservation of these products can be added meanwhile
+            reserved = reserved_quantities(
+                basket.keys(), own_reservations.values_list("id", flat=True)
+            )
+            for product_id, quantity in reserved.items():
+                available[product_id] = available.get(product_id, 0) - quantity
+        raise_if_short(basket, available, shortage_message)
+
+        remaining = dict(basket)
+        allocations = {product_id: [] for product_id in basket}
+        consumed_batches = []
+        for inventory in inventory_batches:
+            remaining_qty = remaining[inventory.product_id]
+            if remaining_qty == 0:
+                continue
+            take_qty = min(remaining_qty, inventory.stock)
+            inventory.stock -= take_qty
+            remaining[inventory.product_id] = remaining_qty - take_qty
+            allocations[inventory.product_id].append((inventory, take_qty))
+            consumed_batches.append(inventory)
+
+        # bulk_update doesn't send post_save, so totals are adjusted explicitly
+        Inventory.objects.bulk_update(consumed_batches, ["stock"])
+        for product_id, quantity in basket.items():
+            record_inventory_delta(product_id, -quantity)
+        own_reservations.update(status=StockReservation.STATUS_CONSUMED, order=order)
+    return allocations
+
+
+def journal_entries_when_basket_is_sold_fifo(
+        basket: dict[int, int],
+        batch: JournalBatch | None = None,
+        reservation_ids: Iterable[int] = (),
+        order: Order | None = None,
+) -> dict[int, Decimal]:
+    """
+    Reduces inventory of every product in the basket using FIFO logic and creates COGS journal entries.
+    One journal entry is created per product, with a COGS and an inventory line per consumed batch.
+    :param basket: mapping of product id to quantity sold
+    :param batch: journal batch the entries are added to, the caller flushes it. Posted right away when not given
+    :param reservation_ids: stock reservations the sale consumes, see allocate_fifo_batches
+    :param order: order the consumed reservations are linked to
+    :return: mapping of product id to total cost of goods sold
+    """
+    with transaction.atomic():
+        allocations = allocate_fifo_batches(basket, reservation_ids, order)
+        if not allocations:
+            return {}
+
+        journal_batch = batch if batch is not None else JournalBatch()
+        total_costs = {}
+        for product_id, consumptions in allocations.items():
+            journal_entry = journal_batch.add_entry(
+                f"FIFO COGS for sale of {basket[product_id]} x {consumptions[0][0].product.name}"
+            )
+            total_cost = Decimal("0")
+            for inventory, take_qty in consumptions:
+                cost = inventory.purchase.price_per_unit * take_qty
+                total_cost += cost
+                journal_batch.add_transfer(
+                    journal_entry,
+                    COGS_ACCOUNT_CODE,
+                    INVENTORY_ACCOUNT_CODE,
+                    cost,
+                    debit_description=f"COGS ({take_qty} units from purchase {inventory.purchase} at {inventory.purchase.price_per_unit})",
+                    credit_description=f"Inventory reduction (FIFO) as part of selling {take_qty} units of {inventory.purchase}",
+                )
+            total_costs[product_id] = total_cost
+
+        if batch is None:
+            journal_batch.flush()
+    return total_costs
+
+
+def journal_entry_when_product_is_sold_fifo(product: Product, quantity_sold: int, batch: JournalBatch | None = None):
+    """
+    Reduces inventory using FIFO logic and creates COGS journal entries.
+    """
+    total_costs = journal_entries_when_basket_is_sold_fifo({product.id: quantity_sold}, batch)
+    return total_costs.get(product.id, Decimal("0"))  # useful if you want to save this to the Order record
 
 
-def journal_entry_for_purchase_inventory_increase(product: Product, purchase: Purchase) -> JournalEntry:
+def journal_entry_for_purchase_inventory_increase(
+        product: Product, purchase: Purchase, batch: JournalBatch | None = None
+) -> JournalEntry:
     """
     Journal entries when product is purchased
     :param product: Product
     :param purchase: Purchase
+    :param batch: journal batch the entry is added to, the caller flushes it. Posted right away when not given
     :return:
     """
-    inventory_account = Account.objects.get(code="1200")
-    accounts_payable = Account.objects.get(code="2000")
+    journal_batch = batch if batch is not None else JournalBatch()
     total_purchase_cost = purchase.price_per_unit * purchase.quantity
-    je_purchase = JournalEntry.objects.create(
-        description=f"Purchase of {purchase.quantity} {product.name} at price {purchase.price_per_unit}")
-    JournalEntryLine.objects.create(journal_entry=je_purchase,
-                                    account=inventory_account,
-                                    debit=total_purchase_cost,
-                                    credit=0,
-                                    description="Inventory increase from purchase")
-    JournalEntryLine.objects.create(journal_entry=je_purchase,
-                                    account=accounts_payable,
-                                    debit=0,
-                                    credit=total_purchase_cost,
-                                    description="Accounts Payable increase for purchase")
+    je_purchase = journal_batch.add_entry(
+        f"Purchase of {purchase.quantity} {product.name} at price {purchase.price_per_unit}"
+    )
+    journal_batch.add_transfer(
+        je_purchase,
+        INVENTORY_ACCOUNT_CODE,
+        ACCOUNTS_PAYABLE_ACCOUNT_CODE,
+        total_purchase_cost,
+        debit_description="Inventory increase from purchase",
+        credit_description="Accounts Payable increase for purchase",
+    )
+    if batch is None:
+        journal_batch.flush()
     return je_purchase
 
 
-def journal_entry_for_income_increase_when_product_sold(order: Order, customer: Customer,line_total:float|Decimal)->JournalEntry:
+def journal_entry_for_income_increase_when_product_sold(
+        order: Order, customer: Customer, line_total: float | Decimal, batch: JournalBatch | None = None
+) -> JournalEntry:
     """
     Journal entry when product is sold, income increases, cash increases
     :param order: Order
     :param customer: Customer
     :param line_total: order total amount
+    :param batch: journal batch the entry is added to, the caller flushes it. Posted right away when not given
     :return:
     """
-    income_account = Account.objects.get(code="4000")
-    cash_account = Account.objects.get(code="1000")
-
-    je_order = JournalEntry.objects.create(description=f"Order {order.id} for customer {customer.id} {customer.user.username}")
-
-    JournalEntryLine.objects.create(journal_entry=je_order,
-                                    account=cash_account,
-                                    debit=line_total,
-                                    credit=0,
-                                    description="Cash from selling product")
-    JournalEntryLine.objects.create(journal_entry=je_order,
-                                    account=income_account,
-                                    debit=0,
-                                    credit=line_total,
-                                    description="Sales income")
+    journal_batch = batch if batch is not None else JournalBatch()
+    je_order = journal_batch.add_entry(
+        f"Order {order.id} for customer {customer.id} {customer.user.username}"
+    )
+    journal_batch.add_transfer(
+        je_order,
+        CASH_ACCOUNT_CODE,
+        SALES_ACCOUNT_CODE,
+        line_total,
+        debit_description="Cash from selling product",
+        credit_description="Sales income",
+    )
+    if batch is None:
+        journal_batch.flush()
     return je_order
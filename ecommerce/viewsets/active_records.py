@@ -0,0 +1,83 @@
+import logging
+
+from crum import get_current_user
+from django.conf import settings
+from django.db import IntegrityError, router, transaction
+from django.db.models import Model
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def _end_active_records(model: type[Model], key: dict, end_date, using: str) -> list[int]:
+    """
+    Lock the active records of a key and end date them with one UPDATE
+    :return: ids of the ended records
+    """
+    ended_ids = list(
+        model._default_manager.using(using)
+        .select_for_update()
+        .filter(end_date__isnull=True, **key)
+        .values_list("pk", flat=True)
+    )
+    if not ended_ids:
+        return []
+    assignments = {"end_date": end_date}
+    field_names = {field.name for field in model._meta.concrete_fields}
+    if "modified_at" in field_names:
+        assignments["modified_at"] = timezone.now()
+    user = get_current_user()
+    if "modified_by" in field_names and user and user.is_authenticated:
+        assignments["modified_by"] = user
+    model._default_manager.using(using).filter(pk__in=ended_ids).update(**assignments)
+    return ended_ids
+
+
+def _is_unique_violation(error: IntegrityError, model: type[Model]) -> bool:
+    # PostgreSQL names the violated constraint, SQLite only says a unique constraint failed
+    diag = getattr(error.__cause__, "diag", None)
+    constraint_name = getattr(diag, "constraint_name", None)
+    if constraint_name is not None:
+        return constraint_name in {constraint.name for constraint in model._meta.constraints}
+    return "UNIQUE constraint failed" in str(error)
+
+
+def swap_active_record(
+        model: type[Model],
+        key: dict,
+        values: dict,
+        start_field: str = "start_date",
+        retries: int | None = None,
+) -> tuple[Model, list[int]]:
+    """
+    Replace the active record (end_date is NULL) of a key.
+    The active record is locked, end dated with one UPDATE and the new one inserted right after, all in a savepoint.
+    When a concurrent swap of the same key inserts its record after the lock was taken, the insert violates
+    the partial unique constraint on active records, the savepoint is rolled back and the swap retried,
+    ending the record the other swap inserted.
+    :param model: model with a nullable end_date and a unique constraint on its active records per key
+    :param key: column values identifying the active record, e.g. {"product_id": 1},
+        empty when only one record is active
+    :param values: other fields of the new record
+    :param start_field: date field set to today on the new record
+    :param retries: times to retry after a conflict, ACTIVE_RECORD_SWAP_RETRIES by default
+    :return: new record and ids of the records it replaced
+    """
+    if retries is None:
+        retries = getattr(settings, "ACTIVE_RECORD_SWAP_RETRIES", 3)
+    using = router.db_for_write(model)
+    for attempt in range(retries + 1):
+        today = timezone.now().date()
+        try:
+            with transaction.atomic(using=using):
+                ended_ids = _end_active_records(model, key, today, using)
+                new_record = model(**key, **values, **{start_field: today})
+                # saved rather than bulk inserted so the model's signals and audit fields still apply
+                new_record.save(using=using)
+            return new_record, ended_ids
+        except IntegrityError as e:
+            if not _is_unique_violation(e, model) or attempt == retries:
+                raise
+            logger.debug(
+                f"Retrying swap of active {model.__name__} {key} after a concurrent swap, attempt {attempt + 1}"
+            )
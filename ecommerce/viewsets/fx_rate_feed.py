@@ -0,0 +1,156 @@
+import json
+import logging
+from decimal import Decimal, InvalidOperation
+from typing import IO
+
+import pandas as pd
+from crum import get_current_user
+from django.db import transaction
+from django.utils import timezone
+
+from ecommerce.models.product.models import Currency, FXRate
+from ecommerce.viewsets.utils import bump_fx_rate_matrix_version
+
+logger = logging.getLogger(__name__)
+
+FX_RATE_QUANTUM = Decimal("0.000001")  # FXRate.rate has 6 decimal places
+FX_RATE_FEED_CSV_COLUMNS = ["currency", "rate"]
+FX_RATE_END_DATE_BATCH_SIZE = 1000
+
+
+def parse_fx_rate_feed(data: dict) -> tuple[str | None, dict[str, Decimal]]:
+    """
+    :param data: {"base": "JPY", "rates": {"USD": 0.0067, ...}} or just the rates mapping
+    :return: base currency code if given and mapping of currency code to amount of that currency per base unit
+    """
+    if not isinstance(data, dict):
+        raise ValueError("FX rate feed must be a JSON object")
+    base = data.get("base")
+    rates = data.get("rates", data if base is None else None)
+    if not isinstance(rates, dict) or not rates:
+        raise ValueError("FX rate feed has no rates")
+    parsed = {}
+    for code, rate in rates.items():
+        if code == "base":
+            continue
+        try:
+            rate = Decimal(str(rate))
+        except InvalidOperation:
+            raise ValueError(f"Invalid FX rate {rate} of {code}")
+        if not rate.is_finite() or rate <= 0:
+            raise ValueError(f"Invalid FX rate {rate} of {code}")
+        parsed[str(code).strip().upper()] = rate
+    return (str(base).strip().upper() if base else None), parsed
+
+
+def read_fx_rate_feed(file_obj: IO, file_name: str) -> tuple[str | None, dict[str, Decimal]]:
+    """
+    :param file_obj: JSON feed, see parse_fx_rate_feed, or CSV with currency and rate columns
+    :param file_name: .json files are read as JSON, anything else as CSV
+    :return: base currency code if given and mapping of currency code to rate
+    """
+    if file_name.lower().endswith(".json"):
+        return parse_fx_rate_feed(json.load(file_obj))
+    df = pd.read_csv(file_obj, dtype=str, skipinitialspace=True)
+    df.columns = [str(column).strip().lower() for column in df.columns]
+    missing_cols = [column for column in FX_RATE_FEED_CSV_COLUMNS if column not in df.columns]
+    if missing_cols:
+        raise ValueError(f"Missing columns: {missing_cols}")
+    return parse_fx_rate_feed({"rates": dict(zip(df["currency"], df["rate"]))})
+
+
+def swap_active_fx_rates(
+        base_code: str, rates: dict[str, Decimal], source: str = "FEED", dry_run: bool = False
+) -> dict:
+    """
+    Make the complete cross rate matrix of a rate vector the active set of FX rates in one transaction.
+    Unchanged active rates are kept, changed ones are end dated and replaced,
+    active rates between currencies missing from the vector are end dated.
+    :param base_code: currency the rates are quoted against
+    :param rates: mapping of currency code to amount of that currency per base unit
+    :param source: stored on the created rates
+    :param dry_run: report the changes without writing them
+    :return: counts of created, updated, unchanged and ended rates and the changes of the base rates
+    """
+    rates = {**rates, base_code: Decimal("1")}
+    currencies = Currency.objects.in_bulk(rates.keys(), field_name="code")
+    unknown_codes = sorted(rates.keys() - currencies.keys())
+    if unknown_codes:
+        raise ValueError(f"Unknown currencies: {', '.join(unknown_codes)}")
+
+    # from a to b is the amount of b per a unit, i.e. (b per base) / (a per base)
+    matrix = {}
+    for from_code, from_rate in rates.items():
+        for to_code, to_rate in rates.items():
+            if from_code != to_code:
+                rate = (to_rate / from_rate).quantize(FX_RATE_QUANTUM)
+                if rate == 0:
+                    raise ValueError(f"FX rate {from_code}/{to_code} is too small to store")
+                matrix[(currencies[from_code].id, currencies[to_code].id)] = rate
+
+    today = timezone.now().date()
+    user = get_current_user()
+    with transaction.atomic():
+        active_rates = {
+            (fx_rate.currency_from_id, fx_rate.currency_to_id): fx_rate
+            for fx_rate in FXRate.objects.select_for_update().filter(end_date__isnull=True)
+        }
+        ended_ids = [
+            fx_rate.id
+            for pair, fx_rate in active_rates.items()
+            if pair not in matrix or fx_rate.rate != matrix[pair]
+        ]
+        new_fx_rates = [
+            FXRate(
+                currency_from_id=from_id,
+                currency_to_id=to_id,
+                rate=rate,
+                start_date=today,
+                source=source,
+                modified_by=user if user and user.is_authenticated else None,
+            )
+            for (from_id, to_id), rate in matrix.items()
+            if (from_id, to_id) not in active_rates or active_rates[(from_id, to_id)].rate != rate
+        ]
+        if not dry_run:
+            for start in range(0, len(ended_ids), FX_RATE_END_DATE_BATCH_SIZE):
+                FXRate.objects.filter(
+                    id__in=ended_ids[start:start + FX_RATE_END_DATE_BATCH_SIZE]
+                ).update(end_date=today)
+            FXRate.objects.bulk_create(new_fx_rates)
+            # bulk statements don't send the FXRate signals
+            transaction.on_commit(bump_fx_rate_matrix_version)
+
+    base_id = currencies[base_code].id
+    updated = sum(1 for fx_rate in new_fx_rates if (fx_rate.currency_from_id, fx_rate.currency_to_id) in active_rates)
+    report = {
+        "base": base_code,
+        "currencies": len(rates),
+        "created": len(new_fx_rates) - updated,
+        "updated": updated,
+        "unchanged": len(matrix) - len(new_fx_rates),
+        "ended": len(ended_ids) - updated,
+        "dry_run": dry_run,
+        "changes": [
+            {
+                "currency": code,
+                "old_rate": (
+                    active_rates[(base_id, currency.id)].rate
+                    if (base_id, currency.id) in active_rates
+                    else None
+                ),
+                "new_rate": matrix[(base_id, currency.id)],
+            }
+            for code, currency in sorted(currencies.items())
+            if code != base_code
+            and (
+                (base_id, currency.id) not in active_rates
+                or active_rates[(base_id, currency.id)].rate != matrix[(base_id, currency.id)]
+            )
+        ],
+    }
+    logger.info(
+        f"{'Checked' if dry_run else 'Swapped'} FX rates of {len(rates)} currencies against {base_code} : "
+        f"{report['created']} created, {report['updated']} updated, {report['ended']} ended"
+    )
+    return report
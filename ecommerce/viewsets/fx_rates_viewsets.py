@@ -1,58 +1,90 @@
 import logging
 from decimal import Decimal
+from typing import Iterable
 
+from crum import get_current_user
 from django.conf import settings
+from django.db import transaction
 from django.db.models import Q
 from django.utils import timezone
 from rest_framework import status
 from rest_framework.generics import ListAPIView
-from rest_framework.parsers import JSONParser
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from ecommerce.models.product.models import Currency, FXRate
 from ecommerce.permissions import IsStaff
 from ecommerce.serializers.product.serializers import FXRateSerializer
+from ecommerce.viewsets.active_records import swap_active_record
+from ecommerce.viewsets.fx_rate_feed import (
+    parse_fx_rate_feed,
+    read_fx_rate_feed,
+    swap_active_fx_rates,
+)
+from ecommerce.viewsets.utils import bump_fx_rate_matrix_version
 
 logger = logging.getLogger(__name__)
 
 
-def calculate_and_save_ccy_to_other_ccy_fx_rate(
-    ccy: Currency,
-    other_ccy: Currency,
-    primary_ccy: Currency,
-    fx_rate_against_primary_ccy: float,
-) -> FXRate:
+def recompute_cross_rates(primary_ccy: Currency, updated_currency_ids: Iterable[int]) -> list[FXRate]:
     """
-    Update FX rate ccy to other ccy given primary ccy and against primary ccy fx rate
-    :param ccy:
-    :param other_ccy:
-    :param primary_ccy:
-    :param fx_rate_against_primary_ccy:
-    :return:
+    Recompute the active cross rates between the updated currencies and every other currency.
+    Cross rates are triangulated in memory from the active rates of the primary currency,
+    the rates they replace are end dated with one update and the new ones written with one bulk_create.
+    :param primary_ccy: currency all other currencies have an active rate against
+    :param updated_currency_ids: currencies whose rate against the primary currency changed
+    :return: created cross rates
+    :raises ValueError: when an active rate of the primary currency is zero or negative
     """
-    other_ccy_to_primary_ccy_fx_rate = FXRate.objects.filter(
-        currency_from=primary_ccy, currency_to=other_ccy, end_date__isnull=True
-    ).first()
-    active_fx_rate = FXRate.objects.filter(
-        currency_from=ccy, currency_to=other_ccy, end_date__isnull=True
-    ).first()
-    if active_fx_rate:
-        active_fx_rate.end_date = timezone.now().date()
-        active_fx_rate.save()
-
-    # create new fx rate
-    ccy_to_other_ccy_fx_rate_val = (
-        other_ccy_to_primary_ccy_fx_rate.rate / fx_rate_against_primary_ccy
-    )
-    new_fx_rate = FXRate.objects.create(
-        currency_from=ccy,
-        currency_to=other_ccy,
-        rate=Decimal(ccy_to_other_ccy_fx_rate_val),
-        start_date=timezone.now().date(),
+    primary_rates = dict(
+        FXRate.objects.filter(currency_from=primary_ccy, end_date__isnull=True)
+        .exclude(currency_to=primary_ccy)
+        .values_list("currency_to_id", "rate")
     )
-    logger.debug(f"Created new fx rate {new_fx_rate}")
-    return new_fx_rate
+    updated_currency_ids = set(updated_currency_ids) - {primary_ccy.id}
+    missing_ids = updated_currency_ids - primary_rates.keys()
+    if missing_ids:
+        logger.debug(f"Skipped cross rates of currencies {sorted(missing_ids)} without a rate against {primary_ccy}")
+        updated_currency_ids -= missing_ids
+    if not updated_currency_ids:
+        return []
+    non_positive_ids = sorted(ccy_id for ccy_id, rate in primary_rates.items() if rate <= 0)
+    if non_positive_ids:
+        raise ValueError(f"Non-positive rates of currencies {non_positive_ids} against {primary_ccy}")
+
+    # primary to X rate is the amount of X per primary unit, so ccy to other is other rate / ccy rate
+    cross_rates = {}
+    for ccy_id in updated_currency_ids:
+        for other_ccy_id, other_rate in primary_rates.items():
+            if other_ccy_id != ccy_id:
+                cross_rates[(ccy_id, other_ccy_id)] = other_rate / primary_rates[ccy_id]
+                cross_rates[(other_ccy_id, ccy_id)] = primary_rates[ccy_id] / other_rate
+
+    today = timezone.now().date()
+    user = get_current_user()
+    with transaction.atomic():
+        FXRate.objects.filter(
+            Q(currency_from_id__in=updated_currency_ids, currency_to_id__in=primary_rates.keys())
+            | Q(currency_from_id__in=primary_rates.keys(), currency_to_id__in=updated_currency_ids),
+            end_date__isnull=True,
+        ).update(end_date=today)
+        new_fx_rates = FXRate.objects.bulk_create(
+            [
+                FXRate(
+                    currency_from_id=ccy_id,
+                    currency_to_id=other_ccy_id,
+                    rate=rate,
+                    start_date=today,
+                    modified_by=user if user and user.is_authenticated else None,
+                )
+                for (ccy_id, other_ccy_id), rate in cross_rates.items()
+            ]
+        )
+        # bulk statements don't send the FXRate signals
+        transaction.on_commit(bump_fx_rate_matrix_version)
+    logger.debug(f"Recomputed {len(new_fx_rates)} cross rates of {len(updated_currency_ids)} currencies")
+    return new_fx_rates
 
 
 def add_or_update_fx_rates_against_non_primary_currency(
@@ -63,34 +95,9 @@ def add_or_update_fx_rates_against_non_primary_currency(
     :param fx_rate_against_primary:
     :return:
     """
-    primary_currency = fx_rate_against_primary.currency_from
-    currency_to_update = fx_rate_against_primary.currency_to
-    currency_from_id = fx_rate_against_primary.currency_from.id
-    currency_to_id = fx_rate_against_primary.currency_to.id
-    other_currencies = Currency.objects.exclude(
-        Q(id=currency_from_id) | Q(id=currency_to_id)
+    recompute_cross_rates(
+        fx_rate_against_primary.currency_from, [fx_rate_against_primary.currency_to_id]
     )
-    for other_currency in other_currencies:
-        ccy_to_other_ccy_fx_rate = calculate_and_save_ccy_to_other_ccy_fx_rate(
-            currency_to_update,
-            other_currency,
-            primary_currency,
-            fx_rate_against_primary.rate,
-        )
-        logger.debug(f"Created {ccy_to_other_ccy_fx_rate}")
-
-        other_ccy_to_primary_ccy_fx_rate = FXRate.objects.filter(
-            currency_from=primary_currency,
-            currency_to=other_currency,
-            end_date__isnull=True,
-        ).first()
-        other_ccy_to_ccy_fx_rate = calculate_and_save_ccy_to_other_ccy_fx_rate(
-            other_currency,
-            currency_to_update,
-            primary_currency,
-            other_ccy_to_primary_ccy_fx_rate.rate,
-        )
-        logger.debug(f"Created {other_ccy_to_ccy_fx_rate}")
 
 
 def create_fx_rate_given_new_rate(
@@ -99,18 +106,10 @@ def create_fx_rate_given_new_rate(
     new_fx_rate: float,
     fx_rate_source: str = "FXRATESOURCE",
 ):
-    active_fx_rate = FXRate.objects.filter(
-        currency_from=currency_from, currency_to=currency_to, end_date__isnull=True
-    ).first()
-    if active_fx_rate:
-        active_fx_rate.end_date = timezone.now().date()
-        active_fx_rate.save()
-    new_fx_rate_obj = FXRate.objects.create(
-        currency_from=currency_from,
-        currency_to=currency_to,
-        rate=Decimal(new_fx_rate),
-        start_date=timezone.now().date(),
-        source=fx_rate_source,
+    new_fx_rate_obj, _ = swap_active_record(
+        FXRate,
+        {"currency_from_id": currency_from.id, "currency_to_id": currency_to.id},
+        {"rate": Decimal(new_fx_rate), "source": fx_rate_source},
     )
     logger.debug(f"Created new fx rate {new_fx_rate_obj}")
     return new_fx_rate_obj
@@ -122,14 +121,17 @@ def create_or_udpate_fx_rate_given_against_primary_ccy_rate(fx_rate_data: dict):
         id=fx_rate_data["currency_from_id"]
     )  # this is expected to match primary currency
     currency_to = Currency.objects.get(id=fx_rate_data["currency_to_id"])
-    new_against_primary_ccy_rate = create_fx_rate_given_new_rate(
-        currency_from, currency_to, float(fx_rate_data.get("rate"))
-    )
-    add_or_update_fx_rates_against_non_primary_currency(new_against_primary_ccy_rate)
+    if not float(fx_rate_data.get("rate")) > 0:
+        raise ValueError(f"Invalid FX rate {fx_rate_data.get('rate')}")
+    with transaction.atomic():
+        new_against_primary_ccy_rate = create_fx_rate_given_new_rate(
+            currency_from, currency_to, float(fx_rate_data.get("rate"))
+        )
+        add_or_update_fx_rates_against_non_primary_currency(new_against_primary_ccy_rate)
 
-    # also save currency to primary currency rate which is simple the reverse of specified rate in fx_rate_data
-    ccy_to_primary_rate = 1 / float(fx_rate_data.get("rate"))
-    create_fx_rate_given_new_rate(currency_to, currency_from, ccy_to_primary_rate)
+        # also save currency to primary currency rate which is simple the reverse of specified rate in fx_rate_data
+        ccy_to_primary_rate = 1 / float(fx_rate_data.get("rate"))
+        create_fx_rate_given_new_rate(currency_to, currency_from, ccy_to_primary_rate)
     return new_against_primary_ccy_rate
 
 
@@ -165,6 +167,38 @@ class FXRateCreateUpdateAPIView(APIView):
             )
 
 
+class FXRateFeedAPIView(APIView):
+    """
+    Replaces the active FX rates with the cross rate matrix of a rate vector,
+    uploaded as a JSON or CSV file or posted as JSON. Add ?dry_run=1 to only report the changes.
+    """
+
+    parser_classes = [MultiPartParser, FormParser, JSONParser]
+    permission_classes = [IsStaff]
+
+    def post(self, request):
+        try:
+            file_obj = request.FILES.get("file")
+            if file_obj:
+                feed_base, rates = read_fx_rate_feed(file_obj, file_obj.name)
+            else:
+                feed_base, rates = parse_fx_rate_feed(request.data)
+            base = request.query_params.get("base") or feed_base or settings.PRIMARY_FXRATE_CURRENCY
+            report = swap_active_fx_rates(
+                base.upper(),
+                rates,
+                source=request.query_params.get("source") or "FEED",
+                dry_run=request.query_params.get("dry_run") in ("1", "true"),
+            )
+            return Response(report, status=status.HTTP_200_OK)
+        except Exception as e:
+            logger.debug(f"Error happened when loading fx rate feed : {e}")
+            return Response(
+                {"error": f"Error when loading fx rate feed {e}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+
 class FxRateAgainstPrimaryCcyListView(ListAPIView):
     serializer_class = FXRateSerializer
 
@@ -0,0 +1,112 @@
+import datetime
+import logging
+from typing import Iterable
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from ecommerce.models import Customer, Inventory, Product, StockReservation
+
+logger = logging.getLogger(__name__)
+
+
+def lock_in_stock_batches(product_ids: Iterable[int]):
+    """
+    Non-empty inventory batches of the products, locked until the end of the transaction.
+    Checkouts and reservations of the same products wait for each other here. Rows are locked in
+    (product, FIFO) order so that concurrent baskets can't deadlock.
+    """
+    return (
+        Inventory.objects.select_for_update(of=("self",))
+        .filter(product_id__in=list(product_ids), stock__gt=0)
+        .order_by("product_id", "purchase_datetime", "id")
+    )
+
+
+def reserved_quantities(
+        product_ids: Iterable[int], exclude_reservation_ids: Iterable[int] = ()
+) -> dict[int, int]:
+    """
+    :param product_ids:
+    :param exclude_reservation_ids: reservations not to count, e.g. the ones being consumed by a checkout
+    :return: mapping of product id to quantity held by active reservations that haven't expired
+    """
+    return dict(
+        StockReservation.objects.filter(
+            product_id__in=list(product_ids),
+            status=StockReservation.STATUS_ACTIVE,
+            expires_at__gt=timezone.now(),
+        )
+        .exclude(id__in=list(exclude_reservation_ids))
+        .order_by()
+        .values("product_id")
+        .annotate(reserved=Sum("quantity"))
+        .values_list("product_id", "reserved")
+    )
+
+
+def raise_if_short(basket: dict[int, int], available: dict[int, int], message: str):
+    short_product_ids = [
+        product_id for product_id, quantity in basket.items() if quantity > available.get(product_id, 0)
+    ]
+    if short_product_ids:
+        product_names = Product.objects.filter(id__in=short_product_ids).values_list("name", flat=True)
+        raise ValueError(f"{message} {', '.join(product_names)}")
+
+
+def reserve_stock(
+        basket: dict[int, int], customer: Customer | None = None, ttl_seconds: int | None = None
+) -> list[StockReservation]:
+    """
+    Hold stock of a basket for a customer until checkout or expiry
+    :param basket: mapping of product id to quantity
+    :param customer:
+    :param ttl_seconds: lifetime of the reservations, defaults to STOCK_RESERVATION_TTL_SECONDS
+    :return: created reservations
+    """
+    basket = {product_id: quantity for product_id, quantity in basket.items() if quantity > 0}
+    if not basket:
+        return []
+    ttl_seconds = ttl_seconds or getattr(settings, "STOCK_RESERVATION_TTL_SECONDS", 900)
+    with transaction.atomic():
+        available = {}
+        for inventory in lock_in_stock_batches(basket.keys()):
+            available[inventory.product_id] = available.get(inventory.product_id, 0) + inventory.stock
+        for product_id, reserved in reserved_quantities(basket.keys()).items():
+            available[product_id] = available.get(product_id, 0) - reserved
+        raise_if_short(basket, available, "Not enough stock to reserve")
+
+        expires_at = timezone.now() + datetime.timedelta(seconds=ttl_seconds)
+        reservations = StockReservation.objects.bulk_create(
+            [
+                StockReservation(product_id=product_id, customer=customer, quantity=quantity, expires_at=expires_at)
+                for product_id, quantity in basket.items()
+            ]
+        )
+    logger.debug(f"Reserved {basket} for {customer} until {expires_at}")
+    return reservations
+
+
+def release_reservations(reservations) -> int:
+    """
+    :param reservations: StockReservation queryset, only active ones are released
+    :return: number of released reservations
+    """
+    return reservations.filter(status=StockReservation.STATUS_ACTIVE).update(
+        status=StockReservation.STATUS_RELEASED
+    )
+
+
+def expire_reservations() -> int:
+    """
+    Mark active reservations past their expiry as expired. Expired reservations already stop holding stock,
+    this keeps the active ones few.
+    :return: number of expired reservations
+    """
+    expired = StockReservation.objects.filter(
+        status=StockReservation.STATUS_ACTIVE, expires_at__lte=timezone.now()
+    ).update(status=StockReservation.STATUS_EXPIRED)
+    logger.debug(f"Expired {expired} stock reservations")
+    return expired
@@ -1,10 +1,32 @@
 import logging
+import threading
+from collections import defaultdict
+from typing import Iterable
 
-from rest_framework import viewsets
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.shortcuts import get_object_or_404
+from rest_framework import mixins, permissions, status, viewsets
+from rest_framework.response import Response
 
-from ecommerce.models.inventory.models import Inventory, ProductInventory
+from ecommerce.models.inventory.models import (
+    Inventory,
+    ProductInventory,
+    StockReservation,
+)
+from ecommerce.models.product.models import Product
+from ecommerce.models.users.models import Customer
 from ecommerce.permissions import IsStaff
-from ecommerce.serializers import InventorySerializer, ProductInventorySerializer
+from ecommerce.serializers import (
+    InventorySerializer,
+    ProductInventorySerializer,
+    StockReservationSerializer,
+)
+from ecommerce.viewsets.inventory.reservations import (
+    release_reservations,
+    reserve_stock,
+)
+from ecommerce.viewsets.tagged_cache import invalidate_catalog, invalidate_products
 
 logger = logging.getLogger(__name__)
 
@@ -24,3 +46,218 @@ class ProductInventoryViewset(viewsets.ModelViewSet):
         if product_id:
             queryset=queryset.filter(product=product_id)
         return queryset
+
+
+class StockReservationViewSet(
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet,
+):
+    """
+    POST {"items": [{"product_id": 1, "quantity": 2}]} reserves the stock of a submitted cart.
+    Checkouts consume the reservations passed as reservation_ids, DELETE releases one.
+    """
+
+    serializer_class = StockReservationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = StockReservation.objects.order_by("-created_at")
+        if user.is_staff or user.is_superuser:
+            return queryset
+        return queryset.filter(customer__user=user)
+
+    def create(self, request, *args, **kwargs):
+        try:
+            customer = get_object_or_404(Customer, user=request.user)
+            basket = {}
+            for item_data in request.data.get("items", []):
+                product_id = int(item_data.get("product_id"))
+                quantity = int(item_data.get("quantity", 0))
+                if quantity <= 0:
+                    raise ValueError("Quantity must be positive.")
+                basket[product_id] = basket.get(product_id, 0) + quantity
+            reservations = reserve_stock(basket, customer)
+            return Response(
+                self.get_serializer(reservations, many=True).data,
+                status=status.HTTP_201_CREATED,
+            )
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    def destroy(self, request, *args, **kwargs):
+        reservation = self.get_object()
+        release_reservations(StockReservation.objects.filter(pk=reservation.pk))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+def rebuild_product_inventories(product_ids: Iterable[int] | None = None) -> int:
+    """
+    Recalculates ProductInventory totals from Inventory batches with one grouped query.
+    :param product_ids: products to rebuild, all products when None
+    :return: number of ProductInventory records created or updated
+    """
+    products = Product.objects.all()
+    rebuild_all = product_ids is None
+    if not rebuild_all:
+        products = products.filter(id__in=list(product_ids))
+    product_ids = list(products.values_list("id", flat=True))
+
+    totals = dict(
+        Inventory.objects.filter(product_id__in=product_ids)
+        .values("product_id")
+        .annotate(total=Sum("stock"))
+        .values_list("product_id", "total")
+    )
+
+    existing_records = list(ProductInventory.objects.filter(product_id__in=product_ids))
+    for record in existing_records:
+        record.total_inventory = totals.get(record.product_id) or 0
+    ProductInventory.objects.bulk_update(existing_records, ["total_inventory"])
+
+    existing_product_ids = {record.product_id for record in existing_records}
+    new_records = ProductInventory.objects.bulk_create(
+        [
+            ProductInventory(product_id=product_id, total_inventory=totals.get(product_id) or 0)
+            for product_id in product_ids
+            if product_id not in existing_product_ids
+        ]
+    )
+    logger.debug(
+        f"Rebuilt total inventories : updated {len(existing_records)}, created {len(new_records)}"
+    )
+    if rebuild_all:
+        invalidate_catalog()
+    else:
+        invalidate_products(product_ids)
+    return len(existing_records) + len(new_records)
+
+
+def apply_inventory_deltas(deltas: dict[int, int]) -> set[int]:
+    """
+    Applies stock deltas to ProductInventory totals with one atomic F() update.
+    Products that don't have a ProductInventory record yet are rebuilt from their batches.
+    A total that would go negative has drifted from its batches, e.g. after a queryset.update() of stock
+    that bypassed the signals. It is logged and rebuilt from the batches instead.
+    :param deltas: mapping of product id to stock change
+    :return: ids of the products rebuilt from their batches
+    """
+    deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+    if not deltas:
+        return set()
+    rebuilt_product_ids = set()
+    with transaction.atomic():
+        decreases = {product_id: delta for product_id, delta in deltas.items() if delta < 0}
+        drifted_product_ids = [
+            product_id
+            for product_id, total_inventory in ProductInventory.objects.select_for_update()
+            .filter(product_id__in=decreases.keys())
+            .values_list("product_id", "total_inventory")
+            if total_inventory + decreases[product_id] < 0
+        ]
+        if drifted_product_ids:
+            logger.error(
+                f"Total inventory of products {drifted_product_ids} would go negative, "
+                f"rebuilding them from their batches"
+            )
+            rebuild_product_inventories(drifted_product_ids)
+            rebuilt_product_ids.update(drifted_product_ids)
+            deltas = {
+                product_id: delta for product_id, delta in deltas.items() if product_id not in drifted_product_ids
+            }
+
+        if deltas:
+            delta_expression = Case(
+                *[When(product_id=product_id, then=Value(delta)) for product_id, delta in deltas.items()],
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+            updated = ProductInventory.objects.filter(product_id__in=deltas.keys()).update(
+                total_inventory=F("total_inventory") + delta_expression
+            )
+            if updated < len(deltas):
+                tracked_product_ids = set(
+                    ProductInventory.objects.filter(product_id__in=deltas.keys()).values_list(
+                        "product_id", flat=True
+                    )
+                )
+                rebuild_product_inventories(set(deltas.keys()) - tracked_product_ids)
+                rebuilt_product_ids.update(set(deltas.keys()) - tracked_product_ids)
+    invalidate_products(deltas.keys())
+    logger.debug(f"Applied total inventory deltas : {deltas}")
+    return rebuilt_product_ids
+
+
+class InventoryDeltaBuffer:
+    """
+    Collects stock deltas of one transaction (or savepoint) and applies them once on commit.
+    """
+
+    def __init__(self, savepoint_ids: list[str], rebuilt_product_ids: set[int] = None):
+        """
+        :param savepoint_ids: savepoints of the transaction the deltas are applied on commit of
+        :param rebuilt_product_ids: products rebuilt from their batches by the buffers of the same commit,
+            the rebuild already counted the deltas of the buffers run after it
+        """
+        self.savepoint_ids = savepoint_ids
+        self.rebuilt_product_ids = set() if rebuilt_product_ids is None else rebuilt_product_ids
+        self.deltas = defaultdict(int)
+        self.applied = False
+
+    def __call__(self):
+        self.rebuilt_product_ids.update(
+            apply_inventory_deltas(
+                {
+                    product_id: delta
+                    for product_id, delta in self.deltas.items()
+                    if product_id not in self.rebuilt_product_ids
+                }
+            )
+        )
+        self.applied = True
+
+    def is_queued(self, connection) -> bool:
+        # Django drops on_commit callbacks of rolled back transactions and savepoints
+        return not self.applied and any(func is self for _, func, _ in connection.run_on_commit)
+
+    def is_pending(self, connection) -> bool:
+        # a buffer is only reusable while it is still queued for the current savepoint
+        return self.is_queued(connection) and self.savepoint_ids == connection.savepoint_ids
+
+
+_inventory_delta_buffers = threading.local()
+
+
+def record_inventory_delta(product_id: int, delta: int):
+    """
+    Records a stock change of a product. Changes made inside a transaction are summed up
+    and applied to ProductInventory once, when the transaction commits.
+    :param product_id:
+    :param delta: stock change, negative when stock decreases
+    :return:
+    """
+    if not delta:
+        return
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        apply_inventory_deltas({product_id: delta})
+        return
+    buffer = getattr(_inventory_delta_buffers, "buffer", None)
+    if buffer is None or not buffer.is_pending(connection):
+        # buffers of one transaction run one after the other on commit and share the products they rebuild
+        queued_buffer = next(
+            (
+                func
+                for _, func, _ in connection.run_on_commit
+                if isinstance(func, InventoryDeltaBuffer) and not func.applied
+            ),
+            None,
+        )
+        buffer = InventoryDeltaBuffer(
+            list(connection.savepoint_ids), queued_buffer.rebuilt_product_ids if queued_buffer else None
+        )
+        _inventory_delta_buffers.buffer = buffer
+        transaction.on_commit(buffer)
+    buffer.deltas[product_id] += delta
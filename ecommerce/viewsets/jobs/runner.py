@@ -0,0 +1,229 @@
+import datetime
+import logging
+import threading
+import traceback
+
+import pandas as pd
+from crum import impersonate
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.utils import timezone
+
+from ecommerce.models import ImportJob
+from ecommerce.viewsets.product.bulk_import import bulk_import_products_from_dataframe
+from ecommerce.viewsets.purchase.bulk_import import PurchaseCSVIngestor
+from ecommerce.viewsets.purchase_order_viewsets import (
+    PURCHASE_AND_ORDER_CSV_REQUIRED_COLUMNS,
+    create_purchase_and_order_from_csv_row,
+)
+from ecommerce.viewsets.utils import get_fx_rate_matrix
+
+logger = logging.getLogger(__name__)
+
+MAX_IMPORT_JOB_ERRORS = 1000
+ROW_PROGRESS_INTERVAL = 100
+# seconds between touches of a running job while its worker is busy, keep IMPORT_JOB_STALE_AFTER_SECONDS well above
+IMPORT_JOB_HEARTBEAT_SECONDS = 60
+PRODUCT_CSV_REQUIRED_COLUMNS = ["product_name", "category_name", "price", "stock"]
+
+
+class ImportJobLost(Exception):
+    """
+    The job is no longer running for this worker, e.g. it was failed as stale
+    """
+
+
+def _claimed_job(job: ImportJob):
+    return ImportJob.objects.filter(pk=job.pk, status=ImportJob.STATUS_RUNNING, worker=job.worker)
+
+
+def update_import_job(job: ImportJob, **fields):
+    """
+    Save progress fields of a running job right away, so that pollers see them
+    :raises ImportJobLost: when the job isn't running for its worker anymore, the worker has to stop
+    """
+    if "errors" in fields:
+        fields["errors"] = fields["errors"][:MAX_IMPORT_JOB_ERRORS]
+    for field, value in fields.items():
+        setattr(job, field, value)
+    if not _claimed_job(job).update(modified_at=timezone.now(), **fields):
+        raise ImportJobLost(f"{job} isn't running for worker {job.worker} anymore")
+
+
+class ImportJobHeartbeat(threading.Thread):
+    """
+    Touches a running job every interval seconds, so a long chunk without progress doesn't make it look stale
+    """
+
+    def __init__(self, job: ImportJob, interval: float = IMPORT_JOB_HEARTBEAT_SECONDS):
+        super().__init__(name=f"heartbeat-{job.pk}", daemon=True)
+        self.job = job
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                try:
+                    if not _claimed_job(self.job).update(modified_at=timezone.now()):
+                        return
+                except DatabaseError as e:
+                    logger.warning(f"Heartbeat of {self.job} failed : {e}")
+        finally:
+            connections.close_all()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def _read_job_csv(job: ImportJob, required_cols: list[str]) -> pd.DataFrame:
+    with job.file.open("rb") as f:
+        df = pd.read_csv(f)
+    missing_cols = [col for col in required_cols if col not in df.columns]
+    if missing_cols:
+        raise ValueError(f"Missing columns: {missing_cols}")
+    update_import_job(job, total_rows=len(df))
+    return df
+
+
+def run_product_import(job: ImportJob) -> str:
+    df = _read_job_csv(job, PRODUCT_CSV_REQUIRED_COLUMNS)
+    result = bulk_import_products_from_dataframe(
+        df,
+        user=job.modified_by,
+        progress=lambda processed, failed, errors: update_import_job(
+            job, processed_rows=processed, failed_rows=failed, errors=errors
+        ),
+    )
+    update_import_job(job, errors=result["errors"])
+    return f"Created {result['created']}, updated {result['updated']} and left {result['unchanged']} products unchanged"
+
+
+def run_purchase_import(job: ImportJob) -> str:
+    ingestor = PurchaseCSVIngestor(
+        progress=lambda processed: update_import_job(job, processed_rows=processed)
+    )
+    with job.file.open("rb") as f:
+        processed = ingestor.ingest(f)
+    update_import_job(job, total_rows=processed)
+    return f"Successfully processed {processed} purchases."
+
+
+def run_purchase_and_order_import(job: ImportJob) -> str:
+    df = _read_job_csv(job, PURCHASE_AND_ORDER_CSV_REQUIRED_COLUMNS)
+    fx_rates = get_fx_rate_matrix().as_dict()
+    created_purchases = 0
+    created_orders = 0
+    for n, (i, row) in enumerate(df.iterrows(), start=1):
+        try:
+            purchase, order = create_purchase_and_order_from_csv_row(row, df.columns, fx_rates)
+        except Exception as e:
+            # like the synchronous upload, the import stops at the first bad row and the rows before it stay
+            update_import_job(
+                job,
+                processed_rows=n - 1,
+                failed_rows=1,
+                errors=[{"row": i, "product_name": row.get("product_name"), "error": str(e)}],
+            )
+            raise ValueError(f"Error while processing purchase order for {row.get('product_name')} (row {i}) : {e}")
+        created_purchases += 1
+        if order:
+            created_orders += 1
+        if n % ROW_PROGRESS_INTERVAL == 0 or n == len(df):
+            update_import_job(job, processed_rows=n)
+    return f"Processed {created_purchases} purchases and {created_orders} orders."
+
+
+IMPORT_JOB_RUNNERS = {
+    ImportJob.KIND_PRODUCTS: run_product_import,
+    ImportJob.KIND_PURCHASES: run_purchase_import,
+    ImportJob.KIND_PURCHASES_AND_ORDERS: run_purchase_and_order_import,
+}
+
+
+def fail_stale_import_jobs(stale_after: int = None) -> int:
+    """
+    Fail running jobs whose worker hasn't saved progress or a heartbeat for stale_after seconds, so a worker
+    that crashed doesn't leave them running forever. They are failed rather than queued again
+    because the rows imported before the crash are already committed, and purchases aren't
+    deduplicated on a second run.
+    :param stale_after: seconds without progress, IMPORT_JOB_STALE_AFTER_SECONDS when None
+    :return: number of failed jobs
+    """
+    if stale_after is None:
+        stale_after = settings.IMPORT_JOB_STALE_AFTER_SECONDS
+    now = timezone.now()
+    failed = ImportJob.objects.filter(
+        status=ImportJob.STATUS_RUNNING, modified_at__lt=now - datetime.timedelta(seconds=stale_after)
+    ).update(
+        status=ImportJob.STATUS_FAILED,
+        message=f"The worker stopped saving progress for {stale_after} seconds, "
+                f"rows up to the processed count may have been imported",
+        finished_at=now,
+        modified_at=now,
+    )
+    if failed:
+        logger.warning(f"Failed {failed} stale import jobs")
+    return failed
+
+
+def claim_import_jobs(limit: int, worker: str, stale_after: int = None) -> list[ImportJob]:
+    """
+    Mark up to limit pending jobs as running for this worker, after failing stale running jobs.
+    Jobs locked by another worker are skipped, and the conditional update makes sure
+    that a job is only claimed once on databases without row locks.
+    :param limit: maximum number of jobs to claim
+    :param worker: name of the claiming worker
+    :param stale_after: see fail_stale_import_jobs
+    :return: claimed jobs, oldest first
+    """
+    fail_stale_import_jobs(stale_after)
+    if limit <= 0:
+        return []
+    claimed = []
+    with transaction.atomic():
+        pending_jobs = (
+            ImportJob.objects.select_for_update(skip_locked=True)
+            .filter(status=ImportJob.STATUS_PENDING)
+            .order_by("id")[:limit]
+        )
+        for job in pending_jobs:
+            started_at = timezone.now()
+            if ImportJob.objects.filter(pk=job.pk, status=ImportJob.STATUS_PENDING).update(
+                    status=ImportJob.STATUS_RUNNING, worker=worker, started_at=started_at, modified_at=started_at
+            ):
+                job.status = ImportJob.STATUS_RUNNING
+                job.worker = worker
+                job.started_at = started_at
+                claimed.append(job)
+    return claimed
+
+
+def run_import_job(job: ImportJob, heartbeat_interval: float = IMPORT_JOB_HEARTBEAT_SECONDS):
+    """
+    Run a claimed job and record its outcome. Records are audited as the user who queued the job.
+    The job is given up as soon as it isn't running for this worker anymore, e.g. because it was failed as stale.
+    Meant to run in a worker thread, so the thread's database connections are closed at the end.
+    """
+    heartbeat = ImportJobHeartbeat(job, heartbeat_interval)
+    heartbeat.start()
+    try:
+        try:
+            with impersonate(job.modified_by):
+                message = IMPORT_JOB_RUNNERS[job.kind](job)
+        except ImportJobLost:
+            raise
+        except Exception as e:
+            logger.error(f"{job} failed : {e}\n{traceback.format_exc()}")
+            status, message = ImportJob.STATUS_FAILED, str(e)
+        else:
+            logger.info(f"{job} finished : {message}")
+            status = ImportJob.STATUS_SUCCEEDED
+        heartbeat.stop()
+        update_import_job(job, status=status, message=message, finished_at=timezone.now())
+    except ImportJobLost as e:
+        logger.warning(f"Stopped {job} : {e}")
+    finally:
+        heartbeat.stop()
+        connections.close_all()
@@ -0,0 +1,39 @@
+from django.urls import reverse
+from rest_framework import status, viewsets
+from rest_framework.response import Response
+
+from ecommerce.models import ImportJob
+from ecommerce.permissions import IsStaff
+from ecommerce.serializers import ImportJobSerializer
+
+
+class ImportJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Lets staff poll the status, row counts, throughput and errors of queued CSV imports
+    """
+
+    queryset = ImportJob.objects.all()
+    serializer_class = ImportJobSerializer
+    permission_classes = [IsStaff]
+
+
+def is_background_request(request) -> bool:
+    return str(request.query_params.get("background", "")).lower() in ("1", "true", "yes")
+
+
+def enqueue_import_job(request, kind: str) -> Response:
+    """
+    Store the uploaded CSV as an import job for the run_import_jobs worker
+    :param request: request with the CSV in its file field
+    :param kind: one of ImportJob.KIND_CHOICES
+    :return: 202 response pointing at the job status endpoint
+    """
+    job = ImportJob.objects.create(kind=kind, file=request.FILES["file"])
+    return Response(
+        {
+            "message": f"Import job {job.id} is queued",
+            "job_id": job.id,
+            "status_url": reverse("import-job-detail", args=[job.id]),
+        },
+        status=status.HTTP_202_ACCEPTED,
+    )
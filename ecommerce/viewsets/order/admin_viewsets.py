@@ -1,5 +1,4 @@
 from decimal import Decimal
-from django.conf import settings
 from django.utils.dateparse import parse_date
 from django.db import transaction
 from django.shortcuts import get_object_or_404
@@ -8,16 +7,25 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from ecommerce.models.accounting.models import Account, JournalEntry, JournalEntryLine
+from ecommerce.models.inventory.models import StockReservation
 from ecommerce.models.order.models import Order, OrderItem, Payment
-from ecommerce.models.product.models import Currency, FXRate, Product, ProductPrice
+from ecommerce.models.product.models import Currency
 from ecommerce.models.users.models import Customer
-from ecommerce.permissions import IsStaff
-from ecommerce.serializers import OrderWithItemsSerializer
+from ecommerce.serializers import OrderWithItemsSerializer, prefetch_order_items
+from ecommerce.viewsets.accounting.chart import CASH_ACCOUNT_CODE, SALES_ACCOUNT_CODE
+from ecommerce.viewsets.accounting.journal import JournalBatch
 from ecommerce.viewsets.accounting.viewsets import (
-    journal_entry_when_product_is_sold_fifo,
+    journal_entries_when_basket_is_sold_fifo,
+)
+from ecommerce.viewsets.accounting.totals import TotalInAccountingCurrencyView
+from ecommerce.viewsets.pagination import OrderCursorPagination
+from ecommerce.viewsets.product.prices import get_active_prices
+from ecommerce.viewsets.utils import (
+    convert_amount_from_one_currency_to_another,
+    get_fx_rate_matrix,
+    start_of_day,
+    start_of_next_day,
 )
-from ecommerce.viewsets.utils import convert_amount_from_one_currency_to_another
 
 
 class AdminOrderViewSet(viewsets.ModelViewSet):
@@ -27,11 +35,12 @@ class AdminOrderViewSet(viewsets.ModelViewSet):
 
     serializer_class = OrderWithItemsSerializer
     permission_classes = [permissions.IsAdminUser]
+    pagination_class = OrderCursorPagination
 
     def get_queryset(self):
         queryset = (
-            Order.objects.select_related("customer__user", "currency")
-            .prefetch_related("items__product", "customer__addresses", "payment")
+            prefetch_order_items(Order.objects.all())
+            .prefetch_related("payment")
             .order_by("-created_at")
         )
 
@@ -41,12 +50,12 @@ class AdminOrderViewSet(viewsets.ModelViewSet):
         if start_date:
             start_date = parse_date(start_date)
             if start_date:
-                queryset = queryset.filter(created_at__date__gte=start_date)
+                queryset = queryset.filter(created_at__gte=start_of_day(start_date))
 
         if end_date:
             end_date = parse_date(end_date)
             if end_date:
-                queryset = queryset.filter(created_at__date__lte=end_date)
+                queryset = queryset.filter(created_at__lt=start_of_next_day(end_date))
 
         return queryset
 
@@ -55,49 +64,21 @@ class AdminOrderViewSet(viewsets.ModelViewSet):
         """
         Retrieve full order with items for a given order ID.
         """
-        order = get_object_or_404(Order, pk=pk)
+        order = get_object_or_404(prefetch_order_items(Order.objects.all()), pk=pk)
         serializer = OrderWithItemsSerializer(order)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
-class OrderTotalInAccountingCurrencyView(APIView):
-    permission_classes = [IsStaff]
-
-    def get(self, request, *args, **kwargs):
-        start_date = parse_date(request.query_params.get("start_date"))
-        end_date = parse_date(request.query_params.get("end_date"))
-
-        orders = Order.objects.select_related("currency").all()
+class OrderTotalInAccountingCurrencyView(TotalInAccountingCurrencyView):
+    amount = "total_amount"
 
+    def get_queryset(self, start_date, end_date):
+        orders = Order.objects.all()
         if start_date:
-            orders = orders.filter(created_at__date__gte=start_date)
+            orders = orders.filter(created_at__gte=start_of_day(start_date))
         if end_date:
-            orders = orders.filter(created_at__date__lte=end_date)
-
-        # Build FX rate map to accounting currency
-        fx_rates = FXRate.objects.filter(
-            end_date__isnull=True,
-            currency_to__code=settings.ACCOUNTING_CURRENCY
-        ).select_related("currency_from", "currency_to")
-
-        fx_map = {
-            (fx.currency_from.code, fx.currency_to.code): Decimal(fx.rate)
-            for fx in fx_rates
-        }
-
-        total_amount = Decimal("0.00")
-        for order in orders:
-            from_code = order.currency.code if order.currency else None
-            to_code = settings.ACCOUNTING_CURRENCY
-            rate = fx_map.get((from_code, to_code), Decimal("1.0") if from_code == to_code else None)
-
-            if rate is None:
-                continue  # Skip orders without a valid FX rate
-            total_amount += order.total_amount * rate
-
-        return Response({
-            "amount": round(total_amount, 2),
-            "currency": settings.ACCOUNTING_CURRENCY,
-        })
+            orders = orders.filter(created_at__lt=start_of_next_day(end_date))
+        return orders
+
 
 class AdminOrderCreateAPIView(APIView):
     permission_classes = [permissions.IsAdminUser]
@@ -111,10 +92,7 @@ class AdminOrderCreateAPIView(APIView):
             customer = get_object_or_404(Customer, id=customer_id)
             base_currency_code = request.data.get("base_currency")
             base_currency = get_object_or_404(Currency, code=base_currency_code)
-            fx_rates = {
-                (fx.currency_from.code, fx.currency_to.code): fx.rate
-                for fx in FXRate.objects.filter(end_date__isnull=True)
-            }
+            fx_rates = get_fx_rate_matrix().as_dict(by_code=True)
 
             with transaction.atomic():
                 order = Order.objects.create(
@@ -124,42 +102,53 @@ class AdminOrderCreateAPIView(APIView):
                     currency=base_currency,
                 )
                 total_amount = Decimal("0.00")
-                journal_lines = []
+                basket = {}
+                order_items = []
+                journal_batch = JournalBatch()
+
+                # one query for the whole basket
+                products = get_active_prices(
+                    int(item_data.get("product_id")) for item_data in order_items_data
+                )
 
                 for item_data in order_items_data:
-                    product_id = item_data.get("product_id")
+                    product_id = int(item_data.get("product_id"))
                     quantity = int(item_data.get("quantity", 0))
                     if quantity <= 0:
                         raise ValueError("Quantity must be positive.")
 
-                    product = get_object_or_404(Product, id=product_id)
-                    active_price = ProductPrice.objects.filter(
-                        product=product, end_date__isnull=True
-                    ).first()
-
-                    if not active_price:
+                    product = products.get(product_id)
+                    if product is None:
+                        raise ValueError(f"Product {product_id} not found.")
+                    if product.current_price is None:
                         raise ValueError(f"No active price for product {product.name}")
 
                     converted_price = convert_amount_from_one_currency_to_another(
-                        active_price.price,
-                        active_price.currency.code,
+                        product.current_price,
+                        product.current_currency.code,
                         base_currency.code,
                         fx_rates,
                     )
                     line_total = converted_price * quantity
                     total_amount += line_total
 
-                    OrderItem.objects.create(
+                    order_items.append(OrderItem(
                         order=order,
                         product=product,
                         quantity=quantity,
-                        price=active_price.price,
-                        currency=active_price.currency,
-                    )
+                        price=product.current_price,
+                        currency=product.current_currency,
+                    ))
+                    basket[product.id] = basket.get(product.id, 0) + quantity
 
-                    cost = journal_entry_when_product_is_sold_fifo(
-                        product=product, quantity_sold=quantity
-                    )
+                # one insert for all items of the order
+                OrderItem.objects.bulk_create(order_items)
+
+                # stock the customer reserved when submitting the cart
+                reservation_ids = StockReservation.objects.filter(
+                    customer=customer, id__in=request.data.get("reservation_ids") or []
+                ).values_list("id", flat=True)
+                journal_entries_when_basket_is_sold_fifo(basket, journal_batch, reservation_ids, order)
 
                 order.total_amount = total_amount
                 order.save()
@@ -171,31 +160,17 @@ class AdminOrderCreateAPIView(APIView):
                     transaction_id=None,
                 )
 
-                income_account = Account.objects.get(code="4000")
-                cash_account = Account.objects.get(code="1000")
-
-                journal_entry = JournalEntry.objects.create(
-                    description=f"Income from admin-submitted order {order.id}"
+                journal_entry = journal_batch.add_entry(f"Income from admin-submitted order {order.id}")
+                journal_batch.add_transfer(
+                    journal_entry,
+                    CASH_ACCOUNT_CODE,
+                    SALES_ACCOUNT_CODE,
+                    total_amount,
+                    debit_description="Cash or receivable from admin order",
+                    credit_description="Sales income from admin order",
                 )
-
-                JournalEntryLine.objects.create(
-                    journal_entry=journal_entry,
-                    account=cash_account,
-                    debit=total_amount,
-                    credit=Decimal("0.00"),
-                    description="Cash or receivable from admin order",
-                )
-                JournalEntryLine.objects.create(
-                    journal_entry=journal_entry,
-                    account=income_account,
-                    debit=Decimal("0.00"),
-                    credit=total_amount,
-                    description="Sales income from admin order",
-                )
-
-                for line in journal_lines:
-                    line.journal_entry = journal_entry
-                    line.save()
+                # COGS and income entries of the order are written together
+                journal_batch.flush()
 
                 return Response(
                     {"message": "Order created by admin.", "order_id": order.id},
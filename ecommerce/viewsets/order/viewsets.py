@@ -1,26 +1,35 @@
 from decimal import Decimal
 
 from django.db import transaction
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from ecommerce.models.accounting.models import Account, JournalEntry, JournalEntryLine
+from ecommerce.models.inventory.models import StockReservation
 from ecommerce.models.order.models import Order, OrderItem, Payment
-from ecommerce.models.product.models import Currency, FXRate, Product, ProductPrice
+from ecommerce.models.product.models import Currency
 from ecommerce.models.users.models import Customer
 from ecommerce.serializers import (
     OrderItemSerializer,
     OrderSerializer,
     OrderWithItemsSerializer,
     PaymentSerializer,
+    prefetch_icon_images,
+    prefetch_order_items,
 )
+from ecommerce.viewsets.accounting.chart import CASH_ACCOUNT_CODE, SALES_ACCOUNT_CODE
+from ecommerce.viewsets.accounting.journal import JournalBatch
 from ecommerce.viewsets.accounting.viewsets import (
-    journal_entry_when_product_is_sold_fifo,
+    journal_entries_when_basket_is_sold_fifo,
+)
+from ecommerce.viewsets.product.prices import get_active_prices
+from ecommerce.viewsets.utils import (
+    convert_amount_from_one_currency_to_another,
+    get_fx_rate_matrix,
 )
-from ecommerce.viewsets.utils import convert_amount_from_one_currency_to_another
 
 
 class OrderViewSet(viewsets.ModelViewSet):
@@ -29,14 +38,15 @@ class OrderViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
+        queryset = prefetch_order_items(Order.objects.all())
         if user.is_staff or user.is_superuser:
-            return Order.objects.all()
-        return Order.objects.filter(customer__user=user).order_by("-created_at")
+            return queryset
+        return queryset.filter(customer__user=user).order_by("-created_at")
 
     @action(detail=True, methods=["get"], url_path="with-items")
     def retrieve_with_items(self, request, pk=None):
         user = request.user
-        order = get_object_or_404(Order, pk=pk)
+        order = get_object_or_404(prefetch_order_items(Order.objects.all()), pk=pk)
 
         if not user.is_staff and not user.is_superuser and order.customer.user != user:
             return Response(
@@ -48,13 +58,15 @@ class OrderViewSet(viewsets.ModelViewSet):
 
 
 class OrderItemViewSet(viewsets.ModelViewSet):
-    queryset = OrderItem.objects.all()
+    queryset = OrderItem.objects.select_related("product", "currency").prefetch_related(
+        prefetch_icon_images("product__images")
+    )
     serializer_class = OrderItemSerializer
     permission_classes = [permissions.IsAdminUser]
 
 
 class PaymentViewSet(viewsets.ModelViewSet):
-    queryset = Payment.objects.all()
+    queryset = Payment.objects.prefetch_related(Prefetch("order", queryset=prefetch_order_items(Order.objects.all())))
     serializer_class = PaymentSerializer
     permission_classes = [permissions.IsAdminUser]
 
@@ -75,10 +87,7 @@ class OrderCreateAPIView(APIView):
             customer = get_object_or_404(Customer, user=user)
             base_currency_code = request.data.get("base_currency")  # e.g., "JPY"
             base_currency = get_object_or_404(Currency, code=base_currency_code)
-            fx_rates = {
-                (fx.currency_from.code, fx.currency_to.code): fx.rate
-                for fx in FXRate.objects.filter(end_date__isnull=True)
-            }
+            fx_rates = get_fx_rate_matrix().as_dict(by_code=True)
 
             with transaction.atomic():
                 order = Order.objects.create(
@@ -88,45 +97,54 @@ class OrderCreateAPIView(APIView):
                     currency=base_currency,
                 )
                 total_amount = Decimal("0.00")
-                journal_lines = []
+                basket = {}
+                order_items = []
+                journal_batch = JournalBatch()
+
+                # one query for the whole basket
+                products = get_active_prices(
+                    int(item_data.get("product_id")) for item_data in order_items_data
+                )
 
                 for item_data in order_items_data:
-                    product_id = item_data.get("product_id")
+                    product_id = int(item_data.get("product_id"))
                     quantity = int(item_data.get("quantity", 0))
                     if quantity <= 0:
                         raise ValueError("Quantity must be positive.")
 
-                    product = get_object_or_404(Product, id=product_id)
-                    active_price = ProductPrice.objects.filter(
-                        product=product, end_date__isnull=True
-                    ).first()
-
-                    if not active_price:
-                        raise ValueError(
-                            f"No active price found for product {product.name}"
-                        )
+                    product = products.get(product_id)
+                    if product is None:
+                        raise ValueError(f"Product {product_id} not found.")
+                    if product.current_price is None:
+                        raise ValueError(f"No active price found for product {product.name}")
 
                     converted_price = convert_amount_from_one_currency_to_another(
-                        active_price.price,
-                        active_price.currency.code,
+                        product.current_price,
+                        product.current_currency.code,
                         base_currency.code,
                         fx_rates,
                     )
                     line_total = converted_price * quantity
                     total_amount += line_total
 
-                    OrderItem.objects.create(
+                    order_items.append(OrderItem(
                         order=order,
                         product=product,
                         quantity=quantity,
-                        price=active_price.price,
-                        currency=active_price.currency,
-                    )
+                        price=product.current_price,
+                        currency=product.current_currency,
+                    ))
+                    basket[product.id] = basket.get(product.id, 0) + quantity
 
-                    cost = journal_entry_when_product_is_sold_fifo(
-                        product=product, quantity_sold=quantity
-                    )
-                    # Optionally accumulate cost if needed
+                # one insert for all items of the order
+                OrderItem.objects.bulk_create(order_items)
+
+                # Reduce inventory of the whole basket at once / record COGS
+                # stock the customer reserved when submitting the cart
+                reservation_ids = StockReservation.objects.filter(
+                    customer=customer, id__in=request.data.get("reservation_ids") or []
+                ).values_list("id", flat=True)
+                journal_entries_when_basket_is_sold_fifo(basket, journal_batch, reservation_ids, order)
 
                 # Save total amount on order
                 order.total_amount = total_amount
@@ -141,32 +159,17 @@ class OrderCreateAPIView(APIView):
                 )
 
                 # Add income journal entry
-                income_account = Account.objects.get(code="4000")  # Sales income
-                cash_account = Account.objects.get(code="1000")  # Cash or receivable
-
-                journal_entry = JournalEntry.objects.create(
-                    description=f"Income from order {order.id}"
-                )
-
-                JournalEntryLine.objects.create(
-                    journal_entry=journal_entry,
-                    account=cash_account,
-                    debit=total_amount,
-                    credit=Decimal("0.00"),
-                    description="Cash or receivable from sale",
-                )
-                JournalEntryLine.objects.create(
-                    journal_entry=journal_entry,
-                    account=income_account,
-                    debit=Decimal("0.00"),
-                    credit=total_amount,
-                    description="Sales income",
+                journal_entry = journal_batch.add_entry(f"Income from order {order.id}")
+                journal_batch.add_transfer(
+                    journal_entry,
+                    CASH_ACCOUNT_CODE,
+                    SALES_ACCOUNT_CODE,
+                    total_amount,
+                    debit_description="Cash or receivable from sale",
+                    credit_description="Sales income",
                 )
-
-                # Save journal lines from inventory changes
-                for line in journal_lines:
-                    line.journal_entry = journal_entry
-                    line.save()
+                # COGS and income entries of the order are written together
+                journal_batch.flush()
 
                 return Response(
                     {"message": "Order created successfully.", "order_id": order.id},
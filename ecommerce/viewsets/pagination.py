@@ -0,0 +1,138 @@
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, _reverse_ordering
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Cursor pagination on the whole ordering, e.g. (created_at, id), instead of only its first field.
+    The last field must be unique, so every row has its own position and the cursor never needs
+    an offset: any page is a single index range scan, however deep the client scrolls.
+    The other fields are expected to be non-null.
+    """
+
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    ordering = ("-created_at", "-id")
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for order in ordering:
+            field_name = order.lstrip("-")
+            attr = instance[field_name] if isinstance(instance, dict) else getattr(instance, field_name)
+            values.append(None if attr is None else str(attr))
+        return json.dumps(values)
+
+    def _get_position_filter(self, position: str, reverse: bool) -> Q:
+        """
+        Rows strictly after the position in the (possibly reversed) ordering,
+        i.e. (a, b) < (x, y) written as a < x OR (a = x AND b < y)
+        """
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        position_filter = Q()
+        equal_filter = Q()
+        for order, value in zip(self.ordering, values):
+            field_name = order.lstrip("-")
+            lookup = "lt" if order.startswith("-") != reverse else "gt"
+            if value is None:
+                # null can't be compared with lt/gt, only the tie-break fields order these rows
+                equal_filter &= Q(**{f"{field_name}__isnull": True})
+                continue
+            position_filter |= equal_filter & Q(**{f"{field_name}__{lookup}": value})
+            equal_filter &= Q(**{field_name: value})
+        return position_filter
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse, current_position = (
+            (False, None) if self.cursor is None else (self.cursor.reverse, self.cursor.position)
+        )
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if current_position is not None:
+            queryset = queryset.filter(self._get_position_filter(current_position, reverse))
+
+        # one extra row tells whether there is a page after this one
+        results = list(queryset[: self.page_size + 1])
+        self.page = results[: self.page_size]
+        has_following = len(results) > len(self.page)
+        if reverse:
+            self.page.reverse()
+            self.has_next = current_position is not None
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = current_position is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        position = (
+            self._get_position_from_instance(self.page[-1], self.ordering)
+            if self.page
+            else self.cursor.position
+        )
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        position = (
+            self._get_position_from_instance(self.page[0], self.ordering)
+            if self.page
+            else self.cursor.position
+        )
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+
+class OptInKeysetCursorPagination(KeysetCursorPagination):
+    """
+    Only paginates when the client asks for it with a cursor or page_size parameter,
+    so that clients expecting the whole list keep getting it.
+    """
+
+    def get_page_size(self, request):
+        if (
+            self.cursor_query_param not in request.query_params
+            and self.page_size_query_param not in request.query_params
+        ):
+            return None
+        return super().get_page_size(request)
+
+
+class OrderCursorPagination(OptInKeysetCursorPagination):
+    ordering = ("-created_at", "-id")
+
+
+class PurchaseCursorPagination(OptInKeysetCursorPagination):
+    ordering = ("-purchase_datetime", "-id")
+
+
+class AdateCursorPagination(OptInKeysetCursorPagination):
+    """
+    For incomes and spendings
+    """
+
+    ordering = ("-adate", "-id")
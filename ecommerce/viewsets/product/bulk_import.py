@@ -0,0 +1,491 @@
+import logging
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from typing import Iterable
+
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from ecommerce.models import (
+    Brand,
+    Category,
+    Currency,
+    Inventory,
+    Product,
+    ProductImage,
+    ProductPrice,
+    Purchase,
+    Tag,
+)
+from ecommerce.viewsets.accounting.chart import (
+    ACCOUNTS_PAYABLE_ACCOUNT_CODE,
+    INVENTORY_ACCOUNT_CODE,
+)
+from ecommerce.viewsets.accounting.journal import JournalBatch
+from ecommerce.viewsets.accounting.viewsets import allocate_fifo_batches
+from ecommerce.viewsets.inventory.viewsets import record_inventory_delta
+from ecommerce.viewsets.product.prices import sync_current_prices
+from ecommerce.viewsets.reporting.daily_facts import (
+    fact_contribution,
+    record_daily_fact_changes,
+)
+from ecommerce.viewsets.tagged_cache import invalidate_products
+
+logger = logging.getLogger(__name__)
+
+LOOKUP_BATCH_SIZE = 1000
+
+
+def _in_batches(values: list, batch_size: int = LOOKUP_BATCH_SIZE) -> Iterable[list]:
+    for i in range(0, len(values), batch_size):
+        yield values[i: i + batch_size]
+
+
+def _cell(row: pd.Series, col: str):
+    """
+    Value of a CSV cell as a stripped string, None when the column is missing or the cell is empty
+    """
+    value = row.get(col)
+    if value is None or pd.isna(value):
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def parse_product_rows(df: pd.DataFrame) -> tuple[list[dict], list[dict]]:
+    """
+    Validate product CSV rows.
+    When the same product name (case-insensitive) appears more than once, the last row wins.
+    :param df: product CSV with product_name, category_name, price, stock and optional
+        brand_name, tag_names, description, sku, currency columns
+    :return: tuple of valid rows and per-row errors
+    """
+    rows_by_name = {}
+    errors = []
+    for i, row in df.iterrows():
+        product_name = _cell(row, "product_name")
+        try:
+            category_name = _cell(row, "category_name")
+            if not product_name or not category_name:
+                raise ValueError("product_name and category_name are required")
+            try:
+                price = Decimal(str(row["price"]))
+                stock = int(row["stock"])
+            except (InvalidOperation, TypeError, ValueError):
+                raise ValueError(f"Invalid price {row['price']} or stock {row['stock']}")
+            if not price.is_finite() or price < 0 or stock < 0:
+                raise ValueError(f"Price {price} and stock {stock} can't be negative")
+        except ValueError as e:
+            errors.append({"row": i, "product_name": product_name, "error": str(e)})
+            continue
+
+        tag_names = _cell(row, "tag_names")
+        product_row = {
+            "row": i,
+            "product_name": product_name,
+            "category_name": category_name,
+            "brand_name": _cell(row, "brand_name"),
+            "tag_names": [t.strip() for t in tag_names.split(",") if t.strip()] if tag_names else None,
+            "description": _cell(row, "description"),
+            "sku": _cell(row, "sku"),
+            "price": price,
+            "currency_code": _cell(row, "currency") or settings.ACCOUNTING_CURRENCY,
+            "stock": stock,
+        }
+        superseded = rows_by_name.pop(product_name.lower(), None)
+        if superseded:
+            errors.append(
+                {
+                    "row": superseded["row"],
+                    "product_name": superseded["product_name"],
+                    "error": f"Superseded by row {i} with the same product name",
+                }
+            )
+        rows_by_name[product_name.lower()] = product_row
+    return list(rows_by_name.values()), errors
+
+
+def _get_by_name(model, names: set[str]) -> dict:
+    """
+    Fetch objects of a model with a unique name field
+    :return: mapping of name to object
+    """
+    objects = {}
+    for names_batch in _in_batches(sorted(names)):
+        objects.update({obj.name: obj for obj in model.objects.filter(name__in=names_batch)})
+    return objects
+
+
+def _create_missing_by_name(model, objects: dict, names: set[str], user=None):
+    """
+    Create the objects of a model with a unique name field that objects doesn't have yet in bulk, and add them to it
+    """
+    missing_names = names - objects.keys()
+    if missing_names:
+        model.objects.bulk_create(
+            [model(name=name, modified_by=user) for name in missing_names],
+            ignore_conflicts=True,
+        )
+        objects.update(_get_by_name(model, missing_names))
+
+
+class ProductImportState:
+    """
+    Current state of everything a product CSV refers to, resolved with a few set queries
+    """
+
+    def __init__(self, rows: list[dict]):
+        lower_names = [row["product_name"].lower() for row in rows]
+        self.products = {}
+        for names_batch in _in_batches(lower_names):
+            for product in (
+                    Product.objects.annotate(lower_name=Lower("name"))
+                    .filter(lower_name__in=names_batch)
+                    .order_by("-id")
+            ):
+                # the oldest product wins, like name__iexact(...).first() does
+                self.products[product.lower_name] = product
+        product_ids = [product.id for product in self.products.values()]
+
+        self.currencies = {
+            currency.code: currency
+            for currency in Currency.objects.filter(
+                code__in={row["currency_code"] for row in rows}
+            )
+        }
+        # missing ones are created by the chunk that needs them, so they are rolled back with it
+        self.categories = _get_by_name(Category, {row["category_name"] for row in rows})
+        self.brands = _get_by_name(Brand, {row["brand_name"] for row in rows if row["brand_name"]})
+        self.tags = _get_by_name(Tag, {name for row in rows if row["tag_names"] for name in row["tag_names"]})
+
+        self.stocks = {}
+        self.tag_ids = defaultdict(set)
+        for ids_batch in _in_batches(product_ids):
+            self.stocks.update(
+                Inventory.objects.filter(product_id__in=ids_batch)
+                .values("product_id")
+                .annotate(total=Sum("stock"))
+                .values_list("product_id", "total")
+            )
+            for product_id, tag_id in Product.tags.through.objects.filter(
+                    product_id__in=ids_batch
+            ).values_list("product_id", "tag_id"):
+                self.tag_ids[product_id].add(tag_id)
+
+        skus = {row["sku"] or row["product_name"].upper() for row in rows}
+        self.product_ids_by_sku = {}
+        for skus_batch in _in_batches(sorted(skus)):
+            self.product_ids_by_sku.update(
+                Product.objects.filter(sku__in=skus_batch).values_list("sku", "id")
+            )
+
+    def create_missing_lookups(self, targets: list[dict], user=None):
+        """
+        Create the categories, brands and tags of a chunk that don't exist yet
+        """
+        _create_missing_by_name(Category, self.categories, {target["category_name"] for target in targets}, user)
+        _create_missing_by_name(
+            Brand, self.brands, {target["brand_name"] for target in targets if target["brand_name"]}, user
+        )
+        _create_missing_by_name(
+            Tag, self.tags, {name for target in targets if target["tag_names"] for name in target["tag_names"]}, user
+        )
+
+    def lookups(self) -> tuple[dict, dict, dict]:
+        return dict(self.categories), dict(self.brands), dict(self.tags)
+
+    def restore_lookups(self, lookups: tuple[dict, dict, dict]):
+        """
+        Forget the lookups a rolled back chunk created
+        """
+        self.categories, self.brands, self.tags = lookups
+
+    def discard_products(self, targets: list[dict]):
+        """
+        Forget the products of a rolled back chunk, whose objects may hold values that were never saved
+        """
+        for target in targets:
+            self.products.pop(target["product_name"].lower(), None)
+            target["product"] = None
+            target.pop("created", None)
+            target.pop("changed", None)
+
+
+def _resolve_row(row: dict, state: ProductImportState, claimed_skus: dict) -> dict:
+    """
+    Work out the target state of one row's product, raising ValueError when it can't be applied
+    """
+    currency = state.currencies.get(row["currency_code"])
+    if currency is None:
+        raise ValueError(f"Unknown currency {row['currency_code']}")
+    product = state.products.get(row["product_name"].lower())
+    if product is not None:
+        sku = row["sku"] or product.sku
+        description = row["description"] or product.description
+    else:
+        sku = row["sku"] or row["product_name"].upper()
+        description = row["description"] or row["product_name"]
+    sku_owner_id = state.product_ids_by_sku.get(sku)
+    if sku_owner_id is not None and (product is None or sku_owner_id != product.id):
+        raise ValueError(f"SKU {sku} already belongs to another product")
+    if claimed_skus.setdefault(sku, row["row"]) != row["row"]:
+        raise ValueError(f"SKU {sku} is also used by row {claimed_skus[sku]}")
+    return {
+        **row,
+        "product": product,
+        "sku": sku,
+        "description": description,
+        "currency": currency,
+    }
+
+
+def _apply_chunk(targets: list[dict], state: ProductImportState, user=None) -> dict:
+    """
+    Write one chunk of resolved rows with bulk statements
+    :return: counts of created, updated and unchanged products
+    """
+    today = timezone.now().date()
+    now = timezone.now()
+    counts = {"created": 0, "updated": 0, "unchanged": 0}
+
+    state.create_missing_lookups(targets, user)
+    for target in targets:
+        target["category"] = state.categories[target["category_name"]]
+        target["brand"] = state.brands[target["brand_name"]] if target["brand_name"] else None
+
+    # --- Products ---
+    new_targets = [target for target in targets if target["product"] is None]
+    new_products = Product.objects.bulk_create(
+        [
+            Product(
+                name=target["product_name"],
+                description=target["description"],
+                sku=target["sku"],
+                category=target["category"],
+                brand=target["brand"],
+                modified_by=user,
+            )
+            for target in new_targets
+        ]
+    )
+    for target, product in zip(new_targets, new_products):
+        target["product"] = product
+        target["created"] = True
+    ProductImage.objects.bulk_create(
+        [ProductImage(product=product, tag="icon", modified_by=user) for product in new_products]
+    )
+
+    changed_products = []
+    for target in targets:
+        if target.get("created"):
+            continue
+        product = target["product"]
+        new_values = {
+            "name": target["product_name"],
+            "description": target["description"],
+            "sku": target["sku"],
+            "category_id": target["category"].id,
+        }
+        if target["brand"]:
+            new_values["brand_id"] = target["brand"].id
+        changed = {field: value for field, value in new_values.items() if getattr(product, field) != value}
+        if changed:
+            for field, value in changed.items():
+                setattr(product, field, value)
+            # bulk_update skips auto_now, so audit fields are set here
+            product.modified_by = user
+            product.modified_at = now
+            changed_products.append(product)
+            target["changed"] = True
+    Product.objects.bulk_update(
+        changed_products,
+        ["name", "description", "sku", "category", "brand", "modified_by", "modified_at"],
+    )
+
+    # --- Tags ---
+    tag_through = Product.tags.through
+    retagged_product_ids = []
+    new_tag_links = []
+    for target in targets:
+        if target["tag_names"] is None:
+            continue
+        product_id = target["product"].id
+        tag_ids = {state.tags[name].id for name in target["tag_names"]}
+        if tag_ids != state.tag_ids.get(product_id, set()):
+            retagged_product_ids.append(product_id)
+            new_tag_links.extend(tag_through(product_id=product_id, tag_id=tag_id) for tag_id in tag_ids)
+            target["changed"] = True
+    tag_through.objects.filter(product_id__in=retagged_product_ids).delete()
+    tag_through.objects.bulk_create(new_tag_links)
+
+    # --- Prices ---
+    repriced = []
+    for target in targets:
+        product = target["product"]
+        if (
+                product.current_price is None
+                or product.current_price != target["price"]
+                or product.current_currency_id != target["currency"].id
+        ):
+            repriced.append(target)
+            target["changed"] = True
+    ProductPrice.objects.filter(
+        product_id__in=[target["product"].id for target in repriced], end_date__isnull=True
+    ).update(end_date=today)
+    ProductPrice.objects.bulk_create(
+        [
+            ProductPrice(
+                product=target["product"],
+                price=target["price"],
+                currency=target["currency"],
+                begin_date=today,
+                end_date=None,
+                modified_by=user,
+            )
+            for target in repriced
+        ]
+    )
+    # bulk statements don't send the ProductPrice signals
+    sync_current_prices([target["product"].id for target in repriced])
+
+    # --- Inventory ---
+    increases = []
+    decreases = {}
+    for target in targets:
+        quantity_diff = target["stock"] - (state.stocks.get(target["product"].id) or 0)
+        if quantity_diff > 0:
+            increases.append((target, quantity_diff))
+        elif quantity_diff < 0:
+            decreases[target["product"].id] = -quantity_diff
+        if quantity_diff:
+            target["changed"] = True
+
+    journal_batch = JournalBatch()
+
+    pseudo_purchases = Purchase.objects.bulk_create(
+        [
+            Purchase(
+                product=target["product"],
+                quantity=quantity_diff,
+                price_per_unit=target["price"],
+                currency=target["currency"],
+                purchase_datetime=now,
+            )
+            for target, quantity_diff in increases
+        ]
+    )
+    Inventory.objects.bulk_create(
+        [
+            Inventory(
+                product=purchase.product,
+                purchase=purchase,
+                stock=purchase.quantity,
+                location="DirectAdmin",
+                purchase_datetime=purchase.purchase_datetime,
+            )
+            for purchase in pseudo_purchases
+        ]
+    )
+    for target, quantity_diff in increases:
+        product = target["product"]
+        record_inventory_delta(product.id, quantity_diff)
+        journal_entry = journal_batch.add_entry(f"Direct inventory adjustment for {product.name}")
+        journal_batch.add_transfer(
+            journal_entry,
+            INVENTORY_ACCOUNT_CODE,
+            ACCOUNTS_PAYABLE_ACCOUNT_CODE,
+            target["price"] * quantity_diff,
+            debit_description=f"Inventory added for {product.name} at a price of {target['price']}",
+            credit_description=f"Accounts Payable for inventory increase {product.name} at a price of {target['price']}",
+        )
+
+    # the stock counts of the file are the truth, so reserved stock can be taken too
+    for product_id, consumptions in allocate_fifo_batches(decreases, honor_reservations=False).items():
+        journal_entry = journal_batch.add_entry(
+            f"Direct inventory adjustment for {consumptions[0][0].product.name}"
+        )
+        for inventory, reduce_qty in consumptions:
+            journal_batch.add_transfer(
+                journal_entry,
+                ACCOUNTS_PAYABLE_ACCOUNT_CODE,
+                INVENTORY_ACCOUNT_CODE,
+                inventory.purchase.price_per_unit * reduce_qty,
+                debit_description=f"Reversal from Accounts Payable as part of inventory descrease from batch {inventory.purchase}",
+                credit_description=f"Inventory decrease from batch ({inventory.purchase})",
+            )
+
+    journal_batch.flush()
+    # bulk_create doesn't send post_save, so the purchases are added to the daily facts explicitly
+    record_daily_fact_changes(added=[fact_contribution(purchase) for purchase in pseudo_purchases])
+
+    for target in targets:
+        if target.get("created"):
+            counts["created"] += 1
+        elif target.get("changed"):
+            counts["updated"] += 1
+        else:
+            counts["unchanged"] += 1
+    return counts
+
+
+def bulk_import_products_from_dataframe(
+        df: pd.DataFrame, user=None, chunk_size: int = 500, progress=None
+) -> dict:
+    """
+    Create or update products, their tags, prices and inventory from a product CSV in bulk.
+    Everything the CSV refers to is resolved up front with a few set queries, rows are diffed
+    against the current state and changes are written with bulk statements, one transaction per chunk.
+    Rows that can't be applied are reported instead of aborting the import.
+    :param df: product CSV loaded into a DataFrame
+    :param user: user recorded as modified_by of created and updated records
+    :param chunk_size: number of rows written per transaction
+    :param progress: optional callable receiving processed rows, failed rows and errors after each chunk
+    :return: counts of created, updated and unchanged products and per-row errors
+    """
+    rows, errors = parse_product_rows(df)
+    state = ProductImportState(rows)
+
+    targets = []
+    claimed_skus = {}
+    for row in rows:
+        try:
+            targets.append(_resolve_row(row, state, claimed_skus))
+        except ValueError as e:
+            errors.append({"row": row["row"], "product_name": row["product_name"], "error": str(e)})
+
+    result = {"created": 0, "updated": 0, "unchanged": 0}
+    for i in range(0, len(targets), chunk_size):
+        chunk = targets[i: i + chunk_size]
+        lookups = state.lookups()
+        try:
+            with transaction.atomic():
+                counts = _apply_chunk(chunk, state, user)
+        except Exception as e:
+            logger.debug(f"Product import chunk starting at row {chunk[0]['row']} failed : {e}")
+            state.restore_lookups(lookups)
+            state.discard_products(chunk)
+            for target in chunk:
+                errors.append(
+                    {"row": target["row"], "product_name": target["product_name"], "error": str(e)}
+                )
+        else:
+            for key, count in counts.items():
+                result[key] += count
+        if progress:
+            progress(len(df) - len(targets) + i + len(chunk), len(errors), errors)
+
+    # bulk statements don't send the Product signals
+    invalidate_products(
+        [
+            target["product"].id
+            for target in targets
+            if target["product"] is not None and (target.get("created") or target.get("changed"))
+        ],
+        catalog=result["created"] > 0,
+    )
+    result["errors"] = sorted(errors, key=lambda error: error["row"])
+    return result
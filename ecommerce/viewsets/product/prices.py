@@ -0,0 +1,38 @@
+from typing import Iterable
+
+from django.db.models import OuterRef, Subquery
+
+from ecommerce.models import Product, ProductPrice
+
+
+def sync_current_prices(product_ids: Iterable[int] = None) -> int:
+    """
+    Copy the active ProductPrice of products into Product.current_price and Product.current_currency
+    with a single UPDATE. Called by ProductPrice signals, bulk paths have to call it themselves.
+    :param product_ids: products to sync, all products when None
+    :return: number of products updated
+    """
+    active_price = ProductPrice.objects.filter(
+        product=OuterRef("pk"), end_date__isnull=True
+    ).order_by("-begin_date", "-id")
+    products = Product.objects.all()
+    if product_ids is not None:
+        products = products.filter(pk__in=list(product_ids))
+    return products.update(
+        current_price=Subquery(active_price.values("price")[:1]),
+        current_currency=Subquery(active_price.values("currency")[:1]),
+    )
+
+
+def get_active_prices(product_ids: Iterable[int]) -> dict[int, Product]:
+    """
+    Load products together with their active price and currency in one query
+    :param product_ids:
+    :return: mapping of product id to product, current_price is None for products without an active price
+    """
+    return {
+        product.id: product
+        for product in Product.objects.filter(pk__in=list(product_ids)).select_related(
+            "current_currency"
+        )
+    }
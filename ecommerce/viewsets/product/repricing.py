@@ -0,0 +1,151 @@
+import logging
+from decimal import Decimal
+from typing import Iterable
+
+import numpy as np
+from crum import get_current_user
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from ecommerce.models import Currency, Product, ProductPrice, ProductWeight, Purchase
+from ecommerce.profit_rate import ProfitRate
+from ecommerce.viewsets.product.prices import sync_current_prices
+from ecommerce.viewsets.tagged_cache import invalidate_products
+from ecommerce.viewsets.utils import get_fx_rate_matrix
+from ecommerce.weight_cost import get_active_weight_cost
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRODUCT_WEIGHT = 0.1  # kg, for products without a ProductWeight
+PRODUCT_PRICE_SWAP_BATCH_SIZE = 1000
+
+
+def load_repricing_inputs(product_ids: Iterable[int] = None) -> list[tuple]:
+    """
+    Last purchase price and currency, weight and current price of products in one query
+    :param product_ids: all products when None
+    :return: tuples of (id, last_price, last_currency_id, weight, current_price, current_currency_id)
+    """
+    latest_purchase = Purchase.objects.filter(product=OuterRef("pk")).order_by("-purchase_datetime", "-id")
+    products = Product.objects.all()
+    if product_ids is not None:
+        products = products.filter(pk__in=list(product_ids))
+    return list(
+        products.annotate(
+            last_price=Subquery(latest_purchase.values("price_per_unit")[:1]),
+            last_currency_id=Subquery(latest_purchase.values("currency")[:1]),
+            product_weight=Subquery(ProductWeight.objects.filter(product=OuterRef("pk")).values("weight")[:1]),
+        )
+        .order_by("id")
+        .values_list(
+            "id", "last_price", "last_currency_id", "product_weight", "current_price", "current_currency_id"
+        )
+    )
+
+
+def _to_array(values, missing=np.nan, dtype=float) -> np.ndarray:
+    return np.array([missing if value is None else value for value in values], dtype=dtype)
+
+
+def reprice_products(currency_code: str, product_ids: Iterable[int] = None, dry_run: bool = False) -> dict:
+    """
+    Price products at (last purchase price + weight x active weight cost per kg) x (1 + active profit rate),
+    all converted into one currency with the active FX rates. A profit rate of 0.3 adds 30%.
+    Products whose price changes get a new active ProductPrice, their active prices are end dated
+    with one UPDATE and the new ones written with one bulk_create per PRODUCT_PRICE_SWAP_BATCH_SIZE products.
+    :param currency_code: currency of the new prices
+    :param product_ids: products to reprice, all products when None
+    :param dry_run: report the changes without writing them
+    :return: counts of repriced, unchanged and skipped products and the price changes
+    """
+    currency = Currency.objects.filter(code=currency_code).first()
+    if currency is None:
+        raise ValueError(f"Unknown currency {currency_code}")
+    weight_cost = get_active_weight_cost()
+    if weight_cost is None:
+        raise ValueError("No active weight cost")
+    profit_rate = ProfitRate.objects.filter(end_date__isnull=True).first()
+    if profit_rate is None:
+        raise ValueError("No active profit rate")
+
+    matrix = get_fx_rate_matrix()
+    weight_cost_rate = matrix.rates_to([weight_cost.currency_id or -1], currency.id)[0]
+    if np.isnan(weight_cost_rate):
+        raise ValueError(f"No FX rate from weight cost currency {weight_cost.currency} to {currency_code}")
+
+    rows = load_repricing_inputs(product_ids)
+    ids, last_prices, last_currency_ids, weights, current_prices, current_currency_ids = (
+        zip(*rows) if rows else ([],) * 6
+    )
+    ids = np.array(ids, dtype=np.int64)
+    last_prices = _to_array(last_prices)
+    purchase_rates = matrix.rates_to(_to_array(last_currency_ids, -1, np.int64), currency.id)
+    weights = _to_array(weights, DEFAULT_PRODUCT_WEIGHT)
+    current_cents = np.rint(_to_array(current_prices) * 100)
+    current_currency_ids = _to_array(current_currency_ids, -1, np.int64)
+
+    costs = last_prices * purchase_rates + weights * weight_cost.cost_per_kg * weight_cost_rate
+    cents = np.rint(costs * (1 + profit_rate.profit_rate) * 100)
+    priceable = ~np.isnan(cents)
+    changed = priceable & ~((current_currency_ids == currency.id) & (current_cents == cents))
+    changed_ids = ids[changed].tolist()
+    new_prices = [Decimal(int(value)).scaleb(-2) for value in cents[changed]]
+
+    if not dry_run and changed_ids:
+        today = timezone.now().date()
+        user = get_current_user()
+        user = user if user and user.is_authenticated else None
+        ended_fields = {"end_date": today, "modified_at": timezone.now()}
+        if user:
+            ended_fields["modified_by"] = user
+        with transaction.atomic():
+            for start in range(0, len(changed_ids), PRODUCT_PRICE_SWAP_BATCH_SIZE):
+                batch_ids = changed_ids[start:start + PRODUCT_PRICE_SWAP_BATCH_SIZE]
+                ProductPrice.objects.filter(product_id__in=batch_ids, end_date__isnull=True).update(**ended_fields)
+                ProductPrice.objects.bulk_create(
+                    [
+                        ProductPrice(
+                            product_id=product_id,
+                            price=price,
+                            currency=currency,
+                            begin_date=today,
+                            modified_by=user,
+                        )
+                        for product_id, price in zip(batch_ids, new_prices[start:start + PRODUCT_PRICE_SWAP_BATCH_SIZE])
+                    ]
+                )
+                # bulk statements don't send the ProductPrice signals
+                sync_current_prices(batch_ids)
+            invalidate_products(changed_ids)
+
+    currency_codes = dict(Currency.objects.values_list("id", "code"))
+    old_prices = _to_array(current_prices, None, object)[changed]
+    old_currency_ids = current_currency_ids[changed].tolist()
+    report = {
+        "currency": currency_code,
+        "profit_rate": profit_rate.profit_rate,
+        "weight_cost_per_kg": weight_cost.cost_per_kg,
+        "weight_cost_currency": currency_codes.get(weight_cost.currency_id),
+        "repriced": len(changed_ids),
+        "unchanged": int((priceable & ~changed).sum()),
+        "without_purchase": ids[np.isnan(last_prices)].tolist(),
+        "without_fx_rate": ids[~np.isnan(last_prices) & np.isnan(purchase_rates)].tolist(),
+        "dry_run": dry_run,
+        "changes": [
+            {
+                "product_id": product_id,
+                "old_price": old_price,
+                "old_currency": currency_codes.get(old_currency_id),
+                "new_price": new_price,
+            }
+            for product_id, old_price, old_currency_id, new_price in zip(
+                changed_ids, old_prices, old_currency_ids, new_prices
+            )
+        ],
+    }
+    logger.info(
+        f"{'Checked' if dry_run else 'Repriced'} {len(ids)} products in {currency_code} : "
+        f"{report['repriced']} repriced, {report['unchanged']} unchanged"
+    )
+    return report
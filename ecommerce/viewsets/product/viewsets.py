@@ -6,21 +6,20 @@ from typing import List
 import pandas as pd
 from django.conf import settings
 from django.db import transaction
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404
-from django.utils import timezone
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
 from rest_framework import status, viewsets
 from rest_framework.generics import ListAPIView
-from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.pagination import PageNumberPagination
 from sampytools.list_utils import get_list_diff
 
 from ecommerce.models import (
     Brand,
     Category,
+    ImportJob,
     Product,
     ProductImage,
     ProductPrice,
@@ -48,10 +47,18 @@ from ecommerce.serializers.product.serializers import (
     CurrencySerializer,
     FXRateSerializer,
     ProductWithImageSerializer,
+    prefetch_icon_images,
 )
+from ecommerce.viewsets.accounting.chart import ACCOUNTS_PAYABLE_ACCOUNT_CODE, INVENTORY_ACCOUNT_CODE
 from ecommerce.viewsets.accounting.viewsets import (
     journal_entries_for_direct_inventory_changes,
 )
+from ecommerce.viewsets.active_records import swap_active_record
+from ecommerce.viewsets.jobs.viewsets import enqueue_import_job, is_background_request
+from ecommerce.viewsets.pagination import KeysetCursorPagination
+from ecommerce.viewsets.product.bulk_import import bulk_import_products_from_dataframe
+from ecommerce.viewsets.product.repricing import reprice_products
+from ecommerce.viewsets.tagged_cache import TaggedCacheListMixin
 
 logger = logging.getLogger(__name__)
 
@@ -87,7 +94,16 @@ class TagViewSet(viewsets.ModelViewSet):
 
 
 class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all()
+    queryset = (
+        Product.objects.all()
+        .select_related("category", "brand")
+        .prefetch_related(
+            "images",
+            Prefetch("price", queryset=ProductPrice.objects.select_related("currency")),
+            "inventory",
+            "tags",
+        )
+    )
     serializer_class = ProductSerializer
     permission_classes = [IsStaffOrReadOnly]
 
@@ -122,15 +138,23 @@ class ProductWithImageListView(ListAPIView):
     queryset = (
         Product.objects.all()
         .select_related("category", "brand")
-        .prefetch_related("images", "price", "inventory", "tags")
+        .prefetch_related(
+            prefetch_icon_images(),
+            Prefetch("price", queryset=ProductPrice.objects.select_related("currency")),
+            "inventory",
+            "tags",
+        )
     )
     serializer_class = ProductWithImageSerializer
 
 class ProductWithIconImagePagination(PageNumberPagination):
     page_size = 100
 
-@method_decorator(cache_page(60 * 15), name="dispatch")
-class ProductWithIconImageListView(ListAPIView):
+
+class ProductWithIconImageCursorPagination(KeysetCursorPagination):
+    ordering = ("-created_at", "-id")
+
+class ProductWithIconImageListView(TaggedCacheListMixin, ListAPIView):
     serializer_class = ProductWithIconImageSerializer
 
     def get_queryset(self):
@@ -138,18 +162,36 @@ class ProductWithIconImageListView(ListAPIView):
         product_id = self.request.query_params.get("product_id")
         if product_id:
             queryset = queryset.filter(id=product_id)
-        return queryset.select_related("category", "brand").prefetch_related("images")
+        return queryset.select_related("category", "brand").prefetch_related(
+            prefetch_icon_images(), "tags"
+        )
+
+class ProductWithIconImagePaginatedListView(TaggedCacheListMixin, ListAPIView):
+    """
+    Pages of page_size products with page numbers, v2 pages the same listing with cursors
+    """
 
-class ProductWithIconImagePaginatedListView(ListAPIView):
     serializer_class = ProductWithIconImageSerializer
     pagination_class = ProductWithIconImagePagination
 
     def get_queryset(self):
-        queryset = Product.objects.all().order_by("-created_at")
+        # id breaks created_at ties, so that page numbers don't skip or repeat products
+        queryset = Product.objects.all().order_by("-created_at", "-id")
         product_id = self.request.query_params.get("product_id")
         if product_id:
             queryset = queryset.filter(id=product_id)
-        return queryset.select_related("category", "brand").prefetch_related("images")
+        return queryset.select_related("category", "brand").prefetch_related(
+            prefetch_icon_images(), "tags"
+        )
+
+
+class ProductWithIconImageCursorListView(ProductWithIconImagePaginatedListView):
+    """
+    Pages with next and previous cursor links instead of page numbers.
+    Deep pages cost as much as the first one and products added while paging don't shift the pages.
+    """
+
+    pagination_class = ProductWithIconImageCursorPagination
 
 class ProductImageViewset(viewsets.ModelViewSet):
     serializer_class = ProductImageSerializer
@@ -164,13 +206,13 @@ class ProductImageViewset(viewsets.ModelViewSet):
 
 
 class ProductPriceViewSet(viewsets.ModelViewSet):
-    queryset = ProductPrice.objects.all()
+    queryset = ProductPrice.objects.select_related("currency")
     serializer_class = ProductPriceSerializer
     permission_classes = [IsStaffOrReadOnly]
 
 
 class ProductWeightViewSet(viewsets.ModelViewSet):
-    queryset = ProductWeight.objects.all()
+    queryset = ProductWeight.objects.select_related("product")
     serializer_class = ProductWeightSerializer
     permission_classes = [IsStaffOrReadOnly]
 
@@ -294,25 +336,11 @@ def add_or_update_product_price(
     try:
         currency_obj = Currency.objects.filter(code=currency_code).first()
         new_price = Decimal(price)
-        today = timezone.now().date()
-
-        # Find the current active price
-        active_price = ProductPrice.objects.filter(
-            product=product, end_date__isnull=True
-        ).first()
-
-        if active_price:
-            # Close the old active price
-            active_price.end_date = today
-            active_price.save()
-
-        # Create new active price
-        ProductPrice.objects.create(
-            product=product,
-            price=new_price,
-            currency=currency_obj,
-            begin_date=today,
-            end_date=None,
+        swap_active_record(
+            ProductPrice,
+            {"product_id": product.id},
+            {"price": new_price, "currency": currency_obj},
+            start_field="begin_date",
         )
 
     except Exception as e:
@@ -359,7 +387,7 @@ class ProductCreationAPIView(APIView):
                 # Inventory
                 quantity = int(request.data.get("stock", 1))
                 journal_entries_for_direct_inventory_changes(
-                    product, quantity, "1200", "2000"
+                    product, quantity, INVENTORY_ACCOUNT_CODE, ACCOUNTS_PAYABLE_ACCOUNT_CODE
                 )
                 return Response(
                     {"message": "Product created", "product_id": product.id},
@@ -412,7 +440,7 @@ class ProductUpdateAPIView(APIView):
                     try:
                         new_quantity = int(request.data["stock"])
                         journal_entries_for_direct_inventory_changes(
-                            product, new_quantity, "1200", "2000"
+                            product, new_quantity, INVENTORY_ACCOUNT_CODE, ACCOUNTS_PAYABLE_ACCOUNT_CODE
                         )
                     except Exception as e:
                         logger.debug(f"Inventory update error: {e}")
@@ -426,9 +454,32 @@ class ProductUpdateAPIView(APIView):
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+class ProductRepricingAPIView(APIView):
+    """
+    Reprices products from their last purchase price, weight cost and profit rate.
+    Expects {"currency": "UZS", "product_ids": [1, 2], "dry_run": true}, all products when product_ids is left out.
+    """
+
+    parser_classes = [JSONParser]
+    permission_classes = [IsStaff]
+
+    def post(self, request):
+        try:
+            logger.debug(f"Incoming data to reprice products : {request.data}")
+            report = reprice_products(
+                request.data.get("currency") or settings.ACCOUNTING_CURRENCY,
+                product_ids=request.data.get("product_ids"),
+                dry_run=bool(request.data.get("dry_run")),
+            )
+            return Response(report, status=status.HTTP_200_OK)
+        except Exception as e:
+            logger.debug(f"Error while repricing products : {e}")
+            return Response({"error": f"Error while repricing products {e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+
 class ProductCreateUpdateFromCSVAPIView(APIView):
     parser_classes = [MultiPartParser, FormParser]
-    permissions = [IsStaff]
+    permission_classes = [IsStaff]
 
     def post(self, request):
         try:
@@ -437,6 +488,8 @@ class ProductCreateUpdateFromCSVAPIView(APIView):
                 return Response(
                     {"error": "No file uploaded"}, status=status.HTTP_400_BAD_REQUEST
                 )
+            if is_background_request(request):
+                return enqueue_import_job(request, ImportJob.KIND_PRODUCTS)
             df = pd.read_csv(file_obj)
             required_cols = ["product_name", "category_name", "price", "stock"]
             missing_cols = get_list_diff(required_cols, df.columns)
@@ -448,6 +501,16 @@ class ProductCreateUpdateFromCSVAPIView(APIView):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
+            if str(request.query_params.get("bulk", "")).lower() in ("1", "true", "yes"):
+                result = bulk_import_products_from_dataframe(df, user=request.user)
+                return Response(
+                    {
+                        "message": f"Created {result['created']}, updated {result['updated']} and left {result['unchanged']} products unchanged",
+                        **result,
+                    },
+                    status=status.HTTP_200_OK,
+                )
+
             for i, row in df.iterrows():
                 with transaction.atomic():
                     if "tag_names" in df.columns and row["tag_names"] != "":
@@ -496,7 +559,7 @@ class ProductCreateUpdateFromCSVAPIView(APIView):
                     )
                     add_or_update_product_price(product, row["price"], currency_code)
                     journal_entries_for_direct_inventory_changes(
-                        product, row["stock"], "1200", "2000"
+                        product, row["stock"], INVENTORY_ACCOUNT_CODE, ACCOUNTS_PAYABLE_ACCOUNT_CODE
                     )
                 logger.debug(
                     f"Finished creating or updating product with name : {row['product_name']}, category_name : {row['category_name']},brand_name : {brand_name}, tag_names : {tag_names}, price :{row['price']} {currency_code}, stock : {row['stock']}"
@@ -0,0 +1,174 @@
+import datetime
+import logging
+from decimal import Decimal, InvalidOperation
+from typing import IO
+
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from ecommerce.models import (
+    Currency,
+    Inventory,
+    Product,
+    Purchase,
+)
+from ecommerce.viewsets.accounting.chart import (
+    ACCOUNTS_PAYABLE_ACCOUNT_CODE,
+    INVENTORY_ACCOUNT_CODE,
+)
+from ecommerce.viewsets.accounting.journal import JournalBatch
+from ecommerce.viewsets.inventory.viewsets import record_inventory_delta
+from ecommerce.viewsets.reporting.daily_facts import (
+    fact_contribution,
+    record_daily_fact_changes,
+)
+
+logger = logging.getLogger(__name__)
+
+PURCHASE_CSV_COLUMNS = {"product_name", "quantity", "price_per_unit", "currency", "purchase_date"}
+PURCHASE_CSV_REQUIRED_COLUMNS = ["product_name", "quantity", "price_per_unit"]
+PURCHASE_CSV_CHUNK_SIZE = 5000
+
+
+class PurchaseCSVIngestor:
+    """
+    Loads a purchase CSV chunk by chunk, so memory stays bounded by the chunk size.
+    Currencies and products are cached across chunks and every chunk is
+    written with one bulk insert per table inside its own transaction.
+    """
+
+    def __init__(self, chunk_size: int = PURCHASE_CSV_CHUNK_SIZE, progress=None):
+        """
+        :param chunk_size: number of CSV rows read and written at a time
+        :param progress: optional callable receiving the number of purchases created after each chunk
+        """
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.currencies = {}
+        self.products = {}
+        self.processed = 0
+
+    def _resolve_currencies(self, codes: set[str]):
+        missing_codes = codes - self.currencies.keys()
+        if missing_codes:
+            self.currencies.update({code: None for code in missing_codes})
+            self.currencies.update(
+                {currency.code: currency for currency in Currency.objects.filter(code__in=missing_codes)}
+            )
+
+    def _resolve_products(self, lower_names: set[str]):
+        missing_names = lower_names - self.products.keys()
+        if missing_names:
+            for product in (
+                    Product.objects.annotate(lower_name=Lower("name"))
+                    .filter(lower_name__in=missing_names)
+                    .order_by("-id")
+            ):
+                # the oldest product wins, like name__iexact(...).first() does
+                self.products[product.lower_name] = product
+
+    def ingest_chunk(self, df: pd.DataFrame):
+        """
+        Validate and write one chunk of purchase rows, raising ValueError before anything is written
+        :param df: chunk of the purchase CSV
+        """
+        currency_codes = (
+            df["currency"].where(df["currency"].notna(), settings.ACCOUNTING_CURRENCY)
+            if "currency" in df.columns
+            else pd.Series(settings.ACCOUNTING_CURRENCY, index=df.index)
+        )
+        lower_names = df["product_name"].astype(str).str.strip().str.lower()
+        self._resolve_currencies(set(currency_codes))
+        self._resolve_products(set(lower_names))
+
+        purchases = []
+        for i, product_name, lower_name, quantity, price_per_unit, currency_code, purchase_date in zip(
+                df.index,
+                df["product_name"],
+                lower_names,
+                df["quantity"],
+                df["price_per_unit"],
+                currency_codes,
+                df["purchase_date"] if "purchase_date" in df.columns else [None] * len(df),
+        ):
+            product = self.products.get(lower_name)
+            if not product:
+                raise ValueError(f"Product not found: {product_name} (row {i})")
+            try:
+                quantity = int(quantity)
+                price_per_unit = Decimal(str(price_per_unit))
+                purchase_datetime = (
+                    timezone.make_aware(datetime.datetime.strptime(purchase_date, "%Y-%m-%d"))
+                    if pd.notna(purchase_date)
+                    else timezone.now()
+                )
+            except (InvalidOperation, TypeError, ValueError) as e:
+                raise ValueError(f"Invalid purchase of {product_name} (row {i}) : {e}")
+            purchases.append(
+                Purchase(
+                    product=product,
+                    quantity=quantity,
+                    price_per_unit=price_per_unit,
+                    currency=self.currencies[currency_code],
+                    purchase_datetime=purchase_datetime,
+                )
+            )
+
+        with transaction.atomic():
+            Purchase.objects.bulk_create(purchases)
+            Inventory.objects.bulk_create(
+                [
+                    Inventory(
+                        product=purchase.product,
+                        purchase=purchase,
+                        stock=purchase.quantity,
+                        purchase_datetime=purchase.purchase_datetime,
+                    )
+                    for purchase in purchases
+                ]
+            )
+            journal_batch = JournalBatch()
+            for purchase in purchases:
+                # bulk_create doesn't send post_save, so ProductInventory is kept current here
+                record_inventory_delta(purchase.product.id, purchase.quantity)
+                journal_entry = journal_batch.add_entry(
+                    f"Bulk purchase of {purchase.quantity} {purchase.product.name}"
+                )
+                journal_batch.add_transfer(
+                    journal_entry,
+                    INVENTORY_ACCOUNT_CODE,
+                    ACCOUNTS_PAYABLE_ACCOUNT_CODE,
+                    purchase.price_per_unit * purchase.quantity,
+                    debit_description="Inventory increase from CSV purchase",
+                    credit_description="Accounts Payable for CSV purchase",
+                )
+            journal_batch.flush()
+            record_daily_fact_changes(added=[fact_contribution(purchase) for purchase in purchases])
+        self.processed += len(purchases)
+        logger.debug(f"Ingested {len(purchases)} purchases, {self.processed} so far")
+        if self.progress:
+            self.progress(self.processed)
+
+    def ingest(self, file_obj: IO) -> int:
+        """
+        Stream a purchase CSV into the database.
+        Chunks written before a failing chunk stay committed.
+        :param file_obj: purchase CSV with product_name, quantity, price_per_unit and optional currency, purchase_date columns
+        :return: number of purchases created
+        """
+        reader = pd.read_csv(
+            file_obj,
+            chunksize=self.chunk_size,
+            usecols=lambda col: col in PURCHASE_CSV_COLUMNS,
+            dtype={"product_name": str, "currency": str, "purchase_date": str},
+        )
+        for i, chunk in enumerate(reader):
+            if i == 0:
+                missing_cols = [col for col in PURCHASE_CSV_REQUIRED_COLUMNS if col not in chunk.columns]
+                if missing_cols:
+                    raise ValueError(f"Missing columns: {missing_cols}")
+            self.ingest_chunk(chunk)
+        return self.processed
@@ -5,7 +5,7 @@ from django.utils.dateparse import parse_date
 import pandas as pd
 from django.conf import settings
 from django.db import transaction
-from django.db.models import Count, OuterRef, Subquery
+from django.db.models import Count, F, OuterRef, Subquery, Sum
 from django.db.models.functions import TruncDate
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
@@ -13,86 +13,66 @@ from rest_framework import generics, status, viewsets
 from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from ecommerce.viewsets.utils import get_fx_rates_with_currency_codes, \
-    convert_amount_from_one_currency_code_to_another
+from ecommerce.viewsets.accounting.chart import ACCOUNTS_PAYABLE_ACCOUNT_CODE, INVENTORY_ACCOUNT_CODE
+from ecommerce.viewsets.accounting.journal import JournalBatch
+from ecommerce.viewsets.accounting.totals import TotalInAccountingCurrencyView
+from ecommerce.viewsets.jobs.viewsets import enqueue_import_job, is_background_request
+from ecommerce.viewsets.pagination import PurchaseCursorPagination
+from ecommerce.viewsets.purchase.bulk_import import PurchaseCSVIngestor
+from ecommerce.viewsets.utils import (
+    get_fx_rate_history,
+    start_of_day,
+    start_of_next_day,
+)
 
 from ecommerce.models import (
-    Account,
+    ImportJob,
     Inventory,
-    JournalEntry,
-    JournalEntryLine,
     Product,
     Purchase,
-    FXRate
 )
 from ecommerce.models.product.models import Currency
 from ecommerce.permissions import IsStaff
 from ecommerce.serializers.purchase.serializers import (
     LastPurchasePriceSerializer,
     PurchaseSerializer,
+    prefetch_purchase_products,
 )
 
 
 class PurchaseViewSet(viewsets.ModelViewSet):
     serializer_class = PurchaseSerializer
     permission_classes = [IsStaff]
+    pagination_class = PurchaseCursorPagination
 
     def get_queryset(self):
-        queryset = Purchase.objects.all().order_by("-purchase_datetime")
+        queryset = prefetch_purchase_products(Purchase.objects.all()).order_by("-purchase_datetime")
         start_date = self.request.query_params.get("start_date")
         end_date = self.request.query_params.get("end_date")
 
         if start_date:
             start_date = parse_date(start_date)
             if start_date:
-                queryset = queryset.filter(purchase_datetime__date__gte=start_date)
+                queryset = queryset.filter(purchase_datetime__gte=start_of_day(start_date))
 
         if end_date:
             end_date = parse_date(end_date)
             if end_date:
-                queryset = queryset.filter(purchase_datetime__date__lte=end_date)
+                queryset = queryset.filter(purchase_datetime__lt=start_of_next_day(end_date))
 
         return queryset
 
 
-class PurchaseTotalInAccountingCurrencyView(APIView):
-    permission_classes = [IsStaff]
-
-    def get(self, request, *args, **kwargs):
-        start_date = parse_date(request.query_params.get("start_date"))
-        end_date = parse_date(request.query_params.get("end_date"))
+class PurchaseTotalInAccountingCurrencyView(TotalInAccountingCurrencyView):
+    amount = F("quantity") * F("price_per_unit")
 
-        purchases = Purchase.objects.select_related("currency").all()
+    def get_queryset(self, start_date, end_date):
+        purchases = Purchase.objects.all()
         if start_date:
-            purchases = purchases.filter(purchase_datetime__date__gte=start_date)
+            purchases = purchases.filter(purchase_datetime__gte=start_of_day(start_date))
         if end_date:
-            purchases = purchases.filter(purchase_datetime__date__lte=end_date)
-
-        # Prepare FX rates map: (from_code, to_code) -> rate
-        fx_rates = FXRate.objects.filter(
-            end_date__isnull=True,
-            currency_to__code=settings.ACCOUNTING_CURRENCY
-        ).select_related("currency_from", "currency_to")
-
-        fx_map = {
-            (fx.currency_from.code, fx.currency_to.code): Decimal(fx.rate)
-            for fx in fx_rates
-        }
-
-        total_amount = Decimal("0.00")
-        for p in purchases:
-            from_code = p.currency.code if p.currency else None
-            to_code = settings.ACCOUNTING_CURRENCY
-            rate = fx_map.get((from_code, to_code), Decimal("1.0") if from_code == to_code else None)
-
-            if rate is None:
-                continue  # skip if FX rate missing
-            total_amount += Decimal(p.quantity) * p.price_per_unit * rate
-
-        return Response({
-            "amount": round(total_amount, 2),
-            "currency": settings.ACCOUNTING_CURRENCY,
-        })
+            purchases = purchases.filter(purchase_datetime__lt=start_of_next_day(end_date))
+        return purchases
 
 
 class LastPurchasePriceViewSet(viewsets.ReadOnlyModelViewSet):
@@ -106,6 +86,8 @@ class LastPurchasePriceViewSet(viewsets.ReadOnlyModelViewSet):
         return Product.objects.annotate(
             last_price=Subquery(latest_purchase.values("price_per_unit")[:1]),
             last_currency_id=Subquery(latest_purchase.values("currency")[:1]),
+            last_currency_code=Subquery(latest_purchase.values("currency__code")[:1]),
+            last_currency_name=Subquery(latest_purchase.values("currency__name")[:1]),
         )
 
 
@@ -139,28 +121,20 @@ class PurchaseCreateAPIView(APIView):
                 )
 
                 # Journal entries
-                inventory_account = Account.objects.get(code="1200")
-                accounts_payable = Account.objects.get(code="2000")
                 total_cost = price_per_unit * quantity
-
-                journal_entry = JournalEntry.objects.create(
-                    description=f"Purchase of {quantity} units of {product.name}"
+                journal_batch = JournalBatch()
+                journal_entry = journal_batch.add_entry(
+                    f"Purchase of {quantity} units of {product.name}"
                 )
-
-                JournalEntryLine.objects.create(
-                    journal_entry=journal_entry,
-                    account=inventory_account,
-                    debit=total_cost,
-                    credit=0,
-                    description="Inventory increase from purchase",
-                )
-                JournalEntryLine.objects.create(
-                    journal_entry=journal_entry,
-                    account=accounts_payable,
-                    debit=0,
-                    credit=total_cost,
-                    description="Accounts Payable for purchase",
+                journal_batch.add_transfer(
+                    journal_entry,
+                    INVENTORY_ACCOUNT_CODE,
+                    ACCOUNTS_PAYABLE_ACCOUNT_CODE,
+                    total_cost,
+                    debit_description="Inventory increase from purchase",
+                    credit_description="Accounts Payable for purchase",
                 )
+                journal_batch.flush()
 
                 return Response(
                     {"message": "Purchase recorded successfully."},
@@ -215,46 +189,32 @@ class PurchaseUpdateAPIView(APIView):
                 purchase.save()
 
                 # Create new journal entry to reflect the adjustment
-                inventory_account = Account.objects.get(code="1200")  # Inventory
-                accounts_payable = Account.objects.get(code="2000")  # Accounts Payable
-
-                journal_entry = JournalEntry.objects.create(
-                    description=f"Adjustment for purchase update #{purchase.id} {purchase}"
+                journal_batch = JournalBatch()
+                journal_entry = journal_batch.add_entry(
+                    f"Adjustment for purchase update #{purchase.id} {purchase}"
                 )
 
-                if delta != 0:
-                    if delta > 0:
-                        # Cost increased → debit inventory, credit payable
-                        JournalEntryLine.objects.create(
-                            journal_entry=journal_entry,
-                            account=inventory_account,
-                            debit=delta,
-                            credit=0,
-                            description="Inventory increase from purchase update",
-                        )
-                        JournalEntryLine.objects.create(
-                            journal_entry=journal_entry,
-                            account=accounts_payable,
-                            debit=0,
-                            credit=delta,
-                            description="Accounts payable increase from purchase update",
-                        )
-                    else:
-                        # Cost decreased → credit inventory, debit payable
-                        JournalEntryLine.objects.create(
-                            journal_entry=journal_entry,
-                            account=inventory_account,
-                            debit=0,
-                            credit=abs(delta),
-                            description="Inventory decrease from purchase update",
-                        )
-                        JournalEntryLine.objects.create(
-                            journal_entry=journal_entry,
-                            account=accounts_payable,
-                            debit=abs(delta),
-                            credit=0,
-                            description="Accounts payable decrease from purchase update",
-                        )
+                if delta > 0:
+                    # Cost increased → debit inventory, credit payable
+                    journal_batch.add_transfer(
+                        journal_entry,
+                        INVENTORY_ACCOUNT_CODE,
+                        ACCOUNTS_PAYABLE_ACCOUNT_CODE,
+                        delta,
+                        debit_description="Inventory increase from purchase update",
+                        credit_description="Accounts payable increase from purchase update",
+                    )
+                elif delta < 0:
+                    # Cost decreased → credit inventory, debit payable
+                    journal_batch.add_transfer(
+                        journal_entry,
+                        ACCOUNTS_PAYABLE_ACCOUNT_CODE,
+                        INVENTORY_ACCOUNT_CODE,
+                        abs(delta),
+                        debit_description="Accounts payable decrease from purchase update",
+                        credit_description="Inventory decrease from purchase update",
+                    )
+                journal_batch.flush()
 
                 return Response(
                     {
@@ -278,76 +238,12 @@ class PurchaseCreateUpdateFromCSVAPIView(APIView):
                 return Response(
                     {"error": "No file uploaded"}, status=status.HTTP_400_BAD_REQUEST
                 )
+            if is_background_request(request):
+                return enqueue_import_job(request, ImportJob.KIND_PURCHASES)
 
-            df = pd.read_csv(file_obj)
-            required_cols = ["product_name", "quantity", "price_per_unit"]
-            missing_cols = [col for col in required_cols if col not in df.columns]
-            if missing_cols:
-                return Response(
-                    {"error": f"Missing columns: {missing_cols}"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-            for i, row in df.iterrows():
-                with transaction.atomic():
-                    product_name = row["product_name"]
-                    quantity = int(row["quantity"])
-                    price_per_unit = Decimal(row["price_per_unit"])
-                    currency_code = row.get("currency")
-                    currency_code = (
-                        currency_code
-                        if pd.notna(currency_code)
-                        else settings.ACCOUNTING_CURRENCY
-                    )
-                    currency = Currency.objects.filter(code=currency_code).first()
-                    purchase_date = row.get("purchase_date")
-                    purchase_datetime = (
-                        timezone.datetime.strptime(purchase_date, "%Y-%m-%d")
-                        if pd.notna(purchase_date)
-                        else timezone.now()
-                    )
-
-                    product = Product.objects.filter(name__iexact=product_name).first()
-                    if not product:
-                        raise ValueError(f"Product not found: {product_name}")
-
-                    purchase = Purchase.objects.create(
-                        product=product,
-                        quantity=quantity,
-                        price_per_unit=price_per_unit,
-                        currency=currency,
-                        purchase_datetime=purchase_datetime,
-                    )
-
-                    Inventory.objects.create(
-                        product=product, purchase=purchase, stock=quantity
-                    )
-
-                    inventory_account = Account.objects.get(code="1200")
-                    accounts_payable = Account.objects.get(code="2000")
-                    total_cost = price_per_unit * quantity
-
-                    journal_entry = JournalEntry.objects.create(
-                        description=f"Bulk purchase of {quantity} {product.name}"
-                    )
-
-                    JournalEntryLine.objects.create(
-                        journal_entry=journal_entry,
-                        account=inventory_account,
-                        debit=total_cost,
-                        credit=0,
-                        description="Inventory increase from CSV purchase",
-                    )
-                    JournalEntryLine.objects.create(
-                        journal_entry=journal_entry,
-                        account=accounts_payable,
-                        debit=0,
-                        credit=total_cost,
-                        description="Accounts Payable for CSV purchase",
-                    )
-
+            processed = PurchaseCSVIngestor().ingest(file_obj)
             return Response(
-                {"message": f"Successfully processed {len(df)} purchases."},
+                {"message": f"Successfully processed {processed} purchases."},
                 status=status.HTTP_200_OK,
             )
 
@@ -363,34 +259,30 @@ class PurchaseSummaryByDateAPIView(APIView):
     permission_classes = [IsStaff]
 
     def get(self, request):
-        purchases = Purchase.objects.all()
-        data = [
-            {
-
-                "quantity": purchase.quantity,
-                "price_per_unit": float(purchase.price_per_unit),
-                "currency": purchase.currency.code if purchase.currency else None,
-                "purchase_date": purchase.purchase_datetime.date(),
-
-            }
-            for purchase in purchases
-        ]
+        # one row per purchase date and currency, so the frame stays small however many purchases there are
+        rows = (
+            Purchase.objects.order_by()
+            .values(purchase_date=TruncDate("purchase_datetime"), currency_code=F("currency__code"))
+            .annotate(num_purchases=Count("id"), amount=Sum(F("quantity") * F("price_per_unit")))
+            .values_list("purchase_date", "currency_code", "num_purchases", "amount")
+        )
+        purchasedf = pd.DataFrame(
+            list(rows), columns=["purchase_date", "currency", "num_purchases", "amount"]
+        )
+        if purchasedf.empty:
+            return Response([])
 
-        # Convert to DataFrame
-        fx_rates = get_fx_rates_with_currency_codes()
-        purchasedf = pd.DataFrame(data)
         purchasedf["currency"] = purchasedf["currency"].fillna(settings.ACCOUNTING_CURRENCY)
-        purchasedf["amount"] = purchasedf["quantity"] * purchasedf["price_per_unit"]
-        purchasedf["amount_in_accounting_currency"] = purchasedf.apply(
-            lambda row: convert_amount_from_one_currency_code_to_another(row["amount"], row["currency"],
-                                                                         settings.ACCOUNTING_CURRENCY, fx_rates),
-            axis=1)
-
-        purchase_sum_df = purchasedf.groupby("purchase_date")[["amount", "amount_in_accounting_currency"]].agg(
-            {"amount": "count", "amount_in_accounting_currency": "sum"}).reset_index()
-        purchase_sum_df.columns=["purchase_date","num_purchases","amount"]
-        purchase_sum_df["currency_code"]=settings.ACCOUNTING_CURRENCY
-        purchase_sum_df=purchase_sum_df.sort_values("purchase_date",ascending=False)
+        # convert with the FX rates that were active on each purchase date
+        purchasedf["amount"] = get_fx_rate_history(settings.ACCOUNTING_CURRENCY).convert(
+            purchasedf["amount"], purchasedf["currency"], purchasedf["purchase_date"]
+        )
+
+        purchase_sum_df = (
+            purchasedf.groupby("purchase_date")[["num_purchases", "amount"]].sum().reset_index()
+        )
+        purchase_sum_df["currency_code"] = settings.ACCOUNTING_CURRENCY
+        purchase_sum_df = purchase_sum_df.sort_values("purchase_date", ascending=False)
 
         return Response(
             purchase_sum_df.to_dict(orient="records")
@@ -411,6 +303,9 @@ class PurchaseDetailByDateAPIView(generics.ListAPIView):
         except ValueError:
             return Purchase.objects.none()
 
-        return Purchase.objects.filter(purchase_datetime__date=date_obj).order_by(
-            "purchase_datetime"
-        )
+        return prefetch_purchase_products(
+            Purchase.objects.filter(
+                purchase_datetime__gte=start_of_day(date_obj),
+                purchase_datetime__lt=start_of_next_day(date_obj),
+            )
+        ).order_by("purchase_datetime")
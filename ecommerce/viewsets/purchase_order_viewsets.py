@@ -15,7 +15,7 @@ from sampytools.list_utils import get_intersection
 from ecommerce.models import (
     Currency,
     Customer,
-    FXRate,
+    ImportJob,
     Inventory,
     Order,
     OrderItem,
@@ -25,15 +25,27 @@ from ecommerce.models import (
     Purchase,
 )
 from ecommerce.permissions import IsStaff
+from ecommerce.viewsets.jobs.viewsets import enqueue_import_job, is_background_request
+from ecommerce.viewsets.accounting.journal import JournalBatch
 from ecommerce.viewsets.accounting.viewsets import (
     journal_entry_for_income_increase_when_product_sold,
     journal_entry_for_purchase_inventory_increase,
     journal_entry_when_product_is_sold_fifo,
 )
-from ecommerce.viewsets.utils import convert_amount_from_one_currency_to_another
+from ecommerce.viewsets.utils import (
+    convert_amount_from_one_currency_to_another,
+    get_fx_rate_matrix,
+)
 
 logger = logging.getLogger(__name__)
 
+PURCHASE_AND_ORDER_CSV_REQUIRED_COLUMNS = [
+    "product_name",
+    "quantity",
+    "purchase_price",
+    "selling_price",
+]
+
 
 class AdminPurchaseAndOrderAPIView(APIView):
     """
@@ -70,12 +82,10 @@ class AdminPurchaseAndOrderAPIView(APIView):
             customer = get_object_or_404(Customer, id=customer_id)
 
             # active FX rates keyed by (from_id, to_id)
-            fx_rates = {
-                (fx.currency_from.id, fx.currency_to.id): fx.rate
-                for fx in FXRate.objects.filter(end_date__isnull=True)
-            }
+            fx_rates = get_fx_rate_matrix().as_dict()
 
             with transaction.atomic():
+                journal_batch = JournalBatch()
                 # --- Create Purchase ---
                 purchase = Purchase.objects.create(
                     product=product,
@@ -90,17 +100,14 @@ class AdminPurchaseAndOrderAPIView(APIView):
                     purchase=purchase,
                     stock=purchase_qty
                 )
-                journal_entry_for_purchase_inventory_increase(product, purchase)
+                journal_entry_for_purchase_inventory_increase(product, purchase, journal_batch)
 
                 # --- Update Product Price if needed ---
-                active_price = ProductPrice.objects.filter(
-                    product=product, end_date__isnull=True
-                ).first()
-
-                if not active_price or active_price.price != sold_price or active_price.currency_id != sold_currency.id:
-                    if active_price:
-                        active_price.end_date = timezone.now()
-                        active_price.save()
+                if product.current_price is None or product.current_price != sold_price or product.current_currency_id != sold_currency.id:
+                    ProductPrice.objects.filter(
+                        product=product, end_date__isnull=True
+                    ).update(end_date=timezone.now())
+                    # creating the new price syncs product.current_price
                     ProductPrice.objects.create(
                         product=product,
                         price=sold_price,
@@ -141,9 +148,10 @@ class AdminPurchaseAndOrderAPIView(APIView):
 
                 # Reduce inventory / record COGS
                 cost = journal_entry_when_product_is_sold_fifo(
-                    product=product, quantity_sold=sold_qty
+                    product=product, quantity_sold=sold_qty, batch=journal_batch
                 )
-                journal_entry_for_income_increase_when_product_sold(order, customer, line_total)
+                journal_entry_for_income_increase_when_product_sold(order, customer, line_total, journal_batch)
+                journal_batch.flush()
                 return Response(
                     {
                         "message": "Purchase and order created successfully.",
@@ -158,6 +166,171 @@ class AdminPurchaseAndOrderAPIView(APIView):
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+def create_purchase_and_order_from_csv_row(
+        row: pd.Series, columns: list[str], fx_rates: dict
+) -> tuple[Purchase, Order | None]:
+    """
+    Create a purchase and, when the row has a selling price, an order for one row of a purchase and order CSV
+    :param row: CSV row with product_name, quantity, purchase_price, selling_price and optional columns
+    :param columns: CSV columns
+    :param fx_rates: active fx rates keyed by currency id pairs
+    :return: created purchase and order
+    """
+    with transaction.atomic():
+        journal_batch = JournalBatch()
+        # --- Product ---
+        product_name = str(row["product_name"]).strip()
+        product = Product.objects.filter(name__iexact=product_name).first()
+        if not product:
+            raise ValueError(f"Product not found: {product_name}")
+
+        # --- Purchase data ---
+        purchase_qty = int(row["quantity"])
+        purchase_price = Decimal(row["purchase_price"])
+        if pd.notna(row.get("purchase_currency")):
+            purchase_currency_code = str(row["purchase_currency"]).strip()
+        else:
+            purchase_currency_code = settings.ACCOUNTING_CURRENCY
+        purchase_currency = Currency.objects.filter(
+            code__iexact=purchase_currency_code
+        ).first()
+        if not purchase_currency:
+            raise ValueError(f"Invalid purchase currency: {purchase_currency_code}")
+
+        purchase_date = (
+            timezone.datetime.strptime(str(row["purchase_date"]), "%Y-%m-%d")
+            if "purchase_date" in row and pd.notna(row["purchase_date"])
+            else timezone.now()
+        )
+
+        # --- Create Purchase ---
+        purchase = Purchase.objects.create(
+            product=product,
+            quantity=purchase_qty,
+            price_per_unit=purchase_price,
+            currency=purchase_currency,
+            purchase_datetime=purchase_date,
+        )
+        Inventory.objects.create(product=product, purchase=purchase, stock=purchase_qty)
+        journal_entry_for_purchase_inventory_increase(product, purchase, journal_batch)
+
+        # --- Order (if selling_price present) ---
+        if pd.notna(row.get("selling_price")):
+            # one of customer_id, customer_username, customer_email, customer_name should be present in the header
+            customer_identification_cols = ["customer_id", "customer_username", "customer_email",
+                                            "customer_name"]
+            if get_intersection(customer_identification_cols, columns) == 0:
+                raise ValueError(f"One of {customer_identification_cols} should be specified")
+
+            selling_qty = int(row["selling_quantity"]) if pd.notna(
+                row.get("selling_quantity")) else int(row["quantity"])
+            selling_price = Decimal(row["selling_price"])
+            selling_currency_code = str(row["selling_currency"]).strip() if pd.notna(
+                row.get("selling_currency")) else getattr(settings, "ACCOUNTING_CURRENCY", "JPY")
+            selling_currency = Currency.objects.filter(
+                code__iexact=selling_currency_code
+            ).first()
+            if not selling_currency:
+                raise ValueError(f"Invalid selling currency: {selling_currency_code}")
+
+            payment_method = (
+                str(row["payment_method"]).strip()
+                if pd.notna(row.get("payment_method"))
+                else "cash_on_delivery"
+            )
+            base_currency_code = (
+                str(row["base_currency"]).strip()
+                if pd.notna(row.get("base_currency"))
+                else getattr(settings, "ACCOUNTING_CURRENCY", "JPY")
+            )
+            base_currency = Currency.objects.filter(
+                code__iexact=base_currency_code
+            ).first()
+
+            # --- Customer identification ---
+            customer = None
+            if pd.notna(row.get("customer_id")):
+                customer = Customer.objects.filter(id=int(row["customer_id"])).first()
+            elif pd.notna(row.get("customer_username")):
+                customer = Customer.objects.filter(
+                    user__username=str(row["customer_username"]).strip()
+                ).first()
+            elif pd.notna(row.get("customer_email")):
+                customer = Customer.objects.filter(
+                    user__email=str(row["customer_email"]).strip()
+                ).first()
+            elif pd.notna(row.get("customer_name")):
+                name_parts = str(row["customer_name"]).strip().split()
+                if len(name_parts) >= 2:
+                    customer = Customer.objects.filter(
+                        user__first_name=name_parts[-1],
+                        user__last_name=" ".join(name_parts[:-1]),
+                    ).first()
+            if not customer:
+                raise ValueError(
+                    f"No valid customer identifier for product {product_name}"
+                )
+
+            # --- Update product price if needed ---
+            if (
+                    product.current_price is None
+                    or product.current_price != selling_price
+                    or product.current_currency_id != selling_currency.id
+            ):
+                ProductPrice.objects.filter(
+                    product=product, end_date__isnull=True
+                ).update(end_date=timezone.now())
+                # creating the new price syncs product.current_price
+                ProductPrice.objects.create(
+                    product=product,
+                    price=selling_price,
+                    currency=selling_currency,
+                    begin_date=timezone.now(),
+                )
+
+            # --- Create order ---
+            order = Order.objects.create(
+                customer=customer,
+                status="pending",
+                total_amount=Decimal("0.00"),
+                currency=base_currency,
+            )
+
+            converted_price = convert_amount_from_one_currency_to_another(
+                selling_price,
+                selling_currency.id,
+                base_currency.id,
+                fx_rates,
+            )
+            line_total = converted_price * selling_qty
+
+            OrderItem.objects.create(
+                order=order,
+                product=product,
+                quantity=selling_qty,
+                price=selling_price,
+                currency=selling_currency,
+            )
+
+            order.total_amount = line_total
+            order.save()
+
+            Payment.objects.create(
+                order=order,
+                method=payment_method[:20],  # truncate to avoid varchar(20) overflow
+                status="pending",
+                transaction_id=None,
+            )
+
+            # Accounting entries
+            journal_entry_when_product_is_sold_fifo(product, quantity_sold=selling_qty, batch=journal_batch)
+            journal_entry_for_income_increase_when_product_sold(order, customer, line_total, journal_batch)
+            journal_batch.flush()
+            return purchase, order
+        journal_batch.flush()
+        return purchase, None
+
+
 from rest_framework import serializers
 
 
@@ -179,16 +352,12 @@ class AdminPurchaseAndOrderFromCSVAPIView(APIView):
                 return Response(
                     {"error": "No file uploaded."}, status=status.HTTP_400_BAD_REQUEST
                 )
+            if is_background_request(request):
+                return enqueue_import_job(request, ImportJob.KIND_PURCHASES_AND_ORDERS)
 
             df = pd.read_csv(file_obj)
 
-            required_cols = [
-                "product_name",
-                "quantity",
-                "purchase_price",
-                "selling_price",
-            ]
-            missing_cols = [c for c in required_cols if c not in df.columns]
+            missing_cols = [c for c in PURCHASE_AND_ORDER_CSV_REQUIRED_COLUMNS if c not in df.columns]
             if missing_cols:
                 return Response(
                     {"error": f"Missing required columns: {missing_cols}"},
@@ -199,169 +368,18 @@ class AdminPurchaseAndOrderFromCSVAPIView(APIView):
             created_orders = 0
 
             # load active fx rates once
-            fx_rates = {
-                (fx.currency_from.id, fx.currency_to.id): fx.rate
-                for fx in FXRate.objects.filter(end_date__isnull=True)
-            }
+            fx_rates = get_fx_rate_matrix().as_dict()
 
             for i, row in df.iterrows():
                 try:
-                    with transaction.atomic():
-                        # --- Product ---
-                        product_name = str(row["product_name"]).strip()
-                        product = Product.objects.filter(name__iexact=product_name).first()
-                        if not product:
-                            raise ValueError(f"Product not found: {product_name}")
-
-                        # --- Purchase data ---
-                        purchase_qty = int(row["quantity"])
-                        purchase_price = Decimal(row["purchase_price"])
-                        if pd.notna(row.get("purchase_currency")):
-                            purchase_currency_code = str(row["purchase_currency"]).strip()
-                        else:
-                            purchase_currency_code = settings.ACCOUNTING_CURRENCY
-                        purchase_currency = Currency.objects.filter(
-                            code__iexact=purchase_currency_code
-                        ).first()
-                        if not purchase_currency:
-                            raise ValueError(f"Invalid purchase currency: {purchase_currency_code}")
-
-                        purchase_date = (
-                            timezone.datetime.strptime(str(row["purchase_date"]), "%Y-%m-%d")
-                            if "purchase_date" in row and pd.notna(row["purchase_date"])
-                            else timezone.now()
-                        )
-
-                        # --- Create Purchase ---
-                        purchase = Purchase.objects.create(
-                            product=product,
-                            quantity=purchase_qty,
-                            price_per_unit=purchase_price,
-                            currency=purchase_currency,
-                            purchase_datetime=purchase_date,
-                        )
-                        Inventory.objects.create(product=product, purchase=purchase, stock=purchase_qty)
-                        journal_entry_for_purchase_inventory_increase(product, purchase)
-                        created_purchases += 1
-
-                        # --- Order (if selling_price present) ---
-                        if pd.notna(row.get("selling_price")):
-                            # one of customer_id, customer_username, customer_email, customer_name should be present in the header
-                            customer_identification_cols = ["customer_id", "customer_username", "customer_email",
-                                                            "customer_name"]
-                            if get_intersection(customer_identification_cols, df.columns) == 0:
-                                raise ValueError(f"One of {customer_identification_cols} should be specified")
-
-                            selling_qty = int(row["selling_quantity"]) if pd.notna(
-                                row.get("selling_quantity")) else int(row["quantity"])
-                            selling_price = Decimal(row["selling_price"])
-                            selling_currency_code = str(row["selling_currency"]).strip() if pd.notna(
-                                row.get("selling_currency")) else getattr(settings, "ACCOUNTING_CURRENCY", "JPY")
-                            selling_currency = Currency.objects.filter(
-                                code__iexact=selling_currency_code
-                            ).first()
-                            if not selling_currency:
-                                raise ValueError(f"Invalid selling currency: {selling_currency_code}")
-
-                            payment_method = (
-                                str(row["payment_method"]).strip()
-                                if pd.notna(row.get("payment_method"))
-                                else "cash_on_delivery"
-                            )
-                            base_currency_code = (
-                                str(row["base_currency"]).strip()
-                                if pd.notna(row.get("base_currency"))
-                                else getattr(settings, "ACCOUNTING_CURRENCY", "JPY")
-                            )
-                            base_currency = Currency.objects.filter(
-                                code__iexact=base_currency_code
-                            ).first()
-
-                            # --- Customer identification ---
-                            customer = None
-                            if pd.notna(row.get("customer_id")):
-                                customer = Customer.objects.filter(id=int(row["customer_id"])).first()
-                            elif pd.notna(row.get("customer_username")):
-                                customer = Customer.objects.filter(
-                                    user__username=str(row["customer_username"]).strip()
-                                ).first()
-                            elif pd.notna(row.get("customer_email")):
-                                customer = Customer.objects.filter(
-                                    user__email=str(row["customer_email"]).strip()
-                                ).first()
-                            elif pd.notna(row.get("customer_name")):
-                                name_parts = str(row["customer_name"]).strip().split()
-                                if len(name_parts) >= 2:
-                                    customer = Customer.objects.filter(
-                                        user__first_name=name_parts[-1],
-                                        user__last_name=" ".join(name_parts[:-1]),
-                                    ).first()
-                            if not customer:
-                                raise ValueError(
-                                    f"No valid customer identifier for product {product_name}"
-                                )
-
-                            # --- Update product price if needed ---
-                            active_price = ProductPrice.objects.filter(
-                                product=product, end_date__isnull=True
-                            ).first()
-                            if (
-                                    not active_price
-                                    or active_price.price != selling_price
-                                    or active_price.currency_id != selling_currency.id
-                            ):
-                                if active_price:
-                                    active_price.end_date = timezone.now()
-                                    active_price.save()
-                                ProductPrice.objects.create(
-                                    product=product,
-                                    price=selling_price,
-                                    currency=selling_currency,
-                                    begin_date=timezone.now(),
-                                )
-
-                            # --- Create order ---
-                            order = Order.objects.create(
-                                customer=customer,
-                                status="pending",
-                                total_amount=Decimal("0.00"),
-                                currency=base_currency,
-                            )
-
-                            converted_price = convert_amount_from_one_currency_to_another(
-                                selling_price,
-                                selling_currency.id,
-                                base_currency.id,
-                                fx_rates,
-                            )
-                            line_total = converted_price * selling_qty
-
-                            OrderItem.objects.create(
-                                order=order,
-                                product=product,
-                                quantity=selling_qty,
-                                price=selling_price,
-                                currency=selling_currency,
-                            )
-
-                            order.total_amount = line_total
-                            order.save()
-
-                            Payment.objects.create(
-                                order=order,
-                                method=payment_method[:20],  # truncate to avoid varchar(20) overflow
-                                status="pending",
-                                transaction_id=None,
-                            )
-
-                            # Accounting entries
-                            journal_entry_when_product_is_sold_fifo(product, quantity_sold=selling_qty)
-                            journal_entry_for_income_increase_when_product_sold(order, customer, line_total)
-                            created_orders += 1
+                    purchase, order = create_purchase_and_order_from_csv_row(row, df.columns, fx_rates)
+                    created_purchases += 1
+                    if order:
+                        created_orders += 1
 
                 except Exception as row_err:
                     logger.error(f"Error processing row {i}: {row_err}")
-                    return Response({"error":f"Error while processing purchase order for {product} : {row_err}"},status=status.HTTP_400_BAD_REQUEST)
+                    return Response({"error":f"Error while processing purchase order for {row.get('product_name')} : {row_err}"},status=status.HTTP_400_BAD_REQUEST)
 
             return Response(
                 {
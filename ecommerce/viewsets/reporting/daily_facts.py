@@ -0,0 +1,372 @@
+import datetime
+import logging
+import threading
+from decimal import Decimal
+from typing import Iterable
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DEFERRED, Count, F, IntegerField, Min, Sum, Value
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from ecommerce.income_and_spendings.incomes import Income
+from ecommerce.income_and_spendings.spendings import Spending
+from ecommerce.models import Currency, DailyFact, JournalEntryLine, Order, Purchase
+from ecommerce.viewsets.accounting.chart import COGS_ACCOUNT_CODE
+from ecommerce.viewsets.utils import start_of_day, start_of_next_day
+
+logger = logging.getLogger(__name__)
+
+DAILY_FACT_FIELDS = [
+    "sales",
+    "cogs",
+    "purchases",
+    "incomes",
+    "spendings",
+    "order_count",
+    "purchase_count",
+]
+# PositiveIntegerFields, a delta taking them below zero raises an IntegrityError
+DAILY_FACT_COUNT_FIELDS = ["order_count", "purchase_count"]
+
+
+def fact_date(value: datetime.datetime | datetime.date) -> datetime.date:
+    """
+    :param value: date, or datetime that is bucketed by its date in the current timezone like TruncDate does
+    :return:
+    """
+    if isinstance(value, datetime.datetime):
+        return timezone.localdate(value)
+    return value
+
+
+def _amount(value) -> Decimal:
+    # incomes and spendings are float fields, str keeps their repr
+    return value if isinstance(value, (int, Decimal)) else Decimal(str(value))
+
+
+def _daily_totals(queryset, date_expression, currency_expression, **aggregates):
+    return (
+        queryset.order_by()
+        .values(fact_date=date_expression, fact_currency_id=currency_expression)
+        .annotate(**aggregates)
+    )
+
+
+def compute_daily_facts(start_date: datetime.date, end_date: datetime.date) -> dict:
+    """
+    Aggregate the source tables of a date range with one grouped query each
+    :param start_date:
+    :param end_date: inclusive
+    :return: mapping of (date, currency id) to unsaved DailyFact
+    """
+    accounting_currency_id = (
+        Currency.objects.filter(code=settings.ACCOUNTING_CURRENCY).values_list("id", flat=True).first()
+    )
+    start, end = start_of_day(start_date), start_of_next_day(end_date)
+    sources = [
+        _daily_totals(
+            Order.objects.filter(created_at__gte=start, created_at__lt=end),
+            TruncDate("created_at"),
+            F("currency_id"),
+            sales=Sum("total_amount"),
+            order_count=Count("id"),
+        ),
+        _daily_totals(
+            Purchase.objects.filter(purchase_datetime__gte=start, purchase_datetime__lt=end),
+            TruncDate("purchase_datetime"),
+            F("currency_id"),
+            purchases=Sum(F("quantity") * F("price_per_unit")),
+            purchase_count=Count("id"),
+        ),
+        _daily_totals(
+            Income.objects.filter(adate__gte=start_date, adate__lte=end_date),
+            F("adate"),
+            F("currency_id"),
+            incomes=Sum("amount"),
+        ),
+        _daily_totals(
+            Spending.objects.filter(adate__gte=start_date, adate__lte=end_date),
+            F("adate"),
+            F("currency_id"),
+            spendings=Sum("amount"),
+        ),
+        _daily_totals(
+            JournalEntryLine.objects.filter(
+                account__code=COGS_ACCOUNT_CODE,
+                journal_entry__date__gte=start_date,
+                journal_entry__date__lte=end_date,
+            ),
+            F("journal_entry__date"),
+            Value(None, output_field=IntegerField()),
+            cogs=Sum(F("debit") - F("credit")),
+        ),
+    ]
+
+    facts = {}
+    for rows in sources:
+        for row in rows:
+            # rows without a currency, like ledger lines, are in the accounting currency
+            currency_id = row["fact_currency_id"] or accounting_currency_id
+            key = (fact_date(row["fact_date"]), currency_id)
+            fact = facts.get(key)
+            if fact is None:
+                fact = facts[key] = DailyFact(date=key[0], currency_id=currency_id)
+            for field in DAILY_FACT_FIELDS:
+                if row.get(field) is not None:
+                    setattr(fact, field, getattr(fact, field) + _amount(row[field]))
+    return facts
+
+
+def rebuild_daily_facts(start_date: datetime.date, end_date: datetime.date) -> int:
+    """
+    Recompute the DailyFact rows of a date range from orders, purchases, incomes, spendings and the ledger
+    :param start_date:
+    :param end_date: inclusive
+    :return: number of DailyFact rows of the range
+    """
+    facts = compute_daily_facts(start_date, end_date)
+    with transaction.atomic():
+        DailyFact.objects.bulk_create(
+            facts.values(),
+            update_conflicts=True,
+            unique_fields=["date", "currency"],
+            update_fields=DAILY_FACT_FIELDS + ["updated_at"],
+        )
+        stale_ids = [
+            fact_id
+            for fact_id, date, currency_id in DailyFact.objects.filter(
+                date__gte=start_date, date__lte=end_date
+            ).values_list("id", "date", "currency_id")
+            if (date, currency_id) not in facts
+        ]
+        DailyFact.objects.filter(id__in=stale_ids).delete()
+    logger.debug(f"Rebuilt {len(facts)} daily facts from {start_date} to {end_date}")
+    return len(facts)
+
+
+def first_fact_date() -> datetime.date | None:
+    """
+    :return: earliest date of any order, purchase, income, spending or journal entry
+    """
+    dates = [
+        Order.objects.aggregate(first=Min("created_at"))["first"],
+        Purchase.objects.aggregate(first=Min("purchase_datetime"))["first"],
+        Income.objects.aggregate(first=Min("adate"))["first"],
+        Spending.objects.aggregate(first=Min("adate"))["first"],
+        JournalEntryLine.objects.aggregate(first=Min("journal_entry__date"))["first"],
+    ]
+    dates = [fact_date(date) for date in dates if date is not None]
+    return min(dates, default=None)
+
+
+# (date, currency id, amounts) a record adds to the daily facts
+FactContribution = tuple[datetime.date, int | None, dict[str, Decimal]]
+
+
+def _order_contribution(values: dict) -> FactContribution:
+    return values["created_at"], values["currency_id"], {"sales": values["total_amount"], "order_count": 1}
+
+
+def _purchase_contribution(values: dict) -> FactContribution:
+    return (
+        values["purchase_datetime"],
+        values["currency_id"],
+        {"purchases": _amount(values["quantity"]) * _amount(values["price_per_unit"]), "purchase_count": 1},
+    )
+
+
+def _income_contribution(values: dict) -> FactContribution:
+    return values["adate"], values["currency_id"], {"incomes": values["amount"]}
+
+
+def _spending_contribution(values: dict) -> FactContribution:
+    return values["adate"], values["currency_id"], {"spendings": values["amount"]}
+
+
+# fields each source model reads and how they turn into a contribution
+DAILY_FACT_SOURCES = {
+    Order: (["created_at", "currency_id", "total_amount"], _order_contribution),
+    Purchase: (["purchase_datetime", "currency_id", "quantity", "price_per_unit"], _purchase_contribution),
+    Income: (["adate", "currency_id", "amount"], _income_contribution),
+    Spending: (["adate", "currency_id", "amount"], _spending_contribution),
+}
+
+
+def fact_values(instance) -> tuple:
+    """
+    :param instance: Order, Purchase, Income or Spending
+    :return: current values of the fields its contribution to the daily facts is computed from
+    """
+    fields, _ = DAILY_FACT_SOURCES[type(instance)]
+    return tuple(getattr(instance, field) for field in fields)
+
+
+def loaded_fact_values(instance):
+    """
+    Like fact_values, but only from the values already loaded, so that no deferred field is queried
+    :return: DEFERRED when a field isn't loaded
+    """
+    fields, _ = DAILY_FACT_SOURCES[type(instance)]
+    try:
+        return tuple(instance.__dict__[field] for field in fields)
+    except KeyError:
+        return DEFERRED
+
+
+def stored_fact_values(instance) -> tuple | None:
+    """
+    :return: values of the record as stored in the database, None when it isn't stored
+    """
+    fields, _ = DAILY_FACT_SOURCES[type(instance)]
+    return type(instance).objects.filter(pk=instance.pk).values_list(*fields).first()
+
+
+def contribution_from_values(model, values: tuple | None) -> FactContribution | None:
+    """
+    :param model: Order, Purchase, Income or Spending
+    :param values: values returned by fact_values, loaded_fact_values or stored_fact_values
+    :return: what a record with these values adds to the daily facts
+    """
+    if values is None:
+        return None
+    fields, contribution = DAILY_FACT_SOURCES[model]
+    values = dict(zip(fields, values))
+    if any(values[field] is None for field in fields if field != "currency_id"):
+        return None  # e.g. an order before its first save has no created_at yet
+    return contribution(values)
+
+
+def fact_contribution(instance) -> FactContribution | None:
+    """
+    :param instance: Order, Purchase, Income or Spending
+    :return: what the record adds to the daily facts with its current values
+    """
+    return contribution_from_values(type(instance), fact_values(instance))
+
+
+def cogs_contribution(journal_entry_date: datetime.date, debit, credit) -> FactContribution:
+    """
+    :return: what a COGS ledger line adds, COGS rows have no currency and roll up under the accounting currency
+    """
+    return journal_entry_date, None, {"cogs": _amount(debit) - _amount(credit)}
+
+
+class DailyFactDeltas:
+    """
+    Changes of DailyFact amounts collected by (date, currency id) and applied with one F() update per row.
+    """
+
+    def __init__(self, savepoint_ids: list[str] = None, rebuilt_dates: set[datetime.date] = None):
+        """
+        :param savepoint_ids: savepoints of the transaction the deltas are applied on commit of
+        :param rebuilt_dates: dates rebuilt from the source tables by the deltas of the same commit,
+            the rebuild already counted the deltas applied after it
+        """
+        self.savepoint_ids = savepoint_ids
+        self.rebuilt_dates = set() if rebuilt_dates is None else rebuilt_dates
+        self.deltas: dict[tuple, dict[str, Decimal]] = {}
+        self.applied = False
+
+    def __call__(self):
+        self.apply()
+
+    def add(self, contribution: FactContribution | None, sign: int = 1):
+        if contribution is None:
+            return
+        date, currency_id, amounts = contribution
+        deltas = self.deltas.setdefault((fact_date(date), currency_id), {})
+        for field, value in amounts.items():
+            deltas[field] = deltas.get(field, 0) + sign * _amount(value)
+
+    def apply(self):
+        accounting_currency_id = None
+        if any(currency_id is None for _, currency_id in self.deltas):
+            accounting_currency_id = (
+                Currency.objects.filter(code=settings.ACCOUNTING_CURRENCY).values_list("id", flat=True).first()
+            )
+        # rows are updated in a fixed order, so concurrent commits lock them without deadlocking
+        for date, currency_id in sorted(self.deltas, key=lambda key: (key[0], key[1] or 0)):
+            deltas = {field: value for field, value in self.deltas[(date, currency_id)].items() if value}
+            if deltas and date not in self.rebuilt_dates:
+                if not apply_daily_fact_delta(date, currency_id or accounting_currency_id, deltas):
+                    self.rebuilt_dates.add(date)
+        self.deltas = {}
+        self.applied = True
+
+    def is_queued(self, connection) -> bool:
+        # Django drops on_commit callbacks of rolled back transactions and savepoints
+        return not self.applied and any(func is self for _, func, _ in connection.run_on_commit)
+
+    def is_pending(self, connection) -> bool:
+        return self.is_queued(connection) and self.savepoint_ids == connection.savepoint_ids
+
+
+def apply_daily_fact_delta(date: datetime.date, currency_id: int | None, deltas: dict[str, Decimal]) -> bool:
+    """
+    Add amounts to one DailyFact row, creating it first when it doesn't exist yet.
+    A count that would go negative has drifted from the source tables, e.g. after a queryset.delete()
+    that bypassed the signals. It is logged and the date is rebuilt from the source tables instead.
+    :param deltas: mapping of DailyFact field to the amount added
+    :return: False when the date was rebuilt instead
+    """
+    facts = DailyFact.objects.filter(date=date, currency_id=currency_id)
+    changes = {field: F(field) + value for field, value in deltas.items()}
+    changes["updated_at"] = timezone.now()
+    with transaction.atomic():
+        decreased_counts = [field for field in DAILY_FACT_COUNT_FIELDS if deltas.get(field, 0) < 0]
+        if decreased_counts:
+            counts = facts.select_for_update().values(*decreased_counts).first()
+            if counts is None or any(counts[field] + deltas[field] < 0 for field in decreased_counts):
+                logger.error(f"Daily fact counts of {date} would go negative, rebuilding the date")
+                rebuild_daily_facts(date, date)
+                return False
+        if not facts.update(**changes):
+            # a concurrent writer may create the row meanwhile, ignoring the conflict leaves it to the update
+            DailyFact.objects.bulk_create([DailyFact(date=date, currency_id=currency_id)], ignore_conflicts=True)
+            facts.update(**changes)
+        if any(value < 0 for value in deltas.values()):
+            # rows left without any record are deleted, like rebuild_daily_facts does
+            facts.filter(**{field: 0 for field in DAILY_FACT_FIELDS}).delete()
+    return True
+
+
+_daily_fact_deltas = threading.local()
+
+
+def record_daily_fact_changes(
+        removed: Iterable[FactContribution | None] = (), added: Iterable[FactContribution | None] = ()
+):
+    """
+    Marks records whose contribution to the daily facts changed. Changes made inside a transaction
+    are applied once, when the transaction commits, with one F() update per touched DailyFact row.
+    :param removed: contributions taken away, of deleted records or of records before a change
+    :param added: contributions added, of new records or of records after a change. None values are ignored
+    """
+    connection = transaction.get_connection()
+    if connection.in_atomic_block:
+        deltas = getattr(_daily_fact_deltas, "deltas", None)
+        if deltas is None or not deltas.is_pending(connection):
+            # deltas of one transaction run one after the other on commit and share the dates they rebuild
+            queued_deltas = next(
+                (
+                    func
+                    for _, func, _ in connection.run_on_commit
+                    if isinstance(func, DailyFactDeltas) and not func.applied
+                ),
+                None,
+            )
+            deltas = DailyFactDeltas(
+                list(connection.savepoint_ids), queued_deltas.rebuilt_dates if queued_deltas else None
+            )
+            _daily_fact_deltas.deltas = deltas
+            transaction.on_commit(deltas)
+    else:
+        deltas = DailyFactDeltas()
+    for contribution in removed:
+        deltas.add(contribution, -1)
+    for contribution in added:
+        deltas.add(contribution)
+    if not connection.in_atomic_block:
+        deltas.apply()
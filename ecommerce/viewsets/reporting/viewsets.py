@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.db.models import Sum
+from rest_framework import viewsets
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from ecommerce.models import DailyFact
+from ecommerce.permissions import IsStaff
+from ecommerce.serializers import DailyFactSerializer
+from ecommerce.viewsets.accounting.totals import (
+    get_date_query_param,
+    totals_in_accounting_currency,
+)
+
+DAILY_FACT_AMOUNT_FIELDS = ["sales", "cogs", "purchases", "incomes", "spendings"]
+
+
+def filter_daily_facts(request):
+    facts = DailyFact.objects.all()
+    start_date = get_date_query_param(request, "start_date")
+    end_date = get_date_query_param(request, "end_date")
+    if start_date:
+        facts = facts.filter(date__gte=start_date)
+    if end_date:
+        facts = facts.filter(date__lte=end_date)
+    return facts
+
+
+class DailyFactViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Daily sales, COGS, purchases, incomes and spendings per currency
+    """
+
+    serializer_class = DailyFactSerializer
+    permission_classes = [IsStaff]
+
+    def get_queryset(self):
+        return filter_daily_facts(self.request).select_related("currency")
+
+
+class ProfitAndLossView(APIView):
+    """
+    Profit and loss between optional start_date and end_date, in the accounting currency, read from the daily facts
+    """
+
+    permission_classes = [IsStaff]
+
+    def get(self, request, *args, **kwargs):
+        facts = filter_daily_facts(request)
+        totals = totals_in_accounting_currency(
+            facts, {field: field for field in DAILY_FACT_AMOUNT_FIELDS}
+        )
+        counts = facts.aggregate(order_count=Sum("order_count"), purchase_count=Sum("purchase_count"))
+        gross_profit = totals["sales"] - totals["cogs"]
+        return Response({
+            **{field: round(total, 2) for field, total in totals.items()},
+            "gross_profit": round(gross_profit, 2),
+            "net_income": round(gross_profit + totals["incomes"] - totals["spendings"], 2),
+            "order_count": counts["order_count"] or 0,
+            "purchase_count": counts["purchase_count"] or 0,
+            "currency": settings.ACCOUNTING_CURRENCY,
+        })
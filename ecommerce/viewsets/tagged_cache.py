@@ -0,0 +1,133 @@
+import hashlib
+import logging
+import time
+from typing import Iterable
+
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+# any product or catalog lookup changed, tags listings of the whole catalog
+CATALOG_TAG = "catalog"
+# products were added or removed, or a category, brand or tag shown with them changed,
+# tags pages of the catalog together with the products they show
+CATALOG_PAGES_TAG = "catalog_pages"
+TAG_VERSION_KEY_PREFIX = "cache_tag_version:"
+TAGGED_ENTRY_KEY_PREFIX = "tagged_cache:"
+
+
+def product_tag(product_id: int) -> str:
+    return f"product:{product_id}"
+
+
+def _tag_version_key(tag: str) -> str:
+    return f"{TAG_VERSION_KEY_PREFIX}{tag}"
+
+
+def get_tag_versions(tags: Iterable[str]) -> dict[str, int]:
+    """
+    Current version of each tag, missing versions are created
+    :param tags:
+    :return: mapping of tag to version
+    """
+    keys = {_tag_version_key(tag): tag for tag in tags}
+    versions = cache.get_many(keys)
+    for key in keys.keys() - versions.keys():
+        # time_ns so that a version evicted from the cache doesn't come back with an old value
+        cache.add(key, time.time_ns(), timeout=None)
+        versions[key] = cache.get(key)
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def invalidate_tags(*tags: str):
+    """
+    Invalidate every entry cached with any of the tags by bumping the tag versions
+    """
+    for tag in tags:
+        key = _tag_version_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+    logger.debug(f"Invalidated cache tags {tags}")
+
+
+def invalidate_tags_on_commit(*tags: str):
+    # after commit, so that a concurrent request can't cache the old rows again under the new versions
+    transaction.on_commit(lambda: invalidate_tags(*tags))
+
+
+def invalidate_products(product_ids: Iterable[int], catalog: bool = False):
+    """
+    Invalidate cached entries showing the products once the current transaction commits
+    :param product_ids:
+    :param catalog: also invalidate every page of the catalog, when products are added or removed
+    """
+    tags = [product_tag(product_id) for product_id in set(product_ids)]
+    if catalog:
+        tags.append(CATALOG_PAGES_TAG)
+    if tags:
+        invalidate_tags_on_commit(CATALOG_TAG, *tags)
+
+
+def invalidate_catalog():
+    """
+    Invalidate every cached entry listing products once the current transaction commits
+    """
+    invalidate_tags_on_commit(CATALOG_TAG, CATALOG_PAGES_TAG)
+
+
+def get_tagged(key: str):
+    """
+    :param key:
+    :return: cached value, None when missing or when one of its tags was invalidated
+    """
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    if get_tag_versions(entry["versions"]) != entry["versions"]:
+        return None
+    return entry["value"]
+
+
+def set_tagged(key: str, value, tags: Iterable[str], timeout: int):
+    cache.set(
+        key, {"versions": get_tag_versions(tags), "value": value}, timeout=timeout
+    )
+
+
+class TaggedCacheListMixin:
+    """
+    Caches the data of list responses per URL, user and vary_headers. Pages are tagged with every
+    product they show, so that a product change only invalidates the pages containing it.
+    Unpaginated listings show the whole catalog and are only tagged with CATALOG_TAG,
+    rather than checking the version of every product on each hit.
+    """
+
+    cache_timeout = 60 * 15
+    # request headers the response data depends on besides the URL and the user
+    vary_headers = ("Accept-Language",)
+
+    def get_cache_key(self, request) -> str:
+        user = request.user
+        parts = [request.build_absolute_uri(), str(user.pk if user.is_authenticated else "")]
+        parts += [request.headers.get(header, "") for header in self.vary_headers]
+        key_hash = hashlib.md5("\n".join(parts).encode()).hexdigest()
+        return f"{TAGGED_ENTRY_KEY_PREFIX}{self.__class__.__name__}:{key_hash}"
+
+    def get_cache_tags(self, data) -> list[str]:
+        if self.paginator is None:
+            return [CATALOG_TAG]
+        return [CATALOG_PAGES_TAG] + [product_tag(item["id"]) for item in data["results"]]
+
+    def list(self, request, *args, **kwargs):
+        key = self.get_cache_key(request)
+        data = get_tagged(key)
+        if data is not None:
+            return Response(data)
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            set_tagged(key, response.data, self.get_cache_tags(response.data), self.cache_timeout)
+        return response
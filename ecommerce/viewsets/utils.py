@@ -1,6 +1,31 @@
+import datetime
+import logging
+import time
+from bisect import bisect_right
 from decimal import Decimal
-from typing import Dict, Tuple
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+from django.utils import timezone
+
 from ecommerce.models import FXRate
+from ecommerce.viewsets.versioned_memo import VersionedMemo, bump_version
+
+logger = logging.getLogger(__name__)
+
+FX_RATE_MATRIX_VERSION_KEY = "fx_rate_matrix_version"
+
+
+def start_of_day(day: datetime.date) -> datetime.datetime:
+    """
+    Filtering a datetime field with start_of_day(start) <= field < start_of_next_day(end)
+    selects the same rows as field__date__range=(start, end), but can use an index on the field
+    """
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def start_of_next_day(day: datetime.date) -> datetime.datetime:
+    return start_of_day(day + datetime.timedelta(days=1))
 
 def convert_amount_from_one_currency_to_another(
     amount: float | Decimal, from_currency_id: int, to_currency_id: int, fx_rates: Dict[Tuple[int, int], float]
@@ -20,16 +45,222 @@ def convert_amount_from_one_currency_to_another(
         raise ValueError(f"No FX rate from {from_currency_id} to {to_currency_id}")
     return amount * rate
 
+class FXRateMatrix:
+    """
+    Active FX rates loaded with a single query.
+    rates is a dense array indexed by currency ids, rates[from_id, to_id], with NaN for missing rates
+    and 1 on the diagonal. decimal_rates keeps the exact Decimal rates for money calculations.
+    """
+
+    def __init__(self, active_rates: Iterable[Tuple[int, int, str, str, Decimal]], version=None):
+        """
+        :param active_rates: tuples of (currency_from_id, currency_to_id, currency_from_code, currency_to_code, rate)
+        :param version: value of the version key this matrix was loaded for
+        """
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.decimal_rates = {}
+        self.currency_codes = {}
+        for from_id, to_id, from_code, to_code, rate in active_rates:
+            self.decimal_rates[(from_id, to_id)] = rate
+            self.currency_codes[from_id] = from_code
+            self.currency_codes[to_id] = to_code
+        self.currency_ids = {code: currency_id for currency_id, code in self.currency_codes.items()}
+
+        size = max(self.currency_codes, default=-1) + 1
+        self.rates = np.full((size, size), np.nan)
+        np.fill_diagonal(self.rates, 1.0)
+        for (from_id, to_id), rate in self.decimal_rates.items():
+            self.rates[from_id, to_id] = float(rate)
+
+    @classmethod
+    def load(cls, version=None) -> "FXRateMatrix":
+        active_rates = FXRate.objects.filter(end_date__isnull=True).values_list(
+            "currency_from_id",
+            "currency_to_id",
+            "currency_from__code",
+            "currency_to__code",
+            "rate",
+        )
+        return cls(active_rates, version)
+
+    def rate(self, from_currency_id: int, to_currency_id: int) -> Decimal | None:
+        if from_currency_id == to_currency_id:
+            return Decimal("1")
+        return self.decimal_rates.get((from_currency_id, to_currency_id))
+
+    def rate_by_code(self, from_currency_code: str, to_currency_code: str) -> Decimal | None:
+        if from_currency_code == to_currency_code:
+            return Decimal("1")
+        return self.rate(
+            self.currency_ids.get(from_currency_code), self.currency_ids.get(to_currency_code)
+        )
+
+    def as_dict(self, by_code: bool = False) -> dict:
+        """
+        Active rates as a mapping of (currency_from, currency_to) to Decimal rate
+        :param by_code: key by currency codes instead of currency ids
+        :return:
+        """
+        if not by_code:
+            return dict(self.decimal_rates)
+        return {
+            (self.currency_codes[from_id], self.currency_codes[to_id]): rate
+            for (from_id, to_id), rate in self.decimal_rates.items()
+        }
+
+    def rates_to(self, from_currency_ids, to_currency_id: int) -> np.ndarray:
+        """
+        :param from_currency_ids: array like of currency ids, negative for unknown currencies
+        :param to_currency_id:
+        :return: array of rates into to_currency_id, NaN where no rate is known
+        """
+        from_currency_ids = np.asarray(from_currency_ids, dtype=np.int64)
+        size = self.rates.shape[0]
+        rates = np.full(from_currency_ids.shape, np.nan)
+        if 0 <= to_currency_id < size:
+            known = (from_currency_ids >= 0) & (from_currency_ids < size)
+            rates[known] = self.rates[from_currency_ids[known], to_currency_id]
+        rates[from_currency_ids == to_currency_id] = 1.0
+        return rates
+
+    def convert(self, amounts, from_currency_ids, to_currency_id: int) -> np.ndarray:
+        """
+        Convert many amounts to one currency at once
+        :param amounts: array like of amounts
+        :param from_currency_ids: array like of currency ids of each amount
+        :param to_currency_id: currency id to convert to
+        :return: array of converted amounts as floats
+        """
+        amounts = np.asarray(amounts, dtype=float)
+        from_currency_ids = np.asarray(from_currency_ids, dtype=np.int64)
+        rates = self.rates_to(from_currency_ids, to_currency_id)
+        missing = np.isnan(rates)
+        if missing.any():
+            raise ValueError(
+                f"No FX rate from {sorted(set(from_currency_ids[missing].tolist()))} to {to_currency_id}"
+            )
+        return amounts * rates
+
+
+_fx_rate_matrix_memo = VersionedMemo(FX_RATE_MATRIX_VERSION_KEY, FXRateMatrix.load, "FX_RATE_MATRIX_MAX_AGE")
+
+
+def bump_fx_rate_matrix_version():
+    """
+    Invalidate memoized FX rate matrices and histories of this process at once, and of other processes
+    sharing the cache on their next version check
+    """
+    bump_version(FX_RATE_MATRIX_VERSION_KEY)
+
+
+def get_fx_rate_matrix() -> FXRateMatrix:
+    """
+    FX rate matrix memoized per process, reloaded when the version key changes or after
+    FX_RATE_MATRIX_MAX_AGE seconds.
+    """
+    return _fx_rate_matrix_memo.get()
+
+
+class FXRateHistory:
+    """
+    All historical FX rates into one currency, indexed per source currency code by start date.
+    A lookup uses the rate that was active on the given date, i.e. the latest rate that started
+    on or before it. Dates before the first known rate of a currency use that first rate.
+    """
+
+    def __init__(
+            self,
+            to_currency_code: str,
+            fx_rates: Iterable[Tuple[str, datetime.date, datetime.date | None, Decimal]],
+            version=None,
+    ):
+        """
+        :param to_currency_code: currency the rates convert into
+        :param fx_rates: tuples of (currency_from_code, start_date, end_date, rate) ordered by start_date
+        :param version: value of the version key this history was loaded for
+        """
+        self.to_currency_code = to_currency_code
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.start_dates = {}
+        self.decimal_rates = {}
+        for from_code, start_date, end_date, rate in fx_rates:
+            if end_date is not None and end_date <= start_date:
+                continue  # replaced on the day it started, never active at the end of any day
+            self.start_dates.setdefault(from_code, []).append(start_date)
+            self.decimal_rates.setdefault(from_code, []).append(rate)
+        self._start_date_arrays = {
+            from_code: np.array(start_dates, dtype="datetime64[D]")
+            for from_code, start_dates in self.start_dates.items()
+        }
+        self._rate_arrays = {
+            from_code: np.array([float(rate) for rate in rates])
+            for from_code, rates in self.decimal_rates.items()
+        }
+
+    @classmethod
+    def load(cls, to_currency_code: str, version=None) -> "FXRateHistory":
+        fx_rates = (
+            FXRate.objects.filter(currency_to__code=to_currency_code)
+            .order_by("start_date", "id")
+            .values_list("currency_from__code", "start_date", "end_date", "rate")
+        )
+        return cls(to_currency_code, fx_rates, version)
+
+    def rate_as_of(self, from_currency_code: str, as_of: datetime.date) -> Decimal | None:
+        if from_currency_code == self.to_currency_code:
+            return Decimal("1")
+        start_dates = self.start_dates.get(from_currency_code)
+        if not start_dates:
+            return None
+        idx = max(bisect_right(start_dates, as_of) - 1, 0)
+        return self.decimal_rates[from_currency_code][idx]
+
+    def convert(self, amounts, from_currency_codes, dates) -> np.ndarray:
+        """
+        Convert many dated amounts at once, with one searchsorted per source currency
+        :param amounts: array like of amounts
+        :param from_currency_codes: array like of currency codes of each amount
+        :param dates: array like of dates the amounts should be converted as of
+        :return: array of converted amounts as floats
+        """
+        amounts = np.asarray(amounts, dtype=float)
+        from_currency_codes = np.asarray(from_currency_codes, dtype=object)
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        rates = np.full(amounts.shape, np.nan)
+        for from_code in set(from_currency_codes.tolist()):
+            mask = from_currency_codes == from_code
+            if from_code == self.to_currency_code:
+                rates[mask] = 1.0
+            elif from_code in self._start_date_arrays:
+                idx = np.searchsorted(self._start_date_arrays[from_code], dates[mask], side="right") - 1
+                rates[mask] = self._rate_arrays[from_code][np.maximum(idx, 0)]
+        missing = np.isnan(rates)
+        if missing.any():
+            raise ValueError(
+                f"No FX rate from {sorted(set(from_currency_codes[missing].tolist()))} to {self.to_currency_code}"
+            )
+        return amounts * rates
+
+
+_fx_rate_history_memo = VersionedMemo(FX_RATE_MATRIX_VERSION_KEY, FXRateHistory.load, "FX_RATE_MATRIX_MAX_AGE")
+
+
+def get_fx_rate_history(to_currency_code: str) -> FXRateHistory:
+    """
+    FX rate history into to_currency_code, memoized per process like the FX rate matrix
+    """
+    return _fx_rate_history_memo.get(to_currency_code)
+
+
 def get_fx_rates():
-    return {
-        (fx.currency_from.id, fx.currency_to.id): fx.rate
-        for fx in FXRate.objects.filter(end_date__isnull=True)
-    }
+    return get_fx_rate_matrix().as_dict()
 
 def get_fx_rates_with_currency_codes():
     return {
-        (fx.currency_from.code, fx.currency_to.code): float(fx.rate)
-        for fx in FXRate.objects.filter(end_date__isnull=True)
+        currency_pair: float(rate)
+        for currency_pair, rate in get_fx_rate_matrix().as_dict(by_code=True).items()
     }
 
 def convert_amount_from_one_currency_code_to_another(amount: float | Decimal, from_currency_code: str, to_currency_code: str, fx_rates: Dict[Tuple[str, str], float]
@@ -47,4 +278,23 @@ def convert_amount_from_one_currency_code_to_another(amount: float | Decimal, fr
     rate = fx_rates.get((from_currency_code, to_currency_code))
     if not rate:
         raise ValueError(f"No FX rate from {from_currency_code} to {to_currency_code}")
-    return amount * rate
\ No newline at end of file
+    return amount * rate
+
+
+def convert_amount_from_one_currency_code_to_another_as_of(
+        amount: float | Decimal, from_currency_code: str, to_currency_code: str, as_of: datetime.date
+):
+    """
+    Convert amount from one currency to another with the FX rate that was active on as_of date
+    :param amount: amount in from_currency_code, that needs converting to to_currency_code
+    :param from_currency_code:
+    :param to_currency_code:
+    :param as_of: date of the amount
+    :return: converted amount in to_currency
+    """
+    if from_currency_code == to_currency_code:
+        return amount
+    rate = get_fx_rate_history(to_currency_code).rate_as_of(from_currency_code, as_of)
+    if not rate:
+        raise ValueError(f"No FX rate from {from_currency_code} to {to_currency_code} as of {as_of}")
+    return amount * rate
@@ -0,0 +1,86 @@
+import logging
+import threading
+import time
+from typing import Callable
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# version key -> (version, time.monotonic() it was read from the cache)
+_versions: dict[str, tuple[int, float]] = {}
+
+
+def get_version(key: str) -> int:
+    """
+    Value of a version key, read from the default cache at most every MEMO_VERSION_CHECK_INTERVAL seconds
+    """
+    version, checked_at = _versions.get(key, (None, 0.0))
+    now = time.monotonic()
+    if version is None or now - checked_at > getattr(settings, "MEMO_VERSION_CHECK_INTERVAL", 5):
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, time.time_ns(), timeout=None)
+            version = cache.get(key)
+        _versions[key] = (version, now)
+    return version
+
+
+def bump_version(key: str):
+    """
+    Invalidate values memoized for a version key. This process sees the new version at once,
+    other processes sharing the cache on their next version check.
+    """
+    try:
+        version = cache.incr(key)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(key, version, timeout=None)
+    _versions[key] = (version, time.monotonic())
+    logger.debug(f"Bumped {key} to {version}")
+
+
+class VersionedMemo:
+    """
+    Values memoized per process and loaded again when their version key is bumped or they get older
+    than the max age setting. The max age bounds how stale a process gets when it doesn't share the
+    cache with the process that bumped the version, e.g. with the default per-process memory cache.
+    """
+
+    def __init__(self, key: str, loader: Callable, max_age_setting: str, default_max_age: int = 300):
+        """
+        :param key: version key in the default cache
+        :param loader: called with the get() arguments and the version, returns the value to memoize
+        :param max_age_setting: name of the setting with the seconds a value is kept at most
+        :param default_max_age: seconds a value is kept at most when the setting is missing
+        """
+        self.key = key
+        self.loader = loader
+        self.max_age_setting = max_age_setting
+        self.default_max_age = default_max_age
+        # get() arguments -> (value, version, time.monotonic() it was loaded)
+        self.entries: dict[tuple, tuple] = {}
+        self.lock = threading.Lock()
+
+    def _is_stale(self, entry, version) -> bool:
+        max_age = getattr(settings, self.max_age_setting, self.default_max_age)
+        return entry is None or entry[1] != version or time.monotonic() - entry[2] > max_age
+
+    def get(self, *args, reload: bool = False):
+        """
+        :param args: arguments of the loader, each combination is memoized on its own
+        :param reload: load the value even if the memoized one is current
+        """
+        version = get_version(self.key)
+        entry = self.entries.get(args)
+        if reload or self._is_stale(entry, version):
+            with self.lock:
+                entry = self.entries.get(args)
+                if reload or self._is_stale(entry, version):
+                    entry = (self.loader(*args, version), version, time.monotonic())
+                    self.entries[args] = entry
+        return entry[0]
+
+    def bump(self):
+        bump_version(self.key)
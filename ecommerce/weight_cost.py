@@ -12,6 +12,7 @@ from ecommerce.models.audit_mixin import AuditMixin
 from ecommerce.models.product.models import Currency
 from ecommerce.permissions import IsStaff
 from ecommerce.serializers.product.serializers import CurrencySerializer
+from ecommerce.viewsets.active_records import swap_active_record
 
 logger = logging.getLogger(__name__)
 
@@ -28,12 +29,20 @@ class WeightCost(AuditMixin):
     class Meta:
         ordering = ["-start_date"]
         constraints = [
+            # a constant expression, so that at most one record is active at a time
             models.UniqueConstraint(
-                fields=["cost_per_kg"],
+                models.Value(True),
                 condition=models.Q(end_date__isnull=True),
                 name="only_one_active_weight_cost_global",
             )
         ]
+        indexes = [
+            models.Index(
+                fields=["-start_date"],
+                condition=models.Q(end_date__isnull=True),
+                name="weight_cost_active_idx",
+            )
+        ]
 
 
 class WeightCostSerializer(serializers.ModelSerializer):
@@ -73,14 +82,10 @@ class ActiveWeightCostView(APIView):
 
 
 def create_update_weight_cost(cost_per_kg: float, currency_id: int):
-    active_record = get_active_weight_cost()
-    if active_record:
-        active_record.end_date = timezone.now().date()
-        active_record.save()
     weight_cost_currency = Currency.objects.get(id=currency_id)
-    new_record = WeightCost.objects.create(cost_per_kg=cost_per_kg,
-                                           currency=weight_cost_currency,
-                                           start_date=timezone.now().date())
+    new_record, _ = swap_active_record(
+        WeightCost, {}, {"cost_per_kg": cost_per_kg, "currency": weight_cost_currency}
+    )
     return new_record
 
 